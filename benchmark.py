@@ -0,0 +1,198 @@
+from src.Simulation.Simulator import simulator, available_engines
+from src.Simulation.Visualizer import Visualizer
+from src.Simulation.mesh import Mesh
+from src.Simulation.meshgen import unit_square, square_for_cells, write_mesh
+from main import SimulationConfig, write_state
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import multiprocessing
+import numpy as np
+import platform
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import sys
+
+try:
+    import resource
+except ImportError:  # not on Windows, the peak memory is left out there
+    resource = None
+
+PHASES = ('mesh_read', 'compute_neighbors', 'mesh_compiled', 'step', 'write_state', 'create_plot', 'create_animation')
+
+
+def _timed(function, *args, repeat=1):
+    """
+    Runs function(*args) repeat times.
+    Returns:
+        tuple: (seconds of the fastest run, result of the last run)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _peak_memory_mb():
+    """
+    Peak resident memory of this process in MB, None where it is not known.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes on macOS, kB elsewhere
+
+
+def benchmark_mesh(mshname, n_steps, engine, plot_max_cells, frames, repeat=3):
+    """
+    Times every phase of a run on one mesh. Meant to run in its own process, so the peak memory is that of this mesh.
+    Args:
+        mshname (str): Mesh file, in a folder of its own since the compiled mesh is written next to it.
+        n_steps (int): Number of steps timed.
+        engine (str): Engine the simulator steps with.
+        plot_max_cells (int): Larger meshes are not plotted, the plot takes a long time per triangle.
+        frames (int): Number of frames of the animation.
+        repeat (int): Loading, neighbors and writing are timed this many times and the fastest is kept.
+            The plot and the animation are slow enough to time once.
+    Returns:
+        dict: Number of cells, seconds of every phase (step is per step, None for phases that did not run),
+            cell steps per second and peak memory in MB.
+    """
+    phases = dict.fromkeys(PHASES)
+    phases['mesh_read'], mesh = _timed(Mesh, mshname, None, False, repeat=repeat)
+
+    def compute_neighbors():
+        mesh._neighbors = None  # computed again every time, 'compute_neighbors' skips a mesh that has them
+        mesh.compute_neighbors()
+    phases['compute_neighbors'], _ = _timed(compute_neighbors, repeat=repeat)
+    n_cells = len(mesh)
+    del mesh
+
+    Mesh(mshname)  # writes the compiled mesh
+    phases['mesh_compiled'], _ = _timed(Mesh, mshname, repeat=repeat)
+
+    outputdir = Path(mshname).parent
+    config = SimulationConfig(nSteps=n_steps, tStart=0.0, tEnd=n_steps * 0.001, meshName=mshname,
+                              borders=[[0.0, 0.45], [0.0, 0.2]], logName='benchmark', engine=engine)
+    sim = simulator(config)
+    try:
+        sim.step()  # builds the engine, and compiles numba
+        seconds, _ = _timed(sim.advance, n_steps)
+        phases['step'] = seconds / n_steps
+        phases['write_state'], _ = _timed(lambda: write_state(outputdir / 'state.txt', sim.get_state()), repeat=repeat)
+
+        if n_cells <= plot_max_cells:
+            vis = Visualizer(sim.mesh, config, outputdir)
+            phases['create_plot'], _ = _timed(vis.create_plot, sim.get_state(), sim.current_time, outputdir / 'plot.png')
+            images = [outputdir / f"plot_{i}.png" for i in range(frames)]
+            for image in images:
+                shutil.copy(outputdir / 'plot.png', image)
+            phases['create_animation'], _ = _timed(vis.create_animation, images, frames)
+    finally:
+        sim.close()
+
+    return {'cells': n_cells, 'phases': phases, 'cell_steps_per_s': n_cells / phases['step'],
+            'peak_memory_mb': _peak_memory_mb()}
+
+
+def run_benchmarks(sizes, n_steps=10, engine='numpy', plot_max_cells=20000, frames=5, repeat=3):
+    """
+    Benchmarks unit square meshes of the given sizes, see 'meshgen.unit_square'.
+    Every mesh is run in a new process.
+    Args:
+        sizes (list): Smallest number of cells of every mesh.
+        n_steps, engine, plot_max_cells, frames, repeat: See 'benchmark_mesh'.
+    Returns:
+        dict: 'meta' with the machine and settings, and 'results' with the result of every mesh.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            mesh_folder = Path(folder) / str(size)
+            mesh_folder.mkdir()
+            mshname = str(mesh_folder / "square.msh")
+            write_mesh(mshname, *unit_square(square_for_cells(size)))
+            # spawn, so every mesh starts from a fresh process and its own peak memory
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results.append(pool.submit(benchmark_mesh, mshname, n_steps, engine, plot_max_cells, frames, repeat).result())
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+            'processor': platform.processor(), 'engine': engine, 'steps': n_steps, 'repeat': repeat,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def compare(report, baseline, threshold=0.2):
+    """
+    Compares the phase times of a report with a baseline, for the meshes with the same number of cells.
+    Args:
+        report (dict): Result of 'run_benchmarks'.
+        baseline (dict): An earlier result of 'run_benchmarks'.
+        threshold (float): A phase that takes more than 1 + threshold times as long is a regression.
+    Returns:
+        list: (cells, phase, baseline seconds, seconds) of every regression.
+    """
+    old = {result['cells']: result['phases'] for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        for phase, seconds in result['phases'].items():
+            before = old.get(result['cells'], {}).get(phase)
+            if seconds is not None and before and seconds > (1 + threshold) * before:
+                regressions.append((result['cells'], phase, before, seconds))
+    return regressions
+
+
+def print_report(report):
+    header = f"{'cells':>10} " + ' '.join(f"{phase:>17}" for phase in PHASES) + f" {'cell steps/s':>14} {'peak MB':>9}"
+    print(header)
+    for result in report['results']:
+        times = ' '.join(f"{'-' if s is None else f'{s:.3e}':>17}" for s in result['phases'].values())
+        peak = result['peak_memory_mb']
+        print(f"{result['cells']:>10} {times} {result['cell_steps_per_s']:>14.3e} {'-' if peak is None else f'{peak:.0f}':>9}")
+
+
+def parse_input(argv=None):
+    parser = argparse.ArgumentParser("Benchmark the simulation on unit square meshes")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 100_000], help="Number of cells of every mesh")
+    parser.add_argument("--steps", type=int, default=10, help="Number of steps timed")
+    parser.add_argument("--engine", choices=available_engines(), default='numpy', help="Engine to step with")
+    parser.add_argument("--plot-max-cells", type=int, default=20000, help="Larger meshes are not plotted")
+    parser.add_argument("--frames", type=int, default=5, help="Number of frames of the animation")
+    parser.add_argument("--repeat", type=int, default=3, help="Keep the fastest of this many runs of the quick phases")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Flag phases that got slower than the baseline by more than this fraction")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks, writes them as JSON and compares them with the baseline if one is given.
+    Returns:
+        int: 1 if there are regressions, else 0.
+    """
+    args = parse_input(argv)
+    report = run_benchmarks(args.sizes, args.steps, args.engine, args.plot_max_cells, args.frames, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Results written to {args.output}")
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(report, json.load(f), args.threshold)
+    for cells, phase, before, seconds in regressions:
+        print(f"Regression: {phase} on {cells} cells took {seconds:.4f} s, {seconds / before:.2f} times the baseline {before:.4f} s")
+    if not regressions:
+        print(f"No phase is more than {args.threshold:.0%} slower than {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,21 @@
-from src.Simulation.Simulator import simulator
-from src.Simulation.Visualizer import Visualizer
+from src.Simulation.Simulator import simulator, available_engines
+from src.Simulation.Visualizer import Visualizer, VideoStream, RenderPool, RENDERERS
+from src.Simulation.ensemble import Ensemble, EnsembleMember, write_fishing_grounds
+from src.Simulation.adjoint import exposure_maps
+from src.Simulation.greens import load_or_build
+from src.Simulation.topology import CELL_ORDERINGS
+from src.Simulation.metrics import Metrics
+from src.Simulation.profiling import PhaseProfiler, PROFILE_PHASES
 from pathlib import Path
 import tomllib
 import logging
+import traceback
 import argparse
+import numpy as np
 import os
 
 class SimulationConfig:
-    def __init__(self, nSteps, tStart, tEnd, meshName, borders, logName, writeFrequency = None, restartFile = None, base_dir = None):
+    def __init__(self, nSteps, tStart, tEnd, meshName, borders, logName, writeFrequency = None, restartFile = None, base_dir = None, engine = "numpy", ensemble = None, library = None, workers = None, ordering = None, savePlots = True, streamVideo = False, renderer = "matplotlib", resolution = (640, 480), renderWorkers = 0):
         self.nSteps = nSteps
         self.tStart = tStart
         self.tEnd = tEnd
@@ -19,11 +27,31 @@ class SimulationConfig:
         self.borders = borders
         self.logName = logName
         self.writeFrequency = writeFrequency
+        self.savePlots = savePlots
+        self.streamVideo = streamVideo
+        self.renderer = renderer
+        self.resolution = resolution
+        self.renderWorkers = renderWorkers
         # Resolve restartFile path if provided
         if restartFile and base_dir and not Path(restartFile).is_absolute():
             self.restartFile = str(Path(base_dir) / restartFile)
         else:
             self.restartFile = restartFile
+        self.engine = engine
+        self.workers = workers
+        self.ordering = ordering
+        # Resolve the restart files of the ensemble members like restartFile
+        if ensemble is not None:
+            ensemble = dict(ensemble)
+            ensemble['restartFiles'] = [
+                str(Path(base_dir) / f) if base_dir and not Path(f).is_absolute() else f
+                for f in ensemble['restartFiles']]
+        self.ensemble = ensemble
+        if library is not None:
+            library = dict(library)
+            if base_dir and not Path(library['path']).is_absolute():
+                library['path'] = str(Path(base_dir) / library['path'])
+        self.library = library
 
 
 def read_config(filename):
@@ -68,9 +96,54 @@ def read_config(filename):
     if 'borders' not in geometry:
         raise ValueError("Missing: borders")
 
-    if 'tStart' in settings and 'restartFile' not in io:
+    ensemble = config_dict.get('ensemble')
+    if ensemble is not None:
+        ensemble = {
+            'sources': ensemble.get('sources', []),
+            'restartFiles': ensemble.get('restartFiles', []),
+            'memoryBudgetMB': ensemble.get('memoryBudgetMB', 1024)}
+        if not ensemble['sources'] and not ensemble['restartFiles']:
+            raise ValueError("Missing: sources or restartFiles in ensemble")
+        if any(len(source) != 2 for source in ensemble['sources']):
+            raise ValueError("Every ensemble source must be a point [x, y]")
+
+    library = config_dict.get('library')
+    if library is not None:
+        if 'path' not in library:
+            raise ValueError("Missing: path in library")
+        library = {
+            'path': library['path'],
+            'sources': library.get('sources'),  # None means every cell
+            'stateStride': library.get('stateStride', 0),
+            'memoryBudgetMB': library.get('memoryBudgetMB', 1024)}
+
+    if 'tStart' in settings and 'restartFile' not in io and not (ensemble and ensemble['restartFiles']):
         raise ValueError("Må ha restartFile om tStart er gitt")
 
+    engine = settings.get('engine', 'numpy')
+    if engine not in available_engines():
+        raise ValueError(f"Unknown engine: {engine}, choose one of {available_engines()}")
+    if ensemble is not None and engine == 'reference':
+        raise ValueError("Ensembles need an array engine, not 'reference'")
+    ordering = geometry.get('ordering')
+    if ordering is not None and ordering not in CELL_ORDERINGS:
+        raise ValueError(f"Unknown ordering: {ordering}, choose one of {list(CELL_ORDERINGS)}")
+    workers = settings.get('workers')
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        raise ValueError(f"workers must be a positive integer, got {workers}")
+    for option in ('savePlots', 'streamVideo'):
+        if not isinstance(io.get(option, False), bool):
+            raise ValueError(f"{option} must be true or false, got {io[option]}")
+    renderer = io.get('renderer', 'matplotlib')
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}, choose one of {list(RENDERERS)}")
+    resolution = io.get('resolution', [640, 480])
+    if len(resolution) != 2 or not all(isinstance(n, int) and n > 0 for n in resolution):
+        raise ValueError(f"resolution must be [width, height] in pixels, got {resolution}")
+    render_workers = io.get('renderWorkers', 0)
+    if not isinstance(render_workers, int) or render_workers < 0:
+        raise ValueError(f"renderWorkers must be 0 or a positive integer, got {render_workers}")
+
     return SimulationConfig(
         nSteps=settings['nSteps'],
         tStart=settings.get('tStart', 0.0),  # Optional with default 0.0
@@ -79,9 +152,18 @@ def read_config(filename):
         borders=geometry['borders'],
         logName=io.get('logName', 'logfile'),  # Optional with default'logfile'
         writeFrequency=io.get('writeFrequency', 0),  # Optional
+        savePlots=io.get('savePlots', True),  # Optional, False writes no images, only the video
+        streamVideo=io.get('streamVideo', False),  # Optional, True adds the plots to the video while running
+        renderer=renderer,  # Optional with default 'matplotlib'
+        resolution=tuple(resolution),  # Optional, size of the 'raster' frames
+        renderWorkers=render_workers,  # Optional, processes that plot while stepping, default 0 plots in the time loop
         restartFile=io.get('restartFile', None),  # Optional
-        base_dir=config_dir  # Pass the config file's directory as base for relative paths
-
+        base_dir=config_dir,  # Pass the config file's directory as base for relative paths
+        engine=engine,  # Optional with default 'numpy'
+        ensemble=ensemble,  # Optional, runs many initial conditions at once
+        library=library,  # Optional, response library for --library
+        workers=workers,  # Optional, worker processes of the parallel engine, default one per core
+        ordering=ordering  # Optional, order of the cells in memory, default the order of the mesh file
     )
 
 
@@ -123,6 +205,11 @@ def parse_input():
     - `-c` or `--config_file`: Path to the config file (default "input.toml").
     - `--find_all`: Find and run all config files in the main folder.
     - `-f` or `--folder`: Specify the folder to search for config files (requires `--find_all`).
+    - `--adjoint`: Map the fishing ground oil for a release in every cell instead of simulating.
+    - `--library`: Build the response library in the config's [library] section, if it is out of date.
+    - `--mpi`: Run the simulation spread over MPI ranks, start it with `mpirun -n 4 python main.py --mpi`.
+    - `--engine`: Step with this engine instead of the one in the config.
+    - `--profile`: Profile a phase of the run, the whole run if no phase is given.
     Returns:
         argparse.Namespace: Parsed command-line arguments.
     Raises:
@@ -138,105 +225,427 @@ def parse_input():
     group.add_argument("-c", "--config_file", default=default_config, help="Path to config file")
     parser.add_argument("--find_all", action="store_true", help="Find and run all config files in main folder")
     parser.add_argument("-f", "--folder", help="Specify folder to search for config files")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--adjoint", dest="mode", action="store_const", const="adjoint", default="simulate",
+                      help="Map the fishing ground oil for a release in every cell instead")
+    mode.add_argument("--library", dest="mode", action="store_const", const="library",
+                      help="Build the response library in the config's [library] section")
+    mode.add_argument("--mpi", dest="mode", action="store_const", const="mpi",
+                      help="Run the simulation spread over MPI ranks, start it with mpirun")
+    parser.add_argument("--engine", choices=available_engines(), help="Step with this engine instead of the one in the config")
+    parser.add_argument("--profile", nargs='?', const='run', choices=PROFILE_PHASES,
+                        help="Profile this phase of the run with cProfile and a sampling profiler, the whole run if no phase is given")
 
     args = parser.parse_args()
     if args.folder and not args.find_all:
         parser.error("-f requires --find_all")
+    if args.profile and args.mode == "mpi":
+        parser.error("--profile can not be used with --mpi")
 
     return args
 
 
-def run_simulation(config_file):
+def is_write_time(time, dt, writeFrequency):
+    """
+    Checks if the state at a given time should be written.
+    Args:
+        time (float): Simulation time.
+        dt (float): Time step.
+        writeFrequency (int): Write every writeFrequency steps, 0 never writes.
+    Returns:
+        bool: True if the state should be written.
+    """
+    if writeFrequency == 0:
+        return False
+    return round(int(time / dt)) % writeFrequency == 0
+
+
+def steps_to_next_write(sim, config):
+    """
+    Counts the steps from the current time to the next time that is written,
+    or to the last time before tEnd if that comes first.
+    The time is added up step by step, the same way the simulator does it.
+    Args:
+        sim (simulator): The running simulation.
+        config (SimulationConfig): The configuration of the run.
+    Returns:
+        int: Number of steps, 0 if the current time is the last one before tEnd.
+    """
+    n_steps = 0
+    time = sim.current_time + sim.dt
+    while time <= config.tEnd:
+        n_steps += 1
+        if is_write_time(time, sim.dt, config.writeFrequency):
+            break
+        time += sim.dt
+    return n_steps
+
+
+def write_state(state_path, oil_distribution):
+    """
+    Writes a state file with one 'cell_idx oil_amount' line per cell.
+    Args:
+        state_path (Path): File to write.
+        oil_distribution (dict): Oil amount for every cell id.
+    """
+    with open(state_path, 'w') as f:
+        for cell_idx, oil_amount in oil_distribution.items():
+            f.write(f"{cell_idx} {oil_amount}\n")
+
+
+def timed_write(metrics, phase, path, write, *args):
+    """
+    Calls write(*args), which writes the file path, and adds its time and size to the metrics.
+    Args:
+        metrics (Metrics): Metrics of the run.
+        phase (str): Timer to add the time to, like 'write_state' or 'create_plot'.
+        path (Path): The file that is written.
+        write (function): Function that writes it.
+    """
+    with metrics.phase(phase):
+        write(*args)
+    metrics.count('files_written')
+    metrics.count('bytes_written', Path(path).stat().st_size)
+
+
+def save_frame(sim, vis, video, oil, plot_path, pool=None):
+    """
+    Plots the oil distribution at the current time, writes the image and adds it to the video.
+    Args:
+        sim (simulator): The running simulation.
+        vis (Visualizer): Visualizer for the plot.
+        video (VideoStream): Video the plot is added to, None if the video is made from the images at the end.
+        oil (array): Oil amount of every cell, in the order of the mesh triangles like sim.oil.
+        plot_path (Path): Image file to write, None to not write one.
+        pool (RenderPool): Pool that plots the frame instead, with the video, while the simulation goes on.
+    """
+    if pool is not None:
+        with sim.metrics.phase('render_wait'):  # only waits when the pool is behind
+            pool.submit(oil, sim.current_time, plot_path)
+        return
+    with sim.metrics.phase('create_plot'):
+        if plot_path is None:
+            frame = vis.render(oil, sim.current_time)
+        else:
+            frame = vis.create_plot(oil, sim.current_time, plot_path)
+    if plot_path is not None:
+        sim.metrics.count('files_written')
+        sim.metrics.count('bytes_written', plot_path.stat().st_size)
+    if video is not None:
+        with sim.metrics.phase('create_animation'):
+            video.write(frame)
+
+
+def finish_metrics(sim, outputdir):
+    """
+    Logs the metrics of the run and writes them to metrics.json in the output directory.
+    The profile of the run is written there too if it was profiled, see '--profile'.
+    """
+    profiler = sim.metrics.profiler
+    if profiler is not None:
+        if profiler.enabled:  # the 'run' phase is profiled up to here
+            profiler.disable()
+        if profiler.phase != 'run' and profiler.phase not in sim.metrics.calls:
+            logging.warning(f"The run never was in the {profiler.phase} phase, its profile is empty")
+        for path in profiler.write(outputdir):
+            logging.info(f"Profile of the {profiler.phase} phase written to {path}")
+    sim.metrics.log()
+    sim.metrics.write(outputdir / 'metrics.json')
+
+
+def run_adjoint(sim, config, outputdir, vis):
+    """
+    Runs the adjoint of the simulation. Instead of following one spill, it maps how much
+    oil ends up in the fishing grounds for a unit release in every cell at tStart.
+    The maps are written as adjoint_{time}.txt state files and plots at the write times and at the end,
+    the plots only if config.savePlots is set.
+    Args:
+        sim (simulator): Simulator giving the mesh, dt and engine.
+        config (SimulationConfig): The configuration of the run.
+        outputdir (Path): Output directory.
+        vis (Visualizer): Visualizer for the plots.
+    """
+    last = len(sim.get_times()) - 1
+    outside = sim.get_fishing_weights() == 0
+    cell_ids = sim.mesh.get_cell_ids()
+    for i, (time, exposure) in enumerate(exposure_maps(sim)):
+        if not (is_write_time(time, sim.dt, config.writeFrequency) or i == last):
+            continue
+        exposure_map = dict(zip(cell_ids.tolist(), exposure.tolist()))
+        state_path = outputdir / 'states' / f"adjoint_{time:.3f}.txt"
+        timed_write(sim.metrics, 'write_state', state_path, write_state, state_path, exposure_map)
+        if config.savePlots:
+            plot_path = outputdir / 'img' / f"adjoint_{time:.3f}.png"
+            timed_write(sim.metrics, 'create_plot', plot_path, vis.create_plot, exposure, time, plot_path,
+                        'Fishing ground exposure', 'Fraction of released oil in fishing grounds')
+
+        if outside.any():  # cells inside the fishing grounds start at 1
+            worst = int(np.flatnonzero(outside)[np.argmax(exposure[outside])])
+            logging.info(f"At Time: {time:.3f}/{config.tEnd:.3f}: Highest exposure from outside the fishing grounds: {exposure[worst]:.3e} for a release in cell {cell_ids[worst]}")
+
+
+def run_ensemble(sim, config, outputdir):
+    """
+    Runs all members of the ensemble in the config, and writes their oil in
+    the fishing grounds over time to fishing_grounds.csv in the output directory.
+    Args:
+        sim (simulator): Simulator giving the mesh, dt and engine.
+        config (SimulationConfig): Configuration with an ensemble section.
+        outputdir (Path): Output directory.
+    """
+    members = ([EnsembleMember(source=source) for source in config.ensemble['sources']] +
+               [EnsembleMember(restartFile=f) for f in config.ensemble['restartFiles']])
+    ensemble = Ensemble(sim, members, config.ensemble['memoryBudgetMB'])
+    logging.info(f"Running {len(members)} ensemble members, {ensemble.chunk_size()} at a time")
+
+    times, fishing_grounds = ensemble.run()
+    write_fishing_grounds(outputdir / 'fishing_grounds.csv', times, fishing_grounds, members)
+    for member, oil in zip(members, fishing_grounds[-1]):
+        logging.info(f"{member.name}: At Time: {times[-1]:.3f}/{config.tEnd:.3f}: Oil in fishing grounds: {oil:.3e}")
+
+
+def run_library(sim, config):
+    """
+    Loads the response library of the config, and builds it again if it is missing
+    or was made for another mesh, velocity field or time step.
+    Args:
+        sim (simulator): Simulator the library is for.
+        config (SimulationConfig): Configuration with a library section.
+    """
+    library, built = load_or_build(config.library['path'], sim, config.library['sources'],
+                                   config.library['stateStride'], config.library['memoryBudgetMB'])
+    status = "Built" if built else "Up to date:"
+    logging.info(f"{status} library {config.library['path']} with {len(library.sources)} sources and {len(library.fishing)} times")
+
+
+def setup_logging(config, outputdir):
+    """
+    Logs to {logName}.log in the output directory, and writes the configuration to it.
+    Args:
+        config (SimulationConfig): The configuration of the run.
+        outputdir (Path): Output directory.
+    """
+    logging.root.handlers.clear() # CLEAR HANDLER FOR NEW LOGGING FILE FOR NEXT CONFIG
+    logger = logging.getLogger()
+    handler = logging.FileHandler(outputdir / f"{config.logName}.log", mode='w')
+    formatter = logging.Formatter('%(asctime)s- %(levelname)s - %(message)s', datefmt="%H:%M:%S")
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    string = "Configuration settings:"
+    for key, value in config.__dict__.items():
+        if value is not None:
+            string += (f"\n\t{key}: {value}")
+    logging.info(string)
+
+
+def run_distributed(config):
+    """
+    Runs the simulation spread over the MPI ranks, with the same time loop as 'run_simulation'.
+    Every rank writes the oil of its own cells to state_{time}.rank{rank}.txt, together the
+    files of a time hold every cell once. There are no images, they would need every cell on one rank.
+    Only rank 0 logs, the fishing grounds are summed over all ranks. If a rank fails, it
+    prints the error and aborts every rank, like the setup in 'DistributedSimulator'.
+    Args:
+        config (SimulationConfig): The configuration of the run.
+    Raises:
+        ValueError: If the config has an ensemble.
+    """
+    if config.ensemble is not None:
+        raise ValueError("Ensembles can not run with --mpi")
+
+    # Imported here, importing mpi4py starts MPI, which other runs and their worker processes do not need
+    from src.Simulation.distributed import DistributedSimulator
+    sim = DistributedSimulator(config)
+    try:  # a rank that stops alone would leave the others waiting for it forever
+        if sim.rank == 0:
+            print(f"Creating output directory for {config.logName}...")
+            outputdir = create_output_dir(config.logName)
+            setup_logging(config, outputdir)
+        outputdir = sim.comm.bcast(outputdir if sim.rank == 0 else None, root=0)
+
+        while sim.current_time <= config.tEnd:
+            if is_write_time(sim.current_time, sim.dt, config.writeFrequency):
+                state_path = outputdir / 'states' / f"state_{sim.current_time:.3f}.rank{sim.rank}.txt"
+                write_state(state_path, sim.get_state())
+                oil_in_fishing_grounds = sim.get_oil_in_fishing_grounds()  # every rank takes part in the sum
+                if sim.rank == 0:
+                    logging.info(f"At Time: {sim.current_time:.3f}/{config.tEnd:.3f}: Oil in fishing grounds: {oil_in_fishing_grounds:.3e}")
+
+            n_steps = steps_to_next_write(sim, config)
+            if n_steps == 0:
+                oil_distribution = sim.get_state()
+            sim.advance(max(n_steps, 1))
+
+        # SAVE FINAL STEP:
+        state_path = outputdir / 'states' / f"state_{sim.current_time:.3f}.rank{sim.rank}.txt"
+        write_state(state_path, oil_distribution)
+        oil_in_fishing_grounds = sim.get_oil_in_fishing_grounds()
+        if sim.rank == 0:
+            logging.info(f"At Time: {sim.current_time:.3f}/{config.tEnd:.3f}: Oil in fishing grounds: {oil_in_fishing_grounds:.3e}")
+
+        timings = sim.gather_timings()
+        if sim.rank == 0:
+            for rank, (cells, halo, stepping, waiting) in enumerate(timings):
+                logging.info(f"Rank {rank}: {cells} cells, {halo} halo cells, stepping {stepping:.3f} s, waiting {waiting:.3f} s")
+    except Exception:
+        if sim.comm.Get_size() == 1:
+            raise
+        traceback.print_exc()
+        sim.comm.Abort(1)
+
+
+def run_simulation(config_file, mode="simulate", engine=None, profile=None):
     """
     Runs the oil spill simulation based on the provided configuration file.
     Args:
         config_file (str): Path to the configuration file.
+        mode (str): "simulate", "adjoint" to run 'run_adjoint', "library" to run 'run_library'
+            or "mpi" to run 'run_distributed'.
+        engine (str): Engine to step with, overrides the config if given.
+        profile (str): Phase to profile, one of 'profiling.PROFILE_PHASES', None to not profile.
     Raises:
         Exception: If any error occurs during the simulation.
     """
+    sim = None
+    pool = None
+    video = None
+    metrics = Metrics()
     try:
+        if profile is not None:
+            metrics.profiler = PhaseProfiler(profile)
+            if profile == 'run':
+                metrics.profiler.enable()
         config = read_config(config_file)
+        if engine is not None:
+            config.engine = engine
+        if profile == 'create_plot' and config.renderWorkers > 0 and mode == "simulate":
+            raise ValueError("--profile create_plot can not be used with renderWorkers, the plots are made "
+                             "in the worker processes, profile render_wait instead")
+        if mode == "mpi":
+            run_distributed(config)
+            return
         print(f"Creating output directory for {config.logName}...")
         outputdir = create_output_dir(config.logName)
 
-        sim = simulator(config)
-        vis = Visualizer(sim.mesh.get_triangles(), config, outputdir)
-
-        logging.root.handlers.clear() # CLEAR HANDLER FOR NEW LOGGING FILE FOR NEXT CONFIG
-        logger = logging.getLogger()
-        handler = logging.FileHandler(outputdir / f"{config.logName}.log", mode='w')
-        formatter = logging.Formatter('%(asctime)s- %(levelname)s - %(message)s', datefmt="%H:%M:%S")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
-
-        string = "Configuration settings:"
-        for key, value in config.__dict__.items():
-            if value is not None:
-                string += (f"\n\t{key}: {value}")
-        logging.info(string)
-
+        sim = simulator(config, metrics)
+        with sim.metrics.phase('visualizer_setup'):
+            vis = Visualizer(sim.mesh, config, outputdir)
+
+        setup_logging(config, outputdir)
+
+        if mode == "adjoint":
+            run_adjoint(sim, config, outputdir, vis)
+            finish_metrics(sim, outputdir)
+            return
+        if mode == "library":
+            if config.library is None:
+                raise ValueError("Missing: library section")
+            with sim.metrics.phase('library'):
+                run_library(sim, config)
+            finish_metrics(sim, outputdir)
+            return
+        if config.ensemble is not None:
+            with sim.metrics.phase('ensemble'):
+                run_ensemble(sim, config, outputdir)
+            finish_metrics(sim, outputdir)
+            return
+
+        # Without images to read back the video is always made while running
+        if config.writeFrequency != 0 and (config.streamVideo or not config.savePlots):
+            video = VideoStream(outputdir / 'output.avi', config.writeFrequency)
+        if config.renderWorkers > 0:
+            pool = RenderPool(vis, config.renderWorkers, video, sim.metrics)
 
         while sim.current_time <= config.tEnd:
-            oil_distribution = sim.get_state()
-
-            if config.writeFrequency == 0:
-                pass
-            elif round(int(sim.current_time / sim.dt)) % config.writeFrequency == 0:
+            if is_write_time(sim.current_time, sim.dt, config.writeFrequency):
+                oil = sim.oil.copy()  # in the order of the triangles, so plotting needs no lookup per cell
+                oil_distribution = sim.get_state()
 
                 #  1 SAVE STATES
                 state_path = outputdir / 'states' / f"state_{sim.current_time:.3f}.txt"
-                with open(state_path, 'w') as f:
-                    for cell_idx, oil_amount in oil_distribution.items():
-                        f.write(f"{cell_idx} {oil_amount}\n")
+                timed_write(sim.metrics, 'write_state', state_path, write_state, state_path, oil_distribution)
 
                 #  2 SAVE PLOT IMAGES
-                plot_path = outputdir / 'img' / f"plot_{sim.current_time:.3f}.png"
-                vis.create_plot(oil_distribution, sim.current_time, plot_path)
+                plot_path = outputdir / 'img' / f"plot_{sim.current_time:.3f}.png" if config.savePlots else None
+                save_frame(sim, vis, video, oil, plot_path, pool)
     
                 # 3 CREATE LOG
                 logging.info(f"At Time: {sim.current_time:.3f}/{config.tEnd:.3f}: Oil in fishing grounds: {sim.get_oil_in_fishing_grounds():.3e}")
-            sim.step()
+
+            # All steps up to the next write are done in one call
+            n_steps = steps_to_next_write(sim, config)
+            if n_steps == 0:
+                oil = sim.oil.copy()
+                oil_distribution = sim.get_state()
+            sim.advance(max(n_steps, 1))
 
         
         # SAVE FINAL STEP:
         state_path = outputdir / 'states' / f"state_{sim.current_time:.3f}.txt"
-        with open(state_path, 'w') as f:
-            for cell_idx, oil_amount in oil_distribution.items():
-                f.write(f"{cell_idx} {oil_amount}\n")
-        plot_path = outputdir / 'img' / f"plot_{sim.current_time:.3f}.png"
-        vis.create_plot(oil_distribution, sim.current_time, plot_path)        
+        timed_write(sim.metrics, 'write_state', state_path, write_state, state_path, oil_distribution)
+        plot_path = outputdir / 'img' / f"plot_{sim.current_time:.3f}.png" if config.savePlots else None
+        save_frame(sim, vis, video, oil, plot_path, pool)
         logging.info(f"At Time: {sim.current_time:.3f}/{config.tEnd:.3f}: Oil in fishing grounds: {sim.get_oil_in_fishing_grounds():.3e}")
 
-        if config.writeFrequency != 0:
-            images = list(Path(outputdir / 'img').glob("*.png"))
-            vis.create_animation(images, config.writeFrequency)
+        if pool is not None:
+            with sim.metrics.phase('render_wait'):  # every frame is saved before the video is finished
+                pool.close()
+        if video is not None:
+            video.close()
+            sim.metrics.count('files_written')
+            sim.metrics.count('bytes_written', video.path.stat().st_size)
+        elif config.writeFrequency != 0:
+            images = sorted(Path(outputdir / 'img').glob("plot_*.png"), key=lambda image: float(image.stem[len('plot_'):]))
+            timed_write(sim.metrics, 'create_animation', outputdir / 'output.avi', vis.create_animation, images, config.writeFrequency)
+        finish_metrics(sim, outputdir)
 
     except Exception as e:
         print(f"Error: {str(e)}")
         exit(1)
+    finally:
+        if pool is not None:  # the run failed before all frames were done
+            pool.close(flush=False)
+        if video is not None:  # the frames written so far are kept in a playable video
+            video.close()
+        if sim is not None:
+            sim.close()  # stops the workers of the parallel engine and logs their timings
+        if metrics.profiler is not None and metrics.profiler.enabled:  # the run failed while profiling
+            metrics.profiler.disable()
     
 
 if __name__ == "__main__":
     args = parse_input()
     try:
+        # In an --mpi run only rank 0 prints, the other ranks would repeat every line
+        if args.mode == "mpi":
+            from src.Simulation.distributed import world_rank
+            is_root = world_rank() == 0
+        else:
+            is_root = True
         if args.find_all:
             config_files = find_config_files(args.folder)
-            if not config_files:
+            if not config_files and is_root:
                 print(f"No config files found in {args.folder or 'current directory'}")
 
-            print(f"Found {len(config_files)} config file(s)")
+            if is_root:
+                print(f"Found {len(config_files)} config file(s)")
             for config_file in config_files:
-                print(f"\nProcessing {config_file.name}")
-                run_simulation(config_file)
-            print(f"\nCompleted {len(config_files)} simulations")
+                if is_root:
+                    print(f"\nProcessing {config_file.name}")
+                run_simulation(config_file, args.mode, args.engine, args.profile)
+            if is_root:
+                print(f"\nCompleted {len(config_files)} simulations")
             
         else: 
             args.config_file
             config_path = Path(args.config_file)
-            print(f"\nProcessing {args.config_file}")
-            run_simulation(config_path)
-            print(f"\nCompleted simulation for {args.config_file}")
+            if is_root:
+                print(f"\nProcessing {args.config_file}")
+            run_simulation(config_path, args.mode, args.engine, args.profile)
+            if is_root:
+                print(f"\nCompleted simulation for {args.config_file}")
 
     except Exception as e:
         print(f"Error: {str(e)}")
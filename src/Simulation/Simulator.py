@@ -1,32 +1,134 @@
 from .mesh import Mesh
+from .metrics import Metrics
+from . import engines
 import numpy as np
+import warnings
+
+
+REFERENCE_ENGINE = 'reference'
+PARALLEL_ENGINE = 'parallel'
+OIL_SOURCE = (0.35, 0.45)
+
+
+def gaussian_release(midpoints, x_star=OIL_SOURCE):
+    """
+    Oil released around x_star, falling off with the squared distance from it.
+    Args:
+        midpoints (array): (N, 2) cell midpoints.
+        x_star (tuple): The center point of the oil distribution.
+    Returns:
+        array: (N,) oil amount in every cell.
+    """
+    dist_squared = np.sum((midpoints - np.asarray(x_star))**2, axis=1)
+    return np.exp(-dist_squared / 0.01)
+
+
+def flow_velocity(x, y):
+    """
+    The velocity field of the water.
+    Args:
+        x (array): x-coordinates.
+        y (array): y-coordinates.
+    Returns:
+        array: (2, ...) velocity at the points.
+    """
+    return np.array([y - 0.2 * x, -x])
+
+
+def fishing_mask(midpoints, borders):
+    """
+    Args:
+        midpoints (array): (N, 2) cell midpoints.
+        borders (list): [[xmin, xmax], [ymin, ymax]] of the fishing grounds.
+    Returns:
+        array: (N,) True for the cells with their midpoint inside the borders.
+    """
+    x_range, y_range = borders
+    x, y = midpoints.T
+    return (x_range[0] <= x) & (x <= x_range[1]) & (y_range[0] <= y) & (y <= y_range[1])
+
+
+def read_state_file(state_file, cell_positions):
+    """
+    Reads a state file with one 'cell_idx oil_amount' line per cell.
+    Cells missing from the file get no oil, and unknown cell ids are ignored.
+    An empty file gives no oil in any cell.
+    Args:
+        state_file (str): Path to the state file.
+        cell_positions (array): (N,) row of every cell id in the mesh arrays, see 'Mesh.get_cell_positions'.
+    Returns:
+        array: (N,) oil amount in every row of the mesh.
+    """
+    n_cells = len(cell_positions)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # loadtxt warns about an empty file
+        data = np.loadtxt(state_file, ndmin=2)
+    if data.size == 0:
+        return np.zeros(n_cells)
+    ids, amounts = data.T
+    ids = ids.astype(np.int64)
+    known = (ids >= 0) & (ids < n_cells)
+
+    oil = np.zeros(n_cells)
+    oil[cell_positions[ids[known]]] = amounts[known]
+    return oil
+
+
+def available_engines():
+    """
+    Names of the engines a simulator can step with. 'reference' is the
+    cell-by-cell loop in 'simulator.step', the rest come from 'engines'.
+    """
+    return [REFERENCE_ENGINE] + engines.available_engines()
+
 
 class simulator:
-    def __init__(self, config):
+    def __init__(self, config, metrics=None):
         """
         Initializes the Simulator with the given configuration. And runs the oil initialization.
         Args:
             config (Config): config object for current file
+            metrics (Metrics): Metrics to add the timers and counters to, a new one if not given.
         Attributes:
-            mesh (Mesh): Mesh object created using the mesh name from the configuration.
+            mesh (Mesh): Mesh object created using the mesh name and cell ordering from the configuration.
             dt (float): Time step
             tStart (float): Start time of the simulation.
             current_time (float): Current time in the simulation, initialized to the start time.
-            Triangles (list): List of triangles in the mesh.
+            oil (array): Oil amount in every cell, shared with the mesh.
+            engine (str): Name of the engine used by 'step'.
+            workers (int): Number of worker processes of the parallel engine, None for one per core.
+            metrics (Metrics): Time spent loading the mesh, setting up and stepping, and the number of steps and flux evaluations.
         """
         self.config = config
-        self.mesh = Mesh(self.config.meshName)
+        self.metrics = Metrics() if metrics is None else metrics
+        with self.metrics.phase('mesh_load'):
+            self.mesh = Mesh(self.config.meshName, self.config.ordering)
         self.dt = (self.config.tEnd - self.config.tStart) / self.config.nSteps
-        self.mesh.compute_neighbors()
+        with self.metrics.phase('compute_neighbors'):
+            self.mesh.compute_neighbors()
+        self.metrics.info['cells'] = len(self.mesh.get_midpoints())
         
         self.tStart = self.config.tStart
         self.current_time = self.tStart
-        self.Triangles = self.mesh.get_triangles()
+        self.oil = self.mesh.get_oil_amounts()
+        self._fishing_mask = None
+        self.engine = self.config.engine
+        self.workers = self.config.workers
+        self._engine = None
         
-        if config.restartFile is None:
-            self._initilize_oil_distribution()
-        else:
-            self._load_restart_file(config.restartFile)
+        with self.metrics.phase('initial_state'):
+            if config.restartFile is None:
+                self._initilize_oil_distribution()
+            else:
+                self._load_restart_file(config.restartFile)
+
+
+    @property
+    def Triangles(self):
+        """
+        List of triangles in the mesh, as views into the mesh arrays.
+        """
+        return self.mesh.get_triangles()
 
 
     def _load_restart_file(self, restart_file):
@@ -38,14 +140,7 @@ class simulator:
             RuntimeError: If there is an error reading the restart file or parsing its contents.
         """
         try:
-            state = {}
-            with open(restart_file, 'r') as f:
-                for line in f:
-                    idx, amount = line.strip().split()
-                    state[int(idx)] = float(amount)
-        
-            for cell in self.Triangles:
-                cell.oil_amount = state.get(cell.idx, 0.0)
+            self.oil[:] = read_state_file(restart_file, self.mesh.get_cell_positions())
         except Exception as e:
             raise RuntimeError(f"Failed to load restart file: {e}")
 
@@ -55,14 +150,10 @@ class simulator:
         Initializes the oil distribution. Based on the distance from the center point x_star. 
         Attributes:
             x_star (np.array): The center point of the oil distribution.
-            Triangles (list): List of triangles in the mesh.
         """
-        x_star = np.array([0.35, 0.45])
+        x_star = np.array(OIL_SOURCE)
         
-        for cell in self.Triangles:
-            x = cell.midpoint
-            dist_squared = np.sum((x - x_star)**2)
-            cell.oil_amount = np.exp(-dist_squared / 0.01)
+        self.oil[:] = gaussian_release(self.mesh.get_midpoints(), x_star)
 
         
     def _get_velocity(self, x, y):
@@ -74,7 +165,7 @@ class simulator:
         Returns:
             array: The velocity vector at the given point.
         """
-        return np.array([y - 0.2 * x, -x])
+        return flow_velocity(x, y)
 
 
     def _compute_flux(self, celle_i, neighbor_i, edge_idx):
@@ -100,50 +191,126 @@ class simulator:
             return (-self.dt * neighbor_i.oil_amount * dot_product) / celle_i._area
         
 
-    def find_shared_edge(self, cell, neighbor):
+    def _get_engine(self):
+        """
+        Creates the stepping engine on first use, with the velocity at every cell midpoint.
+        """
+        if self._engine is None:
+            options = {'workers': self.workers} if self.engine == PARALLEL_ENGINE else {}
+            with self.metrics.phase('engine_setup'):
+                self._engine = engines.create_engine(self.engine, self.mesh, self.get_velocity_field(), self.dt, **options)
+        return self._engine
+
+
+    def _count_steps(self, n_steps):
+        """
+        Counts the steps and the flux evaluations they took. The engines evaluate one flux per
+        interior face and step, the reference engine evaluates it from both cells of the face.
+        """
+        per_face = 2 if self.engine == REFERENCE_ENGINE else 1
+        self.metrics.count('steps', n_steps)
+        self.metrics.count('flux_evaluations', n_steps * per_face * len(self.mesh.get_faces().cells))
+
+
+    def close(self):
+        """
+        Stops the engine, which stops the worker processes of the parallel engine.
+        """
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
+
+    def get_velocity_field(self):
         """
-        Finds the index of the shared edge between a given cell and its neighbor.
-        Args:
-            cell: current cell to check
-            neighbor: neighbor of current cell to check
         Returns:
-            int: The index of the shared edge between the cell and its neighbor, or None if no shared edge is found.
+            array: (N, 2) velocity at every cell midpoint.
+        """
+        midpoints = self.mesh.get_midpoints()
+        return self._get_velocity(midpoints[:, 0], midpoints[:, 1]).T
+
+
+    def get_operator(self):
         """
-        shared_points = set(cell.get_pointIDs()) & set(neighbor.get_pointIDs())
+        Returns the sparse matrix of one time step, see 'engines.assemble_operator'.
+        The sparse engine's operator is reused when that engine is running.
+        """
+        if isinstance(self._engine, engines.SparseEngine):
+            return self._engine.operator
+        return engines.assemble_operator(self.mesh, self.get_velocity_field(), self.dt)
 
-        edges = [
-            (cell.get_pointIDs()[0], cell.get_pointIDs()[1]),
-            (cell.get_pointIDs()[1], cell.get_pointIDs()[2]),
-            (cell.get_pointIDs()[2], cell.get_pointIDs()[0])]
 
-        for edge_idx, (p1, p2) in enumerate(edges):
-            if p1 in shared_points and p2 in shared_points:
-                return edge_idx
+    def get_times(self):
+        """
+        Times the simulation passes from the current time to tEnd,
+        added up step by step like 'step' does.
+        Returns:
+            list: Times, the current time first.
+        """
+        times = []
+        time = self.current_time
+        while time <= self.config.tEnd:
+            times.append(time)
+            time += self.dt
+        return times
 
 
     def step(self):
         """
         Step the simulation forward and incrementing current time step dt
-        Updates oil in each cell by total flux. 
-        Attributes:
-            old_amount (dict): A dictionary of every cell with its oil level
-            total_flux (float): The total flux of oil for a given cell from all its neighbors.
-            neighbour_idx (int): The index of a neighboring cell.
-            neighbour (Cell): The neighboring cell.
-            edge_idx (int or None): The index of the shared edge between the current cell and its neighbor.
-        """
-        old_amount = {cell.idx: cell.oil_amount for cell in self.Triangles}
-        for cell in self.Triangles:
-            total_flux = 0
-            for neighbour_idx in cell.get_neighbors():
-                neighbour = self.Triangles[neighbour_idx]
-                edge_idx = self.find_shared_edge(cell, neighbour)
-
-                if edge_idx is not None:
-                    total_flux += self._compute_flux(cell, neighbour, edge_idx)
-
-            cell.oil_amount = old_amount[cell.idx] + total_flux
+        Updates oil in each cell by total flux, with the engine chosen in the config.
+        """
+        engine = None if self.engine == REFERENCE_ENGINE else self._get_engine()
+        with self.metrics.phase('step'):
+            if engine is None:
+                self._step_reference()
+            else:
+                self.oil[:] = engine.step(self.oil)
+        self._count_steps(1)
         self.current_time += self.dt
+
+
+    def advance(self, n_steps):
+        """
+        Steps the simulation forward n_steps time steps.
+        Engines do all the steps in one call, the reference engine loops over 'step'.
+        Args:
+            n_steps (int): Number of time steps.
+        """
+        if self.engine == REFERENCE_ENGINE:
+            for _ in range(n_steps):
+                self.step()
+            return
+
+        engine = self._get_engine()
+        with self.metrics.phase('step'):
+            self.oil[:] = engine.advance(self.oil, n_steps)
+        self._count_steps(n_steps)
+        for _ in range(n_steps):  # same rounding of the time as stepping one by one
+            self.current_time += self.dt
+
+
+    def _step_reference(self):
+        """
+        Updates oil in each cell by total flux, one face at a time.
+        Goes through the precomputed interior faces of the mesh, and computes the flux
+        for both cells of each face from the oil amounts before the step.
+        Boundary faces are closed and give no flux.
+        Attributes:
+            total_flux (array): The total flux of oil for every cell from all its neighbors.
+            left, right (int): The two cells sharing a face.
+            edge_left, edge_right (int): The index of the face in the left and right cell.
+        """
+        faces = self.mesh.get_faces()
+        triangles = self.Triangles
+        total_flux = np.zeros_like(self.oil)
+        for (left, right), (edge_left, edge_right) in zip(faces.cells.tolist(), faces.edges.tolist()):
+            cell = triangles[left]
+            neighbour = triangles[right]
+            total_flux[left] += self._compute_flux(cell, neighbour, edge_left)
+            total_flux[right] += self._compute_flux(neighbour, cell, edge_right)
+
+        self.oil += total_flux
     
 
     def _compute_fishing_grounds(self):
@@ -151,19 +318,29 @@ class simulator:
         Computes the total amount of oil fish within the defined fishing grounds.
         Checks if the midpoint of each cell lies within the borders,
         and sums up the oil amount in those cells and multiplies it by the area of the cell.
+        The cells inside the borders are found once and reused.
         Returns:
             float: The total amount of oil fish within the specified fishing grounds.
         """
-        total_oil_fish = 0
-        x_range = self.config.borders[0]
-        y_range = self.config.borders[1]
+        mask = self._get_fishing_mask()
+        return float(np.sum(self.oil[mask] * self.mesh.get_areas()[mask]))
+
+
+    def _get_fishing_mask(self):
+        """
+        Finds the cells with their midpoint inside the borders, once.
+        """
+        if self._fishing_mask is None:
+            self._fishing_mask = fishing_mask(self.mesh.get_midpoints(), self.config.borders)
+        return self._fishing_mask
 
-        for cell in self.Triangles:
-            x, y = cell.midpoint
-            if (x_range[0] <= x <= x_range[1] and 
-                y_range[0] <= y <= y_range[1]):
-                total_oil_fish += cell.oil_amount * cell.get_area()
-        return total_oil_fish
+
+    def get_fishing_weights(self):
+        """
+        Weights that turn oil amounts into oil in the fishing grounds,
+        the cell area inside the borders and 0 outside: weights @ oil.
+        """
+        return np.where(self._get_fishing_mask(), self.mesh.get_areas(), 0.0)
     
 
     def get_oil_in_fishing_grounds(self):
@@ -171,7 +348,9 @@ class simulator:
 
 
     def get_state(self):
-        return {
-            cell.idx: cell.oil_amount for cell in self.Triangles
-        }
+        """
+        Returns:
+            dict: Oil amount of every cell, by the cell id in the mesh file.
+        """
+        return dict(zip(self.mesh.get_cell_ids().tolist(), self.oil.tolist()))
            
\ No newline at end of file
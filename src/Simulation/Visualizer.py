@@ -1,62 +1,177 @@
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+import matplotlib.image
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import numpy as np
+import weakref
 import cv2
+from .raster import Rasterizer, colormap_table
+
+# How frames are drawn: 'matplotlib' plots with axes, colorbar and title,
+# 'raster' colors the pixels of the triangles straight from a pixel to triangle map, see 'raster.Rasterizer'
+RENDERERS = ('matplotlib', 'raster')
 
 class Visualizer:
-    def __init__(self, triangles, config, outputdir):
+    def __init__(self, mesh, config, outputdir):
         """
-        Initializes the Visualizer with the given triangles, configuration, and output directory.
+        Initializes the Visualizer with the triangles of the mesh, configuration, and output directory.
+        The corners and cell ids of the triangles are taken from the mesh arrays, every plot
+        draws all triangles as one collection from them.
+        The figure is made on the first plot and kept for the next ones, see '_get_figure'.
+        With config.renderer 'raster' there is no figure, the frames are only the triangles, the
+        fishing grounds and the oil source at config.resolution, see '_get_rasterizer'.
         Args:
-            triangles (list): A list of all traingles in the mesh.
+            mesh (Mesh): The mesh, its triangles are plotted in the order of its rows.
             config (dict): Configuration settings for the visualization.
             outputdir (str): The directory where the output files will be saved.
+        Attributes:
+            vertices (array): (N, 3, 2) corners of every triangle.
+            cell_ids (array): (N,) cell id of every triangle, the key of its oil amount.
+            _figure (Figure): The figure, None until the first plot.
+            _label (str): Label of the colorbar of the figure.
+            _background: Saved pixels of the parts of the figure that stay the same.
+            _cells (PolyCollection): The triangles.
+            _dynamic (list): Artists drawn over the background in every plot, in drawing order.
+            _rasterizer (Rasterizer): Triangle of every pixel, None until the first raster frame.
         """
-        self.triangles = triangles
         self.config = config
         self.outputfolder = outputdir
+        self.vertices = mesh.get_points()[mesh.get_connectivity()][..., :2]
+        self.cell_ids = np.asarray(mesh.get_cell_ids(), dtype=np.int64)
+        self._figure = None
+        self._label = None
+        self.renderer = config.renderer
+        self._rasterizer = None
 
 
-    def create_plot(self, oil_distribution, time, output_path):
+    def __getstate__(self):
         """
-        Creates a plot of the oil distribution over the triangles and saves it to a file.
-        Args:
-            oil_distribution (list): The oil distribution values for each triangle.
-            time (float): The current time of the simulation, used for the plot title.
-            output_path (str): The file path where the plot image will be saved.
+        Only the arrays and settings are sent to other processes, see 'RenderPool'.
+        The figure is made again where it is used.
         """
-        plt.figsize = (10, 8)
+        state = {key: self.__dict__[key] for key in ('config', 'outputfolder', 'vertices', 'cell_ids', 'renderer')}
+        return state | {'_figure': None, '_label': None, '_rasterizer': None}
 
-        for triangle in self.triangles:
-            x = [p[0] for p in triangle.points]  # Vector 1
-            y = [p[1] for p in triangle.points]  # Vector 2
-            x.append(x[0])  # Go back to start to close triangle
-            y.append(y[0])
 
-            plt.fill(x, y, color=plt.cm.viridis(oil_distribution[triangle.idx]))
+    def _cell_values(self, oil_distribution):
+        """
+        The values of oil_distribution in the order of the triangles.
+        An array is taken to be in that order already.
+        """
+        if isinstance(oil_distribution, np.ndarray):
+            return oil_distribution
+        return np.fromiter((oil_distribution[idx] for idx in self.cell_ids.tolist()), dtype=float, count=len(self.cell_ids))
 
 
-        plt.plot(0.35, 0.45, 'r+', label='Oil Source')
-        plt.gca().add_patch(plt.Rectangle(
+    def _get_figure(self, label):
+        """
+        Makes the figure with the axes, colorbar, oil source, fishing grounds and legend, once per colorbar label.
+        The figure is drawn once in full, which also finds the best place for the legend, and
+        once without the triangles, source, fishing grounds, legend and title. The pixels of that
+        second drawing are the background every plot starts from, so a plot only draws the
+        artists on top of it.
+        Args:
+            label (str): Label of the colorbar.
+        """
+        if self._figure is not None and self._label == label:
+            return
+        figure = Figure()
+        canvas = FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+
+        self._cells = PolyCollection(self.vertices, cmap=plt.cm.viridis, norm=plt.Normalize(0, 1),
+                                     edgecolors='face', linewidths=plt.rcParams['patch.linewidth'])
+        self._cells.set_array(np.zeros(len(self.vertices)))
+        ax.add_collection(self._cells)
+        source, = ax.plot(0.35, 0.45, 'r+', label='Oil Source')
+        fishing_grounds = ax.add_patch(plt.Rectangle(
             (self.config.borders[0][0], self.config.borders[1][0]), self.config.borders[0][1], self.config.borders[1][1],
             fill=False, color='red',
             linestyle='--', label='Fishing Grounds'
         ))
+        figure.colorbar(plt.cm.ScalarMappable(norm=plt.Normalize(0, 1), cmap=plt.cm.viridis), ax=ax, label=label)
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_xlim(-0.1, 1.1)
+        ax.set_ylim(-0.1, 1.1)
+        ax.set_title(' ')
+
+        # Finding the best place for the legend goes through every triangle, so it is only done here
+        legend = ax.legend()
+        canvas.draw()
+        legend.set_loc(tuple(legend.get_window_extent().transformed(ax.transAxes.inverted()).p0))
+
+        # Drawn in the order the axes draws them, by zorder
+        self._dynamic = [self._cells, fishing_grounds, source, legend, ax.title]
+        for artist in self._dynamic:
+            artist.set_animated(True)
+        canvas.draw()
+        self._background = canvas.copy_from_bbox(figure.bbox)
+        self._figure, self._ax, self._label = figure, ax, label
+
+
+    def _get_rasterizer(self):
+        """
+        Finds the triangle of every pixel once, and adds the fishing grounds and the oil source on top.
+        """
+        if self._rasterizer is None:
+            width, height = self.config.resolution
+            rasterizer = Rasterizer(self.vertices, width, height, (-0.1, 1.1, -0.1, 1.1))  # the limits of the plot axes
+            rasterizer.add_rectangle(self.config.borders[0][0], self.config.borders[1][0],
+                                     self.config.borders[0][1], self.config.borders[1][1], (255, 0, 0, 255))
+            rasterizer.add_marker(0.35, 0.45, (255, 0, 0, 255))
+            self._rasterizer = rasterizer
+            self._table = colormap_table(plt.cm.viridis)
+        return self._rasterizer
 
 
-        plt.colorbar(plt.cm.ScalarMappable(
-            norm=plt.Normalize(0, 1),
-            cmap=plt.cm.viridis
-        ), ax=plt.gca(), label='Oil Amount')
+    def render(self, oil_distribution, time, title='Oil Distribution', label='Oil Amount'):
+        """
+        Draws the oil distribution over the background of the figure.
+        Only the triangle colors and the title change between plots.
+        The 'raster' renderer has no title or colorbar, it only colors the pixels of the triangles.
+        Args:
+            oil_distribution (dict): The oil amount of every cell id, or an array in the order of the triangles.
+            time (float): The current time of the simulation, used for the plot title.
+            title (str): Title of the plot, the time is added after it.
+            label (str): Label of the colorbar.
+        Returns:
+            array: (height, width, 4) RGBA pixels of the plot, they change with the next plot.
+        """
+        if self.renderer == 'raster':
+            return self._get_rasterizer().render(self._cell_values(oil_distribution), self._table)
+        self._get_figure(label)
+        self._cells.set_array(self._cell_values(oil_distribution))
+        self._ax.title.set_text(f'{title} at t = {time:.3f}')
 
+        canvas = self._figure.canvas
+        canvas.restore_region(self._background)
+        for artist in self._dynamic:
+            self._figure.draw_artist(artist)
+        return np.asarray(canvas.buffer_rgba())
 
-        plt.xlabel('X')
-        plt.ylabel('Y')
-        plt.xlim(-0.1, 1.1)
-        plt.ylim(-0.1, 1.1)
-        plt.title(f'Oil Distribution at t = {time:.3f}')
-        plt.legend()
-        
-        plt.savefig(output_path)
-        plt.close()
+
+    def create_plot(self, oil_distribution, time, output_path, title='Oil Distribution', label='Oil Amount'):
+        """
+        Creates a plot of the oil distribution over the triangles and saves it to a file.
+        The triangles are one PolyCollection colored through the colormap, which looks the
+        same as filling them one by one, edges in the face color included.
+        Args:
+            oil_distribution (list): The oil distribution values for each triangle.
+            time (float): The current time of the simulation, used for the plot title.
+            output_path (str): The file path where the plot image will be saved.
+            title (str): Title of the plot, the time is added after it.
+            label (str): Label of the colorbar.
+        Returns:
+            array: The RGBA pixels of the plot, see 'render'.
+        """
+        frame = self.render(oil_distribution, time, title, label)
+        matplotlib.image.imsave(output_path, frame)
+        return frame
 
 
     def create_animation(self, images, freq):
@@ -75,5 +190,143 @@ class Visualizer:
         for image in images:
             video.write(cv2.imread(image))
 
-        cv2.destroyAllWindows()
         video.release()
+
+
+class VideoStream:
+    def __init__(self, path, freq):
+        """
+        Writes plots to a video file while the simulation runs, instead of reading
+        the saved images back at the end like 'Visualizer.create_animation'.
+        The video is opened on the first frame, with its size.
+        Args:
+            path (Path): The video file.
+            freq (int): Frame rate / number of frames set as the writeFrequency in config.
+        Attributes:
+            frames (int): Number of frames written.
+        """
+        self.path = path
+        self.freq = freq
+        self.frames = 0
+        self._video = None
+
+
+    def write(self, frame):
+        """
+        Adds a frame to the end of the video.
+        Args:
+            frame (array): (height, width, 4) RGBA pixels, like from 'Visualizer.render'.
+        Raises:
+            RuntimeError: If the video file can not be opened.
+        """
+        if self._video is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'DIVX')
+            self._video = cv2.VideoWriter(str(self.path), fourcc, self.freq, (width, height))
+            if not self._video.isOpened():
+                raise RuntimeError(f"Could not open video file {self.path}")
+        self._video.write(cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR))
+        self.frames += 1
+
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+
+_visualizer = None  # the Visualizer of a worker process of 'RenderPool'
+
+
+def _start_render_worker(visualizer):
+    global _visualizer
+    _visualizer = visualizer
+
+
+def _render_frame(values, time, plot_path, keep_frame):
+    """
+    Runs in a worker process of 'RenderPool'. Plots one frame and saves it if plot_path is given.
+    Returns:
+        array: The RGBA pixels if keep_frame, otherwise None.
+    """
+    if plot_path is None:
+        frame = _visualizer.render(values, time)
+    else:
+        frame = _visualizer.create_plot(values, time, plot_path)
+    return frame.copy() if keep_frame else None
+
+
+class RenderPool:
+    def __init__(self, visualizer, workers, video=None, metrics=None):
+        """
+        Plots and saves frames in worker processes while the simulation goes on stepping.
+        Every worker has its own copy of the visualizer, and gets the oil of a frame as an array.
+        At most two frames per worker are waiting at any time, 'submit' waits for the oldest
+        one when there are more, so the stepping never gets far ahead of the plotting.
+        The frames are added to the video in the order they were submitted.
+        Args:
+            visualizer (Visualizer): Visualizer the workers copy.
+            workers (int): Number of worker processes.
+            video (VideoStream): Video the frames are added to, None for no video.
+            metrics (Metrics): Metrics that count the images written and time the video, None to not count them.
+        Attributes:
+            max_pending (int): Most frames waiting to be done.
+        """
+        self.visualizer = visualizer
+        self.video = video
+        self.metrics = metrics
+        self.max_pending = 2 * workers
+        self._pending = deque()
+        # spawn, like the parallel engine, fork can hang once numba or BLAS have started threads
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_start_render_worker, initargs=(visualizer,))
+        self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=False, cancel_futures=True)
+
+
+    def submit(self, oil, time, plot_path=None):
+        """
+        Hands a frame to the workers, after waiting for the oldest ones if too many are waiting.
+        Args:
+            oil (array): The oil amount of every cell, in the order of the triangles.
+                It is copied, so it can change right after.
+            time (float): The current time of the simulation, used for the plot title.
+            plot_path (Path): Image file to write, None to not write one.
+        Raises:
+            RuntimeError: If plotting a frame failed.
+        """
+        while len(self._pending) >= self.max_pending:
+            self._finish_oldest()
+        values = np.array(oil, dtype=float)
+        future = self._executor.submit(_render_frame, values, time, plot_path, self.video is not None)
+        self._pending.append((future, plot_path))
+
+
+    def _finish_oldest(self):
+        future, plot_path = self._pending.popleft()
+        try:
+            frame = future.result()
+        except Exception as e:
+            raise RuntimeError(f"Plotting a frame failed: {e!r}") from e
+        if self.metrics is not None and plot_path is not None:
+            self.metrics.count('files_written')
+            self.metrics.count('bytes_written', plot_path.stat().st_size)
+        if self.video is not None:
+            if self.metrics is None:
+                self.video.write(frame)
+            else:
+                with self.metrics.phase('create_animation'):
+                    self.video.write(frame)
+
+
+    def close(self, flush=True):
+        """
+        Waits for every frame to be saved and added to the video, and stops the workers.
+        Args:
+            flush (bool): False drops the frames that are not done, like when the run has failed.
+        """
+        try:
+            while flush and self._pending:
+                self._finish_oldest()
+        finally:
+            self._pending.clear()
+            self._finalizer()
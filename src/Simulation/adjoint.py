@@ -0,0 +1,23 @@
+def exposure_maps(sim):
+    """
+    Oil in the fishing grounds for a unit release in every cell, for all cells in one run.
+    The fishing grounds are weights @ oil, and oil after m steps is A^m @ oil,
+    so stepping the weights with the transposed operator gives
+    (A^T)^m @ weights, the fishing ground oil for a release in each cell.
+    A unit release is one unit of oil in the cell, oil_amount = 1 / area,
+    which makes the map the fraction of a spill from each cell in the fishing grounds.
+    Args:
+        sim (simulator): Simulator giving the mesh, dt, borders and time span.
+    Yields:
+        tuple: (time, exposure) for every time from the current time to tEnd,
+            exposure is an (N,) array with one value per release cell.
+    """
+    operator_T = sim.get_operator().T
+    areas = sim.mesh.get_areas()
+    adjoint = sim.get_fishing_weights()
+
+    times = sim.get_times()
+    for i, time in enumerate(times):
+        yield time, adjoint / areas
+        if i + 1 < len(times):
+            adjoint = operator_T @ adjoint
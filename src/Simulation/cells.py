@@ -121,4 +121,102 @@ class Triangle(Cell):
 
 
     def __str__(self):
-        return f"Triangle (ID: {self.idx}) Neighbors: {self._neighbors}"
\ No newline at end of file
+        return f"Triangle (ID: {self.idx}) Neighbors: {self._neighbors}"
+
+class TriangleView(Triangle):
+    """
+    A lightweight Triangle that stores no data of its own.
+    Every attribute is read from the arrays owned by the Mesh, so views can be
+    created on demand for callers that work with one cell at a time.
+    Attributes:
+        _mesh (Mesh): The mesh holding the arrays.
+        _row (int): Row of the cell in the mesh arrays.
+        idx (int): cell id, the same as _row unless the mesh cells were reordered.
+    """
+    __slots__ = ('_mesh', '_row')
+
+    def __init__(self, mesh, row):
+        self._mesh = mesh
+        self._row = row
+
+    @property
+    def idx(self):
+        return int(self._mesh._cell_ids[self._row])
+
+    @property
+    def _pointIDs(self):
+        return self._mesh._connectivity[self._row]
+
+    @property
+    def points(self):
+        return self._mesh._points[self._mesh._connectivity[self._row], :2]
+
+    @property
+    def midpoint(self):
+        return self._mesh._midpoints[self._row]
+
+    @property
+    def _area(self):
+        return self._mesh._areas[self._row]
+
+    @property
+    def _scaled_normals(self):
+        return self._mesh._scaled_normals[self._row]
+
+    @property
+    def _edges(self):
+        return np.roll(self.points, -1, axis=0) - self.points
+
+    @property
+    def _normals(self):
+        scaled_normals = self._scaled_normals
+        return scaled_normals / np.linalg.norm(scaled_normals, axis=1, keepdims=True)
+
+    @property
+    def _neighbors(self):
+        if self._mesh._neighbors is None:
+            return []
+        row = self._mesh._neighbors[self._row]
+        return sorted(self._mesh._cell_ids[row[row >= 0]].tolist())
+
+    @property
+    def oil_amount(self):
+        return self._mesh._oil_amounts[self._row]
+
+    @oil_amount.setter
+    def oil_amount(self, value):
+        self._mesh._oil_amounts[self._row] = value
+
+def compute_triangle_geometry(points, connectivity):
+    """
+    Calculate the geometry of many triangles at once.
+    Does the same steps as 'Triangle._compute_geometry', but on whole arrays
+    with one row per triangle, so the results are the same as cell by cell.
+    Args:
+        points (array): (P, 2) or (P, 3) coordinates of the mesh points. z is ignored.
+        connectivity (array): (N, 3) point indices of the triangles.
+    Returns:
+        tuple: (midpoints, areas, scaled_normals) with shapes (N, 2), (N,) and (N, 3, 2).
+    """
+    corners = np.asarray(points)[:, :2][connectivity]  # (N, 3, 2)
+    midpoints = np.mean(corners, axis=1)
+
+    # EDGES, edge k goes from point k to point k+1
+    next_corners = np.roll(corners, -1, axis=1)
+    edges = next_corners - corners
+    lengths = np.sqrt(np.vecdot(edges, edges))[..., None]  # same rounding as np.linalg.norm on one edge
+
+    # NORMALS, flipped where they point towards the midpoint
+    normals = np.stack([edges[..., 1], -edges[..., 0]], axis=2) / lengths
+    center_to_midpoint = (corners + next_corners) / 2 - midpoints[:, None, :]
+    inward = np.vecdot(normals, center_to_midpoint) < 0
+    normals[inward] = -normals[inward]
+
+    # SCALED NORMALS
+    scaled_normals = normals * lengths
+
+    # AREA
+    edge1 = edges[:, 0]
+    edge2 = edges[:, 1]
+    areas = 0.5 * np.abs(edge1[:, 0]*edge2[:, 1] - edge1[:, 1]*edge2[:, 0])
+    return midpoints, areas, scaled_normals
\ No newline at end of file
@@ -0,0 +1,290 @@
+from .Simulator import OIL_SOURCE, flow_velocity, fishing_mask, gaussian_release, read_state_file
+from .mesh import Mesh
+from .parallel import Subdomain
+from .partition import load_or_partition
+import numpy as np
+import traceback
+import time
+
+MPI = None  # mpi4py, imported by '_import_mpi' because importing it starts MPI
+_HALO_TAG = 11
+
+
+def _import_mpi():
+    """
+    Imports mpi4py the first time a distributed run needs it, so other runs and the
+    worker processes that import this module never start MPI.
+    Raises:
+        RuntimeError: If mpi4py is not installed.
+    """
+    global MPI
+    if MPI is None:
+        try:
+            from mpi4py import MPI as mpi
+        except ImportError:  # mpi4py is optional, it is only needed for distributed runs
+            raise RuntimeError("mpi4py is not installed, it is needed for distributed runs")
+        MPI = mpi
+    return MPI
+
+
+def world_rank():
+    """
+    Returns:
+        int: Rank of this process in MPI.COMM_WORLD.
+    Raises:
+        RuntimeError: If mpi4py is not installed.
+    """
+    return _import_mpi().COMM_WORLD.Get_rank()
+
+
+class RankDomain:
+    def __init__(self, subdomain, owned_rows, halo_rows, cell_ids, oil, areas, weights, receives):
+        """
+        The part of a simulation one MPI rank holds: its own cells and the face data to step them.
+        Args:
+            subdomain (Subdomain): Cells and face data of the rank, see 'parallel.Subdomain',
+                numbered by their index in owned_rows followed by halo_rows.
+            owned_rows (array): Row in the mesh of every owned cell, sorted.
+            halo_rows (array): Row in the mesh of every halo cell, grouped by the rank that owns it.
+            cell_ids (array): Id in the mesh file of the owned cells.
+            oil (array): Oil amount in the owned cells at the start.
+            areas (array): Area of the owned cells.
+            weights (array): Fishing ground weight of the owned cells, see 'simulator.get_fishing_weights'.
+            receives (list): (rank, start, stop) for every rank the halo comes from,
+                halo_rows[start:stop] are the cells it sends.
+        Attributes:
+            sends (list): (rank, cells) for every rank that needs some of the owned cells,
+                cells are indices in owned_rows in the order the other rank wants them, see 'find_sends'.
+        """
+        self.subdomain = subdomain
+        self.owned_rows = owned_rows
+        self.halo_rows = halo_rows
+        self.cell_ids = cell_ids
+        self.oil = oil
+        self.areas = areas
+        self.weights = weights
+        self.receives = receives
+        self.sends = []
+
+
+    def requests(self, n_ranks):
+        """
+        Returns:
+            list: Rows this rank needs from every rank, empty for the ranks it needs nothing from.
+        """
+        wanted = [np.empty(0, dtype=np.int64) for _ in range(n_ranks)]
+        for owner, start, stop in self.receives:
+            wanted[owner] = self.halo_rows[start:stop]
+        return wanted
+
+
+    def find_sends(self, requests):
+        """
+        Sets the sends from the rows every rank asked this rank for, see 'requests'.
+        """
+        self.sends = [(rank, np.searchsorted(self.owned_rows, rows)) for rank, rows in enumerate(requests) if len(rows)]
+
+
+def _local_faces(neighbors, owned):
+    """
+    The interior faces of the mesh that touch an owned cell, found from the neighbor rows of
+    the owned cells only. They are numbered and ordered like 'topology.FaceTable', so the
+    fluxes into every cell are added in the same order as on the whole mesh.
+    Returns:
+        tuple: (left, right, left_edges) of every face, left < right.
+    """
+    cell = np.repeat(owned, 3)
+    edge = np.tile(np.arange(3), len(owned))
+    other = neighbors[owned].ravel()
+    interior = other >= 0
+    cell, edge, other = cell[interior], edge[interior], other[interior]
+
+    is_left = cell < other
+    left = np.where(is_left, cell, other)
+    right = np.where(is_left, other, cell)
+    left_edges = edge.copy()
+    from_right = np.flatnonzero(~is_left)
+    left_edges[from_right] = np.argmax(neighbors[other[from_right]] == cell[from_right, None], axis=1)
+    # Faces between two owned cells are found from both sides, unique keeps one and sorts them
+    _, first = np.unique(left * 3 + left_edges, return_index=True)
+    return left[first], right[first], left_edges[first]
+
+
+def rank_domain(mesh, partition, rank, config, dt):
+    """
+    Builds the part of a simulation one rank holds, reading only the rows of its own cells,
+    their neighbors and the faces between them from the memory mapped mesh and partition.
+    The face coefficients are worked out like 'engines.face_coefficients', so the steps
+    give exactly the oil of the numpy engine.
+    A restart file is read in full, and only the owned cells are kept.
+    Args:
+        mesh (Mesh): Mesh with neighbors computed, memory mapped from a compiled mesh.
+        partition (Partition): Partition of the mesh into one part per rank.
+        rank (int): The rank.
+        config (Config): config object for current file
+        dt (float): Time step.
+    Returns:
+        RankDomain: The part of the rank, without its sends, see 'RankDomain.find_sends'.
+    """
+    parts = partition.parts
+    owned = np.asarray(partition.owned[rank], dtype=np.int64)
+    left, right, left_edges = _local_faces(mesh.get_neighbor_table(), owned)
+
+    outside = np.setdiff1d(np.concatenate([left, right]), owned)
+    halo = outside[np.lexsort((outside, parts[outside]))]
+    local_rows = np.concatenate([owned, halo])
+    local_parts = np.concatenate([np.full(len(owned), rank), parts[halo]])
+    sorter = np.argsort(local_rows)
+    def local(rows):
+        return sorter[np.searchsorted(local_rows, rows, sorter=sorter)]
+
+    midpoints = mesh.get_midpoints()[local_rows]
+    areas = mesh.get_areas()[local_rows]
+    velocity = flow_velocity(midpoints[:, 0], midpoints[:, 1]).T
+    left, right = local(left), local(right)
+    normals = mesh.get_scaled_normals()[local_rows[left], left_edges]
+    dot_product = np.vecdot(0.5 * (velocity[left] + velocity[right]), normals)
+    upwind = np.where(dot_product > 0, left, right)
+    coefficients = np.stack([-dt * dot_product / areas[left], dt * dot_product / areas[right]], axis=1)
+    subdomain = Subdomain(rank, local_parts, np.stack([left, right], axis=1), upwind, coefficients)
+
+    # The subdomain keeps the halo cells that oil flows in from, grouped by their rank
+    halo_rows = local_rows[subdomain.halo]
+    owners, starts, counts = np.unique(local_parts[subdomain.halo], return_index=True, return_counts=True)
+    receives = [(int(owner), int(start), int(start + count)) for owner, start, count in zip(owners, starts, counts)]
+
+    n_owned = len(owned)
+    if config.restartFile is None:
+        oil = gaussian_release(midpoints[:n_owned], OIL_SOURCE)
+    else:
+        oil = read_state_file(config.restartFile, mesh.get_cell_positions())[owned]
+    weights = np.where(fishing_mask(midpoints[:n_owned], config.borders), areas[:n_owned], 0.0)
+    return RankDomain(subdomain, owned, halo_rows, mesh.get_cell_ids()[owned], oil, areas[:n_owned], weights, receives)
+
+
+class DistributedSimulator:
+    def __init__(self, config, comm=None):
+        """
+        A simulation spread over MPI ranks. Rank 0 makes sure the compiled mesh and the partition
+        are in the mesh cache, then every rank memory maps them and builds its own part, see
+        'rank_domain'. No rank holds the whole mesh, except rank 0 the first time a mesh is used.
+        The ranks ask each other for their halo cells once.
+        Steps give exactly the same oil as the numpy engine.
+        A rank that fails while setting up aborts all ranks, the others would wait for it for ever.
+        Args:
+            config (Config): config object for current file
+            comm (MPI.Comm): Communicator of the ranks, MPI.COMM_WORLD if not given.
+        Attributes:
+            comm (MPI.Comm): Communicator of the ranks.
+            rank (int): Rank of this process.
+            domain (RankDomain): The part of the simulation this rank holds.
+            dt (float): Time step.
+            current_time (float): Current time in the simulation.
+            oil (array): Oil amount in the owned cells.
+            timings (array): Seconds spent stepping and waiting for the halo.
+        Raises:
+            RuntimeError: If mpi4py is not installed.
+        """
+        MPI = _import_mpi()
+        self.comm = MPI.COMM_WORLD if comm is None else comm
+        self.rank = self.comm.Get_rank()
+        n_ranks = self.comm.Get_size()
+        self.dt = (config.tEnd - config.tStart) / config.nSteps
+        self.current_time = config.tStart
+
+        try:
+            if self.rank == 0:  # writes the compiled mesh and the partition for the other ranks
+                mesh = Mesh(config.meshName, config.ordering)
+                mesh.compute_neighbors()
+                load_or_partition(mesh, n_ranks)
+                del mesh
+            self.comm.Barrier()
+            mesh = Mesh(config.meshName, config.ordering)
+            mesh.compute_neighbors()
+            self.domain = rank_domain(mesh, load_or_partition(mesh, n_ranks), self.rank, config, self.dt)
+            del mesh
+            self.domain.find_sends(self.comm.alltoall(self.domain.requests(n_ranks)))
+        except Exception:
+            if n_ranks == 1:
+                raise
+            traceback.print_exc()
+            self.comm.Abort(1)
+
+        subdomain = self.domain.subdomain
+        self._n_owned = len(subdomain.owned)
+        self._local = np.empty(len(subdomain.local_cells))
+        self._local[:self._n_owned] = self.domain.oil
+        self.oil = self._local[:self._n_owned]
+
+        entry_upwind = subdomain.upwind[subdomain.entry_faces]
+        self._entry_upwind = entry_upwind
+        self._interior = np.flatnonzero(entry_upwind < self._n_owned)
+        self._boundary = np.flatnonzero(entry_upwind >= self._n_owned)
+        self.timings = np.zeros(2)
+
+
+    def step(self):
+        """
+        Step the simulation forward and incrementing current time step dt.
+        The halo is sent and received while the fluxes from owned cells are computed,
+        the fluxes from halo cells are computed when it has arrived.
+        """
+        subdomain = self.domain.subdomain
+        local = self._local
+        n_owned = self._n_owned
+        start = time.perf_counter()
+
+        requests = [self.comm.Irecv(local[n_owned + first:n_owned + stop], source=owner, tag=_HALO_TAG)
+                    for owner, first, stop in self.domain.receives]
+        send_buffers = [local[cells] for _, cells in self.domain.sends]
+        requests += [self.comm.Isend(buffer, dest=rank, tag=_HALO_TAG)
+                     for (rank, _), buffer in zip(self.domain.sends, send_buffers)]
+
+        flux = np.empty(len(self._entry_upwind))
+        interior = self._interior
+        flux[interior] = subdomain.entry_coefficients[interior] * local[self._entry_upwind[interior]]
+
+        waiting = time.perf_counter()
+        MPI.Request.Waitall(requests)
+        received = time.perf_counter()
+
+        boundary = self._boundary
+        flux[boundary] = subdomain.entry_coefficients[boundary] * local[self._entry_upwind[boundary]]
+        local[:n_owned] += np.bincount(subdomain.entry_targets, weights=flux, minlength=n_owned)
+
+        self.timings += (waiting - start + time.perf_counter() - received, received - waiting)
+        self.current_time += self.dt
+
+
+    def advance(self, n_steps):
+        """
+        Steps the simulation forward n_steps time steps.
+        """
+        for _ in range(n_steps):
+            self.step()
+
+
+    def get_oil_in_fishing_grounds(self):
+        """
+        Oil in the fishing grounds of all ranks, summed with an allreduce.
+        Every rank has to call it.
+        """
+        return self.comm.allreduce(float(self.domain.weights @ self.oil), op=MPI.SUM)
+
+
+    def get_state(self):
+        """
+        Returns:
+            dict: Oil amount of the owned cells, by the cell id in the mesh file.
+        """
+        return dict(zip(self.domain.cell_ids.tolist(), self.oil.tolist()))
+
+
+    def gather_timings(self):
+        """
+        Collects the timings of all ranks on rank 0. Every rank has to call it.
+        Returns:
+            list: (cells, halo cells, stepping, waiting) of every rank on rank 0, None on the others.
+        """
+        subdomain = self.domain.subdomain
+        return self.comm.gather((len(subdomain.owned), len(subdomain.halo), *self.timings), root=0)
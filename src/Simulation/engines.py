@@ -0,0 +1,336 @@
+import numpy as np
+import logging
+
+try:
+    import scipy.sparse
+except ImportError:  # scipy is optional, CSRMatrix is used instead
+    scipy = None
+
+try:
+    import numba
+except ImportError:  # numba is optional, the 'numba' engine falls back to NumpyEngine
+    numba = None
+
+prange = numba.prange if numba is not None else range
+
+
+class _EngineFactory:
+    """
+    A factory class for creating stepping engines.
+    Attributes:
+        _engineTypes (dict): A dictionary to store registered engine types.
+    Methods:
+        register(key, name): Registers an engine type with a given key and name.
+        __call__(key, mesh, velocity, dt, **options): Creates and returns an engine of the registered type.
+    """
+    def __init__(self):
+        self._engineTypes = {}
+    def register(self, key, name):
+        self._engineTypes[key] = name
+    def __call__(self, key, mesh, velocity, dt, **options):
+        if key not in self._engineTypes:
+            raise ValueError(f"Unknown engine '{key}', choose one of: {', '.join(available_engines())}")
+        return self._engineTypes[key](mesh, velocity, dt, **options)
+
+
+def face_coefficients(mesh, velocity, dt):
+    """
+    Computes the parts of the upwind flux that do not change between steps.
+    For a face between cells L and R with scaled normal n out of L, the flux is
+    dt * (v_avg . n) * u_upwind, taken from L and given to R, divided by their areas.
+    Args:
+        mesh (Mesh): Mesh with neighbors and faces computed.
+        velocity (array): (N, 2) velocity at every cell midpoint.
+        dt (float): Time step.
+    Returns:
+        tuple: (cells, upwind, coefficients)
+            cells (array): (F, 2) left and right cell of every interior face.
+            upwind (array): (F,) the cell the oil flows out of over every face.
+            coefficients (array): (F, 2) change of the left and right cell per unit of upwind oil.
+    """
+    faces = mesh.get_faces()
+    areas = mesh.get_areas()
+    left, right = faces.cells.T
+
+    v_avg = 0.5 * (velocity[left] + velocity[right])
+    dot_product = np.vecdot(v_avg, faces.normals)
+
+    upwind = np.where(dot_product > 0, left, right)
+    coefficients = np.stack([-dt * dot_product / areas[left], dt * dot_product / areas[right]], axis=1)
+    return faces.cells, upwind, coefficients
+
+
+class NumpyEngine:
+    def __init__(self, mesh, velocity, dt):
+        """
+        Steps all interior faces at once with NumPy array operations.
+        Args:
+            mesh (Mesh): Mesh with neighbors and faces computed.
+            velocity (array): (N, 2) velocity at every cell midpoint.
+            dt (float): Time step.
+        Attributes:
+            _n_cells (int): Number of cells.
+            _upwind (array): (F,) upwind cell of every face.
+            _coefficients (array): (F, 2) flux per unit of upwind oil for the left and right cell.
+            _targets (array): (2F,) the left and right cell of every face, face after face.
+            _block_targets (array): (2F * M,) cell * M + member of every flux of a (N, M) block, see 'step'.
+        """
+        cells, self._upwind, self._coefficients = face_coefficients(mesh, velocity, dt)
+        self._n_cells = len(mesh)
+        self._targets = cells.ravel()
+        self._block_targets = None
+
+
+    def step(self, oil):
+        """
+        Computes the oil after one time step.
+        M states are stepped at once as one (F, 2, M) block of fluxes, scattered with one
+        bincount over cell * M + member. Every state gets exactly the oil it gets on its own.
+        Args:
+            oil (array): (N,) oil amount in every cell, or (N, M) for M states at once.
+        Returns:
+            array: Oil amount after the step, same shape as oil.
+        """
+        if oil.ndim == 2:
+            n_members = oil.shape[1]
+            if self._block_targets is None or len(self._block_targets) != len(self._targets) * n_members:
+                self._block_targets = (self._targets[:, None] * n_members + np.arange(n_members)).ravel()
+            flux = self._coefficients[:, :, None] * oil[self._upwind][:, None, :]
+            change = np.bincount(self._block_targets, weights=flux.ravel(), minlength=self._n_cells * n_members)
+            return oil + change.reshape(self._n_cells, n_members)
+
+        flux = self._coefficients * oil[self._upwind][:, None]
+        return oil + np.bincount(self._targets, weights=flux.ravel(), minlength=self._n_cells)
+
+
+    def advance(self, oil, n_steps):
+        """
+        Computes the oil after n_steps time steps.
+        """
+        for _ in range(n_steps):
+            oil = self.step(oil)
+        return oil
+
+
+    def close(self):
+        """
+        Nothing to free, engines with worker processes stop them here.
+        """
+
+
+def _face_fluxes(oil, upwind, coefficients, flux):
+    """
+    Flux of every face into its left and right cell, flux[f, :, m] = coefficients[f] * oil[upwind[f], m],
+    for (N, M) oil.
+    """
+    for f in range(len(upwind)):
+        for m in range(oil.shape[1]):
+            upwind_oil = oil[upwind[f], m]
+            flux[f, 0, m] = coefficients[f, 0] * upwind_oil
+            flux[f, 1, m] = coefficients[f, 1] * upwind_oil
+
+
+def _cell_update(oil, flux, indptr, entries, new_oil):
+    """
+    Sums the face fluxes of every cell. entries[indptr[i]:indptr[i+1]] are the
+    rows of the (2F, M) flux that belong to cell i, in face order.
+    """
+    n_members = oil.shape[1]
+    flat_flux = flux.reshape(-1, n_members)
+    for i in prange(len(oil)):
+        for m in range(n_members):
+            total_flux = 0.0
+            for k in range(indptr[i], indptr[i + 1]):
+                total_flux += flat_flux[entries[k], m]
+            new_oil[i, m] = oil[i, m] + total_flux
+
+
+if numba is not None:
+    _face_fluxes = numba.njit(cache=True)(_face_fluxes)
+    _cell_update = numba.njit(cache=True, parallel=True)(_cell_update)
+
+
+class NumbaEngine(NumpyEngine):
+    def __init__(self, mesh, velocity, dt):
+        """
+        Steps with loops compiled by numba, over the same face data as NumpyEngine.
+        The cell update gathers the fluxes of each cell instead of scattering them,
+        so the cells can be updated in parallel. Compiled kernels are cached on disk.
+        Args:
+            mesh (Mesh): Mesh with neighbors and faces computed.
+            velocity (array): (N, 2) velocity at every cell midpoint.
+            dt (float): Time step.
+        Attributes:
+            _indptr (array): (N + 1,) start of every cell in _entries.
+            _entries (array): Positions in the flattened (F, 2) flux that belong to each cell.
+            _flux (array): (F, 2, M) flux buffer, made again when M changes.
+        """
+        super().__init__(mesh, velocity, dt)
+        self._entries = np.argsort(self._targets, kind='stable')
+        self._indptr = np.zeros(self._n_cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._targets, minlength=self._n_cells), out=self._indptr[1:])
+        self._flux = np.empty(self._coefficients.shape + (1,))
+
+
+    def step(self, oil):
+        """
+        The kernels work on (N, M) blocks, a single state is a block with one column.
+        """
+        block = np.ascontiguousarray(oil, dtype=float).reshape(len(oil), -1)
+        if self._flux.shape[2] != block.shape[1]:
+            self._flux = np.empty(self._coefficients.shape + (block.shape[1],))
+        new_oil = np.empty_like(block)
+        _face_fluxes(block, self._upwind, self._coefficients, self._flux)
+        _cell_update(block, self._flux, self._indptr, self._entries, new_oil)
+        return new_oil.reshape(oil.shape)
+
+
+def _create_numba_engine(mesh, velocity, dt):
+    """
+    Creates a NumbaEngine, or a NumpyEngine if numba is not installed.
+    """
+    if numba is None:
+        logging.warning("numba is not installed, using the numpy engine instead")
+        return NumpyEngine(mesh, velocity, dt)
+    return NumbaEngine(mesh, velocity, dt)
+
+
+class CSRMatrix:
+    def __init__(self, indptr, indices, data, shape):
+        """
+        A small compressed sparse row matrix, used when scipy is not installed.
+        Args:
+            indptr (array): (n_rows + 1,) start of every row in indices and data.
+            indices (array): Column of every stored value.
+            data (array): The stored values.
+            shape (tuple): (n_rows, n_cols)
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape):
+        """
+        Builds the matrix from (row, col, value) triplets. Duplicate entries are summed.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+
+        order = np.lexsort((cols, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(first)
+        data = np.add.reduceat(values, starts) if len(values) else values
+
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[starts], minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols[starts], data, shape)
+
+
+    def __matmul__(self, x):
+        """
+        Multiplies the matrix with a vector (n_cols,) or a block of vectors (n_cols, M).
+        """
+        products = self.data.reshape((-1,) + (1,) * (x.ndim - 1)) * x[self.indices]
+        result = np.zeros((self.shape[0],) + x.shape[1:])
+        filled = self.indptr[:-1] < self.indptr[1:]
+        if len(products):
+            result[filled] = np.add.reduceat(products, self.indptr[:-1][filled], axis=0)
+        return result
+
+
+    def transpose(self):
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        return CSRMatrix.from_coo(self.indices, rows, self.data, self.shape[::-1])
+
+    T = property(transpose)
+
+
+def assemble_operator(mesh, velocity, dt):
+    """
+    Assembles the matrix A of one time step, so that oil after the step is A @ oil.
+    The velocity does not change with time and the upwind flux is linear in the oil,
+    so A is the same for every step: the identity plus the face coefficients put
+    in the column of the upwind cell.
+    Args:
+        mesh (Mesh): Mesh with neighbors and faces computed.
+        velocity (array): (N, 2) velocity at every cell midpoint.
+        dt (float): Time step.
+    Returns:
+        scipy.sparse.csr_matrix or CSRMatrix: (N, N) step operator, CSRMatrix if scipy is missing.
+    """
+    cells, upwind, coefficients = face_coefficients(mesh, velocity, dt)
+    n = len(mesh)
+    diagonal = np.arange(n)
+
+    rows = np.concatenate([diagonal, cells.ravel()])
+    cols = np.concatenate([diagonal, np.repeat(upwind, 2)])
+    values = np.concatenate([np.ones(n), coefficients.ravel()])
+
+    if scipy is None:
+        return CSRMatrix.from_coo(rows, cols, values, (n, n))
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+
+
+class SparseEngine:
+    def __init__(self, mesh, velocity, dt):
+        """
+        Steps with a sparse matrix assembled once, one matrix-vector product per step.
+        Args:
+            mesh (Mesh): Mesh with neighbors and faces computed.
+            velocity (array): (N, 2) velocity at every cell midpoint.
+            dt (float): Time step.
+        Attributes:
+            operator: (N, N) step operator from 'assemble_operator'.
+        """
+        self.operator = assemble_operator(mesh, velocity, dt)
+
+
+    def step(self, oil):
+        return self.operator @ oil
+
+
+    def advance(self, oil, n_steps):
+        """
+        Computes the oil after n_steps time steps in one call.
+        """
+        operator = self.operator
+        for _ in range(n_steps):
+            oil = operator @ oil
+        return oil
+
+
+    def close(self):
+        pass
+
+
+def _create_parallel_engine(mesh, velocity, dt, workers=None):
+    """
+    Creates a 'parallel.ParallelEngine', imported here since it builds on this module.
+    """
+    from .parallel import ParallelEngine
+    return ParallelEngine(mesh, velocity, dt, workers)
+
+
+def available_engines():
+    return list(_engines._engineTypes)
+
+
+_engines = _EngineFactory()
+_engines.register('numpy', NumpyEngine)
+_engines.register('sparse', SparseEngine)
+_engines.register('numba', _create_numba_engine)
+_engines.register('parallel', _create_parallel_engine)
+
+
+def create_engine(key, mesh, velocity, dt, **options):
+    """
+    Creates the engine registered under key. See '_EngineFactory'.
+    Options, like the number of workers of 'parallel', are passed on to the engine.
+    """
+    return _engines(key, mesh, velocity, dt, **options)
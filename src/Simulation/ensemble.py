@@ -0,0 +1,107 @@
+from .Simulator import gaussian_release, read_state_file, REFERENCE_ENGINE
+from pathlib import Path
+import numpy as np
+
+
+class EnsembleMember:
+    def __init__(self, source=None, restartFile=None):
+        """
+        One initial condition of an ensemble, either a release at a source point
+        or the state in a restart file.
+        Args:
+            source (tuple): (x, y) center of a gaussian release like the default spill.
+            restartFile (str): Path to a state file.
+        Attributes:
+            name (str): Label used for the member in the output.
+        """
+        if (source is None) == (restartFile is None):
+            raise ValueError("An ensemble member needs either a source or a restartFile")
+        self.source = source
+        self.restartFile = restartFile
+        if source is not None:
+            self.name = f"source_{source[0]:g}_{source[1]:g}"
+        else:
+            self.name = Path(restartFile).stem
+
+
+    def initial_state(self, mesh):
+        """
+        Returns:
+            array: (N,) oil amount in every cell of the mesh at the start.
+        """
+        if self.source is not None:
+            return gaussian_release(mesh.get_midpoints(), self.source)
+        try:
+            return read_state_file(self.restartFile, mesh.get_cell_positions())
+        except Exception as e:
+            raise RuntimeError(f"Failed to load restart file {self.restartFile}: {e}")
+
+
+class Ensemble:
+    def __init__(self, sim, members, memoryBudgetMB=1024):
+        """
+        Advances many initial conditions together on the mesh, time step and engine of one simulator.
+        The state is an (N, M) array and each step advances all M members at once.
+        Members are run in chunks so the states fit in the memory budget.
+        Args:
+            sim (simulator): Simulator giving the mesh, dt, engine and fishing grounds.
+            members (list): List of EnsembleMember.
+            memoryBudgetMB (float): Memory the member states may use, in megabytes.
+        """
+        if sim.engine == REFERENCE_ENGINE:
+            raise ValueError("Ensembles need an array engine, not 'reference'")
+        self.sim = sim
+        self.members = members
+        self.memoryBudgetMB = memoryBudgetMB
+
+
+    def chunk_size(self):
+        """
+        Number of members that are advanced together.
+        Each member needs about four cell-sized and four face-sized arrays of
+        float64 while stepping: the state, the next state and the temporaries
+        of the engine.
+        """
+        n_cells = len(self.sim.mesh)
+        n_faces = len(self.sim.mesh.get_faces())
+        bytes_per_member = 8 * (4 * n_cells + 4 * n_faces)
+        return max(1, int(self.memoryBudgetMB * 1024**2 // bytes_per_member))
+
+
+    def run(self):
+        """
+        Runs all members from tStart to tEnd with the same time loop as a single simulation.
+        Returns:
+            tuple: (times, fishing_grounds)
+                times (array): (T,) times the fishing grounds were computed at.
+                fishing_grounds (array): (T, M) oil in the fishing grounds for every member.
+        """
+        sim = self.sim
+        mesh = sim.mesh
+        engine = sim._get_engine()
+        weights = sim.get_fishing_weights()
+        chunk = self.chunk_size()
+
+        times = sim.get_times()
+        fishing_grounds = np.empty((len(times), len(self.members)))
+        for start in range(0, len(self.members), chunk):
+            members = self.members[start:start + chunk]
+            oil = np.column_stack([member.initial_state(mesh) for member in members])
+            for i in range(len(times)):
+                fishing_grounds[i, start:start + len(members)] = weights @ oil
+                if i + 1 < len(times):
+                    oil = engine.step(oil)
+        return np.array(times), fishing_grounds
+
+
+def write_fishing_grounds(path, times, fishing_grounds, members):
+    """
+    Writes the fishing ground time series as csv, one column per member.
+    Args:
+        path (Path): File to write.
+        times (array): (T,) times.
+        fishing_grounds (array): (T, M) oil in the fishing grounds.
+        members (list): List of EnsembleMember, gives the column names.
+    """
+    header = ",".join(["time"] + [member.name for member in members])
+    np.savetxt(path, np.column_stack([times, fishing_grounds]), delimiter=",", header=header, comments="")
@@ -0,0 +1,267 @@
+import numpy as np
+
+# Number of nodes of the Gmsh element types, to read past the blocks that are not kept
+ELEMENT_NODES = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9, 11: 10, 12: 27,
+                 13: 18, 14: 14, 15: 1, 16: 8, 17: 20, 18: 15, 19: 13, 20: 9, 21: 10, 22: 12,
+                 23: 15, 24: 15, 25: 21, 26: 4, 27: 5, 28: 6, 29: 20, 30: 35, 31: 56}
+LINE = 1
+TRIANGLE = 2
+# Rows read at a time, so a block never needs more than one chunk of text or bytes in memory
+CHUNK_ROWS = 1 << 16
+
+
+def is_gmsh41(mshname):
+    """
+    Checks if a file is a Gmsh mesh in format 4.1, ASCII or binary.
+    """
+    with open(mshname, 'rb') as f:
+        return f.readline().strip() == b'$MeshFormat' and f.readline().split()[:1] == [b'4.1']
+
+
+class _Reader:
+    def __init__(self, f, binary, data_size):
+        """
+        Reads the numbers of a Gmsh 4.1 file, as text or as raw bytes.
+        Args:
+            f (file): The file, opened in binary mode.
+            binary (bool): If the file is binary.
+            data_size (int): Size of size_t in the file.
+        Attributes:
+            size_t (dtype): Type of the counts and tags.
+        """
+        self._f = f
+        self._sep = '' if binary else ' '
+        self.binary = binary
+        self.size_t = np.dtype(f"u{data_size}")
+
+
+    def read(self, dtype, count):
+        """
+        Reads count numbers of type dtype.
+        Raises:
+            ValueError: If the file ends first.
+        """
+        values = np.fromfile(self._f, dtype=dtype, count=count, sep=self._sep)
+        if len(values) != count:
+            raise ValueError(f"The mesh file {self._f.name} ends in the middle of a section")
+        return values
+
+
+    def rows(self, dtype, n_rows, width):
+        """
+        Reads n_rows rows of width numbers, yielding them as (rows, width) arrays of at most CHUNK_ROWS rows.
+        """
+        for start in range(0, n_rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, n_rows - start)
+            yield start, self.read(dtype, count * width).reshape(count, width)
+
+
+    def skip(self, dtype, count):
+        """
+        Reads past count numbers of type dtype.
+        """
+        if self.binary:
+            self._f.seek(count * np.dtype(dtype).itemsize, 1)
+        else:
+            for _ in self.rows(dtype, count, 1):
+                pass
+
+
+    def end_section(self, name):
+        """
+        Reads up to and including the $End line of the section.
+        """
+        end = b'$End' + name
+        for line in self._f:
+            if line.strip() == end:
+                return
+        raise ValueError(f"The mesh file {self._f.name} has no {end.decode()}")
+
+
+def _read_entities(reader):
+    """
+    Reads past the $Entities section. In binary files its length is only known by reading it.
+    """
+    if not reader.binary:
+        return
+    counts = reader.read(reader.size_t, 4)
+    for dim, count in enumerate(counts.tolist()):
+        for _ in range(count):
+            reader.read(np.int32, 1)  # tag
+            reader.read(np.float64, 3 if dim == 0 else 6)  # point or bounding box
+            reader.skip(np.int32, int(reader.read(reader.size_t, 1)[0]))  # physical tags
+            if dim > 0:
+                reader.skip(np.int32, int(reader.read(reader.size_t, 1)[0]))  # bounding entities
+
+
+def _read_nodes(reader):
+    """
+    Reads the $Nodes section into one array of points, in the order of the file.
+    Returns:
+        tuple: (points, indices)
+            points (array): (P, 3) point coordinates.
+            indices (array): Index in points of every node tag, -1 for tags that are not used.
+    """
+    n_blocks, n_nodes, _, max_tag = reader.read(reader.size_t, 4).tolist()
+    points = np.empty((n_nodes, 3))
+    indices = np.full(max_tag + 1, -1, dtype=np.int64)
+    first = 0
+    for _ in range(n_blocks):
+        dim, _, parametric = reader.read(np.int32, 3).tolist()
+        count = int(reader.read(reader.size_t, 1)[0])
+        if first + count > n_nodes:
+            raise ValueError(f"The $Nodes section of {reader._f.name} has more nodes than its header says")
+        for start, tags in reader.rows(reader.size_t, count, 1):
+            indices[tags[:, 0]] = np.arange(first + start, first + start + len(tags))
+        width = 3 + (dim if parametric else 0)  # parametric nodes also have dim parametric coordinates
+        for start, xyz in reader.rows(np.float64, count, width):
+            points[first + start:first + start + len(xyz)] = xyz[:, :3]
+        first += count
+    return points[:first], indices
+
+
+def _read_elements(reader, indices):
+    """
+    Reads the triangles and lines of the $Elements section, the other element blocks are read past.
+    Returns:
+        tuple: (triangles, lines) point indices of every triangle and line, in the order of the file.
+    """
+    n_blocks = int(reader.read(reader.size_t, 4)[0])
+    kept = {TRIANGLE: [], LINE: []}
+    for _ in range(n_blocks):
+        _, _, element_type = reader.read(np.int32, 3).tolist()
+        count = int(reader.read(reader.size_t, 1)[0])
+        if element_type not in ELEMENT_NODES:
+            raise ValueError(f"The mesh file {reader._f.name} has elements of unknown type {element_type}")
+        width = 1 + ELEMENT_NODES[element_type]  # the element tag, then its nodes
+        if element_type not in kept:
+            reader.skip(reader.size_t, count * width)
+            continue
+        block = np.empty((count, width - 1), dtype=np.int64)
+        for start, rows in reader.rows(reader.size_t, count, width):
+            tags = rows[:, 1:]
+            if tags.size and tags.max() >= len(indices):
+                raise ValueError(f"The mesh file {reader._f.name} has elements with unknown nodes")
+            block[start:start + len(rows)] = indices[tags]
+        if np.any(block < 0):
+            raise ValueError(f"The mesh file {reader._f.name} has elements with unknown nodes")
+        kept[element_type].append(block)
+
+    triangles, lines = [np.concatenate(blocks) if len(blocks) > 1 else blocks[0] if blocks
+                        else np.empty((0, n), dtype=np.int64) for blocks, n in ((kept[TRIANGLE], 3), (kept[LINE], 2))]
+    return triangles, lines
+
+
+def read_gmsh41(mshname):
+    """
+    Reads the points, triangles and lines of a Gmsh 4.1 mesh file, ASCII or binary.
+    The $Nodes and $Elements sections are read in chunks straight into the arrays,
+    and element blocks other than triangles and lines are read past, so besides the
+    result only one chunk is held in memory. Points and triangles come in the order of
+    the file, the same as 'meshio.read' gives them.
+    Args:
+        mshname (str): The name of the mesh file to read.
+    Returns:
+        tuple: (points, triangles, lines)
+            points (array): (P, 3) point coordinates.
+            triangles (array): (N, 3) point indices of every triangle.
+            lines (array): (L, 2) point indices of every line.
+    Raises:
+        ValueError: If the file is not a Gmsh 4.1 mesh, or it is broken.
+    """
+    with open(mshname, 'rb') as f:
+        if f.readline().strip() != b'$MeshFormat':
+            raise ValueError(f"{mshname} is not a Gmsh mesh file")
+        header = f.readline().split()
+        if len(header) != 3 or header[0] != b'4.1':
+            raise ValueError(f"{mshname} is not in Gmsh format 4.1")
+        binary, data_size = header[1] == b'1', int(header[2])
+        if binary and np.fromfile(f, dtype=np.int32, count=1).tolist() != [1]:
+            raise ValueError(f"{mshname} is a binary mesh with a different byte order")
+        reader = _Reader(f, binary, data_size)
+        reader.end_section(b'MeshFormat')
+
+        points = indices = None
+        for line in f:
+            section = line.strip()
+            if not section:
+                continue
+            if not section.startswith(b'$'):
+                raise ValueError(f"Unexpected line {section[:40]!r} in {mshname}")
+            name = section[1:]
+            if name == b'Entities':
+                _read_entities(reader)
+            elif name == b'Nodes':
+                points, indices = _read_nodes(reader)
+            elif name == b'Elements':
+                if indices is None:
+                    raise ValueError(f"The $Elements of {mshname} come before its $Nodes")
+                return (points, *_read_elements(reader, indices))
+            reader.end_section(name)
+    raise ValueError(f"{mshname} has no $Elements section")
+
+
+def _write_rows(f, rows, binary, dtype, fmt):
+    """
+    Writes the rows of an array in chunks of CHUNK_ROWS rows, as raw bytes or as text lines.
+    """
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = np.ascontiguousarray(rows[start:start + CHUNK_ROWS], dtype=dtype)
+        if binary:
+            chunk.tofile(f)
+        else:
+            np.savetxt(f, chunk, fmt=fmt)
+
+
+def write_gmsh41(mshname, points, triangles, lines, binary=True):
+    """
+    Writes points, triangles and lines as a Gmsh 4.1 mesh file that 'read_gmsh41' and meshio can read.
+    All nodes are in one block, then one block of lines and one of triangles.
+    Nodes and elements are numbered from 1 in the order of the arrays, lines first.
+    Args:
+        mshname (str): The name of the mesh file to write.
+        points (array): (P, 3) point coordinates.
+        triangles (array): (N, 3) point indices of every triangle.
+        lines (array): (L, 2) point indices of every line.
+        binary (bool): Write the binary variant, else ASCII.
+    """
+    n_points, n_lines, n_triangles = len(points), len(lines), len(triangles)
+    size_t = np.uint64
+
+    def header(n_blocks, count):
+        values = np.array([n_blocks, count, min(1, count), count], dtype=size_t)  # min and max tag last
+        if binary:
+            values.tofile(f)
+        else:
+            f.write((' '.join(str(v) for v in values.tolist()) + '\n').encode())
+
+    def block(dim, kind, count):
+        if binary:
+            np.array([dim, 1, kind], dtype=np.int32).tofile(f)
+            np.array([count], dtype=size_t).tofile(f)
+        else:
+            f.write(f"{dim} 1 {kind} {count}\n".encode())
+
+    def elements(connectivity, first):
+        tags = np.arange(first, first + len(connectivity), dtype=np.int64)[:, None]
+        for start in range(0, len(connectivity), CHUNK_ROWS):
+            chunk = np.hstack([tags[start:start + CHUNK_ROWS], connectivity[start:start + CHUNK_ROWS] + 1])
+            _write_rows(f, chunk, binary, size_t, '%d')
+
+    with open(mshname, 'wb') as f:
+        f.write(f"$MeshFormat\n4.1 {int(binary)} 8\n".encode())
+        if binary:
+            np.array([1], dtype=np.int32).tofile(f)
+            f.write(b"\n")
+        f.write(b"$EndMeshFormat\n$Nodes\n")
+        header(1, n_points)
+        block(2, 0, n_points)  # not parametric
+        _write_rows(f, np.arange(1, n_points + 1)[:, None], binary, size_t, '%d')
+        _write_rows(f, points, binary, np.float64, '%.17g')
+        f.write(b"\n$EndNodes\n$Elements\n" if binary else b"$EndNodes\n$Elements\n")
+        header(2, n_lines + n_triangles)
+        block(1, LINE, n_lines)
+        elements(lines, 1)
+        block(2, TRIANGLE, n_triangles)
+        elements(triangles, n_lines + 1)
+        f.write(b"\n$EndElements\n" if binary else b"$EndElements\n")
@@ -0,0 +1,176 @@
+from .adjoint import exposure_maps
+from pathlib import Path
+import numpy as np
+import hashlib
+
+
+def library_key(sim):
+    """
+    A hash of everything the responses depend on: the mesh, the velocity field,
+    the time step and the fishing grounds. A library with another key is out of date.
+    Args:
+        sim (simulator): The simulator the library is for.
+    Returns:
+        str: Hex digest.
+    """
+    h = hashlib.sha1()
+    for array in (sim.mesh._points[:, :2], sim.mesh.get_connectivity(),
+                  sim.get_velocity_field(), np.array([sim.dt]), sim.get_fishing_weights()):
+        h.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+class GreensLibrary:
+    def __init__(self, key, dt, sources, fishing, state_steps=None, states=None):
+        """
+        Responses to a unit release in each of a set of source cells. The transport is
+        linear and does not change with time, so any spill made of releases in these cells
+        is the weighted sum of their responses, shifted to the time of the spill.
+        A unit release is one unit of oil in the cell, like in 'adjoint.exposure_maps'.
+        Args:
+            key (str): 'library_key' of the simulator the responses come from.
+            dt (float): Time step.
+            sources (array): (S,) source cell ids, as in the mesh file.
+            fishing (array): (T, S) oil in the fishing grounds after 0, 1, ..., T-1 steps.
+            state_steps (array): (K,) steps the states are stored at, or None.
+            states (array): (K, N, S) float32 oil in every cell at those steps, by cell id, or None.
+        """
+        self.key = key
+        self.dt = dt
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.fishing = fishing
+        self.state_steps = state_steps
+        self.states = states
+        self._columns = {int(cell): column for column, cell in enumerate(self.sources)}
+
+
+    @classmethod
+    def build(cls, sim, sources=None, state_stride=0, memoryBudgetMB=1024):
+        """
+        Computes the responses from the current time of sim to tEnd.
+        The fishing ground responses of all sources come from one adjoint run.
+        States need a forward run of the sources, done in chunks that fit the memory budget.
+        Args:
+            sim (simulator): Simulator giving the mesh, dt, engine and fishing grounds.
+            sources (list): Source cell ids, None for every cell.
+            state_stride (int): Store the states every state_stride steps, 0 stores none.
+            memoryBudgetMB (float): Memory the forward states may use, in megabytes.
+        Returns:
+            GreensLibrary: The new library.
+        """
+        n_cells = len(sim.mesh)
+        sources = np.arange(n_cells) if sources is None else np.asarray(sources, dtype=np.int64)
+        if len(sources) and (sources.min() < 0 or sources.max() >= n_cells):
+            raise ValueError(f"Source cells must be between 0 and {n_cells - 1}")
+        positions = sim.mesh.get_cell_positions()
+        rows = positions[sources]
+
+        fishing = np.array([exposure[rows] for _, exposure in exposure_maps(sim)])
+
+        state_steps = states = None
+        if state_stride:
+            n_steps = len(fishing)
+            state_steps = np.arange(0, n_steps, state_stride)
+            states = np.empty((len(state_steps), n_cells, len(sources)), dtype=np.float32)
+
+            engine = sim._get_engine()
+            areas = sim.mesh.get_areas()
+            chunk = max(1, int(memoryBudgetMB * 1024**2 // (8 * 3 * n_cells)))
+            for start in range(0, len(sources), chunk):
+                cells = rows[start:start + chunk]
+                oil = np.zeros((n_cells, len(cells)))
+                oil[cells, np.arange(len(cells))] = 1.0 / areas[cells]
+                for i, step in enumerate(state_steps):
+                    if i > 0:
+                        oil = engine.advance(oil, step - state_steps[i - 1])
+                    states[i, :, start:start + len(cells)] = oil[positions]
+
+        return cls(library_key(sim), sim.dt, sources, fishing, state_steps, states)
+
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            has_states = 'states' in data
+            return cls(str(data['key']), float(data['dt']), data['sources'], data['fishing'],
+                       data['state_steps'] if has_states else None,
+                       data['states'] if has_states else None)
+
+
+    def save(self, path):
+        """
+        Writes the library as a compressed .npz file.
+        """
+        arrays = dict(key=self.key, dt=self.dt, sources=self.sources, fishing=self.fishing)
+        if self.states is not None:
+            arrays.update(state_steps=self.state_steps, states=self.states)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+
+    def _weights(self, releases):
+        """
+        Turns {source cell: amount of oil} into one weight per library column.
+        """
+        weights = np.zeros(len(self.sources))
+        for cell, amount in releases.items():
+            if int(cell) not in self._columns:
+                raise KeyError(f"Cell {cell} is not a source in the library")
+            weights[self._columns[int(cell)]] += amount
+        return weights
+
+
+    def query(self, releases, tStart=0.0):
+        """
+        Oil in the fishing grounds for a spill, without running a simulation.
+        Args:
+            releases (dict): Amount of oil released in each source cell, {cell: amount}.
+            tStart (float): Time of the release.
+        Returns:
+            tuple: (times, fishing) arrays with the time and the oil in the fishing grounds.
+        """
+        times = tStart + self.dt * np.arange(len(self.fishing))
+        return times, self.fishing @ self._weights(releases)
+
+
+    def query_states(self, releases, tStart=0.0):
+        """
+        Oil in every cell for a spill, at the stored steps.
+        Args:
+            releases (dict): Amount of oil released in each source cell, {cell: amount}.
+            tStart (float): Time of the release.
+        Returns:
+            tuple: (times, states) with states an (K, N) array.
+        """
+        if self.states is None:
+            raise ValueError("The library has no states, build it with a state_stride")
+        times = tStart + self.dt * self.state_steps
+        return times, self.states @ self._weights(releases).astype(np.float32)
+
+
+def load_or_build(path, sim, sources=None, state_stride=0, memoryBudgetMB=1024):
+    """
+    Loads the library at path, or builds and saves it if it is missing or out of date,
+    for example after the mesh, velocity field or dt changed.
+    Args:
+        path (str): Path of the .npz library.
+        sim (simulator): Simulator the library is for.
+        sources, state_stride, memoryBudgetMB: See 'GreensLibrary.build'.
+    Returns:
+        tuple: (library, built) where built is True if the library was (re)built.
+    """
+    path = Path(path)
+    if path.exists():
+        library = GreensLibrary.load(path)
+        wanted_sources = np.arange(len(sim.mesh)) if sources is None else np.asarray(sources)
+        long_enough = len(library.fishing) >= len(sim.get_times())
+        has_states = not state_stride or (
+            library.states is not None and
+            np.array_equal(library.state_steps, np.arange(0, len(library.fishing), state_stride)))
+        if (library.key == library_key(sim) and np.array_equal(library.sources, wanted_sources)
+                and long_enough and has_states):
+            return library, False
+
+    library = GreensLibrary.build(sim, sources, state_stride, memoryBudgetMB)
+    library.save(path)
+    return library, True
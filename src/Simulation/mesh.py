@@ -1,5 +1,77 @@
-from .cells import Triangle, Line
-import meshio
+from .cells import Triangle, TriangleView, Line, compute_triangle_geometry
+from .topology import build_neighbor_table, cell_order, FaceTable
+from .gmsh import is_gmsh41, read_gmsh41
+from pathlib import Path
+import numpy as np
+import functools
+import hashlib
+import logging
+import shutil
+import os
+
+CACHE_DIR = '.meshcache'
+COMPILED_VERSION = 1
+# Arrays of a compiled mesh: Mesh attributes without their underscore, and the FaceTable attributes
+COMPILED_ARRAYS = ('points', 'line_connectivity', 'connectivity', 'cell_ids', 'cell_positions',
+                   'midpoints', 'areas', 'scaled_normals', 'neighbors')
+COMPILED_FACES = ('cells', 'edges', 'normals', 'boundary')
+
+
+@functools.lru_cache(maxsize=None)
+def _file_hash(path, size, mtime):
+    """
+    Hash of the content of a file. Cached while its size and modification time stay the same,
+    so a mesh is only read once to find its cache files.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def cache_path(mshname, suffix):
+    """
+    Path of a file computed from a mesh file, in the .meshcache folder next to the mesh.
+    The name holds a hash of the content of the mesh file, so a changed mesh gets new files.
+    Args:
+        mshname (str): The name of the mesh file.
+        suffix (str): What the file holds, for example 'part4.npz'.
+    Returns:
+        Path: <mesh folder>/.meshcache/<mesh stem>-<hash>.<suffix>
+    """
+    path = Path(mshname)
+    stat = path.stat()
+    digest = _file_hash(str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    return path.parent / CACHE_DIR / f"{path.stem}-{digest}.{suffix}"
+
+
+def read_msh(mshname):
+    """
+    Reads the points, triangles and lines of a mesh file. Gmsh 4.1 files are read
+    with 'gmsh.read_gmsh41', other formats with meshio.
+    meshio is imported here, so runs that read Gmsh 4.1 or load a compiled mesh never import it.
+    Args:
+        mshname (str): The name of the mesh file to read.
+    Returns:
+        tuple: (points, triangles, lines)
+            points (array): (P, 3) point coordinates.
+            triangles (array): (N, 3) point indices of every triangle, in the order of the file.
+            lines (array): (L, 2) point indices of every line.
+    """
+    if is_gmsh41(mshname):
+        return read_gmsh41(mshname)
+
+    import meshio
+    msh = meshio.read(mshname)
+
+    blocks = {'triangle': [], 'line': []}
+    for CellForType in msh.cells:
+        if CellForType.type in blocks:
+            blocks[CellForType.type].append(CellForType.data)
+    triangles = np.concatenate(blocks['triangle'] or [np.empty((0, 3))]).astype(np.int64)
+    lines = np.concatenate(blocks['line'] or [np.empty((0, 2))]).astype(np.int64)
+    return msh.points, triangles, lines
 
 
 class _CellFactory:
@@ -21,51 +93,190 @@ class _CellFactory:
 
 
 class Mesh:
-    def __init__(self,mshname):
+    def __init__(self,mshname, ordering=None, compiled=True):
         """
         Initializes the mesh object by reading mesh data from a file and creating
-        line and triangle cells from 'Cell'.
+        line cells from 'Cell'. Triangles are stored as contiguous arrays,
+        one row per triangle, and are only turned into 'TriangleView' objects on request.
+        The rows can be put in an order that keeps neighbors close in memory. Cells keep
+        the id they have in the file, which is what state files use.
+        Reading the file is slow, so the first time the arrays, neighbors and faces are
+        written to a compiled mesh, a folder of .npy files in .meshcache next to the file.
+        Afterwards they are memory mapped from there without reading the file.
         Args:
             mshname (str): The name of the mesh file to read.
+            ordering (str): None to keep the order of the file, 'rcm' or 'hilbert', see 'topology.cell_order'.
+            compiled (bool): Load the compiled mesh if there is one, and write it if not.
         Attributes:
+            _mshname (str): The name of the mesh file.
+            _ordering (str): The ordering of the rows, None for the order of the file.
             _points (array): points from the mesh file.
+            _line_connectivity (array): (L, 2) point indices of every line.
             _lines (list): List of line cells created from the mesh file.
-            _triangles (list): List of triangle cells created from the mesh file.
+            _connectivity (array): (N, 3) point indices of every triangle.
+            _cell_ids (array): (N,) id in the mesh file of every row.
+            _cell_positions (array): (N,) row of every cell id, the inverse of _cell_ids.
+            _midpoints (array): (N, 2) midpoint of every triangle.
+            _areas (array): (N,) area of every triangle.
+            _scaled_normals (array): (N, 3, 2) outward normals scaled by edge length.
+            _neighbors (array): (N, 3) neighbor across each edge, -1 on the boundary.
+                None until 'compute_neighbors' is called.
+            _faces (FaceTable): Interior and boundary faces. None until 'compute_neighbors' is called.
+            _oil_amounts (array): (N,) oil amount in every triangle.
+            _triangles (list): Cached list of triangle views, None until requested.
         """
-        msh = meshio.read(mshname)
-        self._points = msh.points
-        
+        self._mshname = mshname
+        self._ordering = ordering
+        compiled_path = cache_path(mshname, f"{ordering or 'unordered'}.mesh{COMPILED_VERSION}") if compiled else None
+        if compiled_path is not None and compiled_path.is_dir():
+            self._load_compiled(compiled_path)
+        else:
+            self._read(mshname, ordering)
+            if compiled_path is not None:
+                self.compute_neighbors()
+                self._save_compiled(compiled_path)
+
         cf = _CellFactory()
         cf.register('line', Line)
-        cf.register('triangle', Triangle)
 
         self._lines = []
-        self._triangles = []
-        for CellForType in msh.cells:
-            cellType = CellForType.type
-            if cellType not in cf._cellTypes:
-                continue
-            cellPoints = CellForType.data
-            for point_indices in cellPoints:
-                idx = len(self._triangles) if cellType == 'triangle' else len(self._lines)
-                points = self._points[point_indices][:, :2]  # removes z-coordinates
-
-                cell = cf(cellType, point_indices, idx, points)
-                
-                if cellType == 'triangle':
-                    self._triangles.append(cell)
-                else:
-                    self._lines.append(cell)
+        for point_indices in self._line_connectivity:
+            idx = len(self._lines)
+            points = self._points[point_indices][:, :2]  # removes z-coordinates
+
+            self._lines.append(cf('line', point_indices, idx, points))
+
+        self._oil_amounts = np.zeros(len(self._connectivity))
+        self._triangles = None
+
+
+    def _read(self, mshname, ordering):
+        """
+        Reads the mesh file and computes the triangle geometry, see 'read_msh'.
+        All triangles are handled together, one row per triangle.
+        """
+        self._points, self._connectivity, self._line_connectivity = read_msh(mshname)
+        self._cell_ids = np.arange(len(self._connectivity))
+        if ordering is not None:
+            self._cell_ids = cell_order(self._points, self._connectivity, ordering)
+            self._connectivity = self._connectivity[self._cell_ids]
+        self._cell_positions = np.argsort(self._cell_ids)
+        self._midpoints, self._areas, self._scaled_normals = compute_triangle_geometry(self._points, self._connectivity)
+        self._neighbors = None
+        self._faces = None
+
+
+    def _load_compiled(self, path):
+        """
+        Memory maps the arrays of a compiled mesh, they are read from disk when they are used.
+        They are kept as plain arrays on the mapping, indexing an np.memmap is many times slower
+        and the reference engine and triangle views index them one cell at a time.
+        """
+        for name in COMPILED_ARRAYS:
+            setattr(self, f"_{name}", np.asarray(np.load(path / f"{name}.npy", mmap_mode='r')))
+        self._faces = FaceTable.from_arrays(
+            *[np.asarray(np.load(path / f"face_{name}.npy", mmap_mode='r')) for name in COMPILED_FACES])
+
+
+    def _save_compiled(self, path):
+        """
+        Writes the compiled mesh. The files go to a temporary folder that is renamed when
+        it is complete, so other runs never see half a compiled mesh.
+        A mesh that can not be written is only logged, the run goes on without it.
+        """
+        arrays = {name: getattr(self, f"_{name}") for name in COMPILED_ARRAYS}
+        arrays.update({f"face_{name}": getattr(self._faces, name) for name in COMPILED_FACES})
+
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            temporary.mkdir(parents=True, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(temporary / f"{name}.npy", array)
+            os.replace(temporary, path)
+        except OSError as e:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not path.is_dir():  # another run may have written it first
+                logging.warning(f"Could not write the compiled mesh {path}: {e}")
+
+
+    def __len__(self):
+        return len(self._connectivity)
 
 
     def get_triangles(self):
+        """
+        Returns the triangles as a list of 'TriangleView' objects.
+        The views are created on the first call and reused afterwards.
+        """
+        if self._triangles is None:
+            self._triangles = [TriangleView(self, row) for row in range(len(self))]
         return self._triangles
 
 
+    def get_points(self):
+        return self._points
+
+
+    def get_connectivity(self):
+        return self._connectivity
+
+
+    def get_line_connectivity(self):
+        return self._line_connectivity
+
+
+    def get_cell_ids(self):
+        return self._cell_ids
+
+
+    def get_cell_positions(self):
+        return self._cell_positions
+
+
+    def get_midpoints(self):
+        return self._midpoints
+
+
+    def get_areas(self):
+        return self._areas
+
+
+    def get_scaled_normals(self):
+        return self._scaled_normals
+
+
+    def get_neighbor_table(self):
+        return self._neighbors
+
+
+    def get_faces(self):
+        return self._faces
+
+
+    def get_oil_amounts(self):
+        return self._oil_amounts
+
+
+    def get_ordering(self):
+        return self._ordering
+
+
+    def get_cache_path(self, suffix):
+        """
+        Path of a file computed from this mesh, see 'cache_path'.
+        """
+        return cache_path(self._mshname, suffix)
+
+
     def compute_neighbors(self):
         """
         Computes the neighbors for each cell in the mesh.
-        Takes every cell in mesh and calls 'compute_neighbors'
+        Hashes the edges of all triangles once with 'build_neighbor_table',
+        column k of the table is the neighbor across edge k of the triangle.
+        The face table is built from the neighbor table at the same time.
+        Nothing is done if they are already there, like in a compiled mesh.
         """
-        for cell in self._triangles:
-            cell.compute_neighbors(self._triangles)
\ No newline at end of file
+        if self._neighbors is not None:
+            return
+        self._neighbors = build_neighbor_table(self._connectivity)
+        self._faces = FaceTable(self._neighbors, self._scaled_normals)
\ No newline at end of file
@@ -0,0 +1,136 @@
+from .gmsh import write_gmsh41
+from .mesh import Mesh, read_msh
+from pathlib import Path
+import numpy as np
+import argparse
+
+
+def unit_square(n):
+    """
+    A structured triangulation of the unit square, n by n squares each cut in two along a diagonal.
+    Args:
+        n (int): Number of squares along each side.
+    Returns:
+        tuple: (points, triangles, lines)
+            points (array): ((n + 1)^2, 3) point coordinates, row by row from (0, 0).
+            triangles (array): (2n^2, 3) counterclockwise point indices of every triangle.
+            lines (array): (4n, 2) point indices of the boundary edges, counterclockwise.
+    Raises:
+        ValueError: If n is not positive.
+    """
+    if n < 1:
+        raise ValueError(f"A unit square needs at least one square per side, not {n}")
+    x, y = np.meshgrid(np.linspace(0.0, 1.0, n + 1), np.linspace(0.0, 1.0, n + 1))
+    points = np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size)])
+
+    corner = (np.arange(n)[:, None] * (n + 1) + np.arange(n)).ravel()  # lower left corner of every square
+    right, up = corner + 1, corner + n + 1
+    triangles = np.empty((2 * len(corner), 3), dtype=np.int64)
+    triangles[0::2] = np.column_stack([corner, right, up + 1])
+    triangles[1::2] = np.column_stack([corner, up + 1, up])
+
+    side = np.arange(n)
+    boundary = np.concatenate([side, n + side * (n + 1), n * (n + 1) + n - side, (n - side) * (n + 1)])
+    lines = np.column_stack([boundary, np.roll(boundary, -1)])
+    return points, triangles, lines
+
+
+def square_for_cells(cells):
+    """
+    Number of squares per side of the smallest unit square with at least cells triangles.
+    """
+    return max(1, int(np.ceil(np.sqrt(cells / 2))))
+
+
+def refine(points, triangles, lines):
+    """
+    Uniform 1-to-4 refinement: every triangle is cut into four by the midpoints of its edges,
+    and every line into two. Triangles keep their orientation, and the four children of
+    triangle i are triangles 4i to 4i + 3.
+    Args:
+        points (array): (P, 3) point coordinates.
+        triangles (array): (N, 3) point indices of every triangle.
+        lines (array): (L, 2) point indices of every line.
+    Returns:
+        tuple: (points, triangles, lines) of the refined mesh, the old points come first.
+    """
+    triangles = np.asarray(triangles, dtype=np.int64)
+    lines = np.asarray(lines, dtype=np.int64).reshape(-1, 2)
+    n_points = len(points)
+    # Edge k of a triangle goes from vertex k to vertex (k + 1) % 3, like in 'topology.edge_keys'
+    starts = np.concatenate([triangles.ravel(), lines[:, 0]])
+    ends = np.concatenate([np.roll(triangles, -1, axis=1).ravel(), lines[:, 1]])
+    keys = np.minimum(starts, ends) * n_points + np.maximum(starts, ends)
+    edges, midpoint = np.unique(keys, return_inverse=True)
+    midpoint = midpoint.ravel() + n_points
+    new_points = np.concatenate([points, 0.5 * (points[edges // n_points] + points[edges % n_points])])
+
+    a, b, c = triangles.T
+    ab, bc, ca = midpoint[:3 * len(triangles)].reshape(-1, 3).T
+    new_triangles = np.stack([np.column_stack([a, ab, ca]), np.column_stack([ab, b, bc]),
+                              np.column_stack([ca, bc, c]), np.column_stack([ab, bc, ca])], axis=1).reshape(-1, 3)
+    mid = midpoint[3 * len(triangles):]
+    new_lines = np.stack([np.column_stack([lines[:, 0], mid]), np.column_stack([mid, lines[:, 1]])], axis=1).reshape(-1, 2)
+    return new_points, new_triangles, new_lines
+
+
+def refine_mesh(mesh, times=1):
+    """
+    Refines a loaded Mesh times times with 'refine'. The triangles are taken in the order of
+    the mesh file, whatever order the mesh keeps them in, so child 4i + k comes from cell id i.
+    Args:
+        mesh (Mesh): The mesh to refine.
+        times (int): Number of refinements, every one makes four times as many triangles.
+    Returns:
+        tuple: (points, triangles, lines) of the refined mesh.
+    """
+    points = np.asarray(mesh.get_points())
+    triangles = np.asarray(mesh.get_connectivity())[mesh.get_cell_positions()]
+    lines = np.asarray(mesh.get_line_connectivity())
+    for _ in range(times):
+        points, triangles, lines = refine(points, triangles, lines)
+    return points, triangles, lines
+
+
+def write_mesh(mshname, points, triangles, lines, binary=True, compile=False):
+    """
+    Writes a generated mesh as a Gmsh 4.1 file, see 'gmsh.write_gmsh41'.
+    Args:
+        mshname (str): The name of the mesh file to write.
+        points, triangles, lines: The mesh, see 'unit_square'.
+        binary (bool): Write the binary variant of the format, else ASCII.
+        compile (bool): Also load it once, so its compiled mesh is in .meshcache for the next runs.
+    """
+    write_gmsh41(mshname, points, triangles, lines, binary)
+    if compile:
+        Mesh(str(mshname))
+
+
+def main(argv=None):
+    """
+    Generates a mesh from the command line, for example
+    'python -m src.Simulation.meshgen --cells 1000000 -o square_1M.msh' or
+    'python -m src.Simulation.meshgen --refine bay.msh --times 2 -o bay_x16.msh'.
+    """
+    parser = argparse.ArgumentParser("Generate a mesh for benchmarks")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--cells", type=int, help="Unit square with at least this many triangles")
+    source.add_argument("--refine", help="Mesh file to refine")
+    parser.add_argument("--times", type=int, default=1, help="Number of 1-to-4 refinements of --refine")
+    parser.add_argument("-o", "--output", required=True, help="Mesh file to write")
+    parser.add_argument("--ascii", action="store_true", help="Write an ASCII file instead of a binary one")
+    parser.add_argument("--compile", action="store_true", help="Also write the compiled mesh to .meshcache")
+    args = parser.parse_args(argv)
+
+    if args.cells is not None:
+        points, triangles, lines = unit_square(square_for_cells(args.cells))
+    else:
+        points, triangles, lines = read_msh(args.refine)
+        for _ in range(args.times):
+            points, triangles, lines = refine(points, triangles, lines)
+    write_mesh(Path(args.output), points, triangles, lines, binary=not args.ascii, compile=args.compile)
+    print(f"Wrote {len(triangles)} triangles and {len(lines)} lines to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import logging
+import json
+import time
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Timers and counters of a run. A timer only reads the clock when its phase starts
+        and ends, so it can be put around every step without slowing the run down.
+        Attributes:
+            timers (dict): Seconds spent in every phase.
+            calls (dict): Number of times every phase was timed.
+            counters (dict): Counts like steps, flux evaluations and bytes written.
+            info (dict): Values that describe the run, like the number of cells.
+            profiler (PhaseProfiler): Profiler that runs during its phase, None to not profile, see 'profiling'.
+        """
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        self.info = {}
+        self.profiler = None
+        self._start = time.perf_counter()
+
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Adds the time spent in the with block to the timer of phase name.
+        The profiler runs in the block if it is for this phase.
+        """
+        profiler = self.profiler if self.profiler is not None and self.profiler.phase == name else None
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if profiler is not None:
+                profiler.disable()
+
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def throughput(self):
+        """
+        Rates worked out from the timers and counters, for the ones that are there.
+        Returns:
+            dict: steps_per_s, cell_steps_per_s, flux_evaluations_per_s and write_mb_per_s.
+        """
+        rates = {}
+        stepping = self.timers.get('step')
+        if stepping:
+            steps = self.counters.get('steps', 0)
+            rates['steps_per_s'] = steps / stepping
+            if 'cells' in self.info:
+                rates['cell_steps_per_s'] = self.info['cells'] * steps / stepping
+            rates['flux_evaluations_per_s'] = self.counters.get('flux_evaluations', 0) / stepping
+        writing = sum(self.timers.get(name, 0.0) for name in ('write_state', 'create_plot', 'create_animation'))
+        if writing and 'bytes_written' in self.counters:
+            rates['write_mb_per_s'] = self.counters['bytes_written'] / 2**20 / writing
+        return rates
+
+
+    def to_dict(self):
+        return {'wall_time': time.perf_counter() - self._start,
+                'info': self.info,
+                'phases': {name: {'seconds': seconds, 'calls': self.calls[name]} for name, seconds in self.timers.items()},
+                'counters': self.counters,
+                'throughput': self.throughput()}
+
+
+    def log(self):
+        """
+        Writes the timers, counters and rates to the log, the slowest phase first.
+        """
+        metrics = self.to_dict()
+        lines = [f"Metrics, {metrics['wall_time']:.3f} s in total:"]
+        for name, phase in sorted(metrics['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"\t{name}: {phase['seconds']:.3f} s in {phase['calls']} calls")
+        lines += [f"\t{name}: {value}" for name, value in metrics['counters'].items()]
+        lines += [f"\t{name}: {value:.3e}" for name, value in metrics['throughput'].items()]
+        logging.info("\n".join(lines))
+
+
+    def write(self, path):
+        """
+        Writes the metrics as JSON, see 'to_dict'.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
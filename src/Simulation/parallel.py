@@ -0,0 +1,252 @@
+from .engines import face_coefficients
+from .partition import load_or_partition
+from multiprocessing import shared_memory
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import logging
+import os
+import time
+import weakref
+
+
+class Subdomain:
+    def __init__(self, rank, parts, cells, upwind, coefficients):
+        """
+        The cells one worker owns, and the face data it needs to update them.
+        The faces keep their global order and the fluxes of every cell are summed
+        in that order, so the owned cells get exactly the values NumpyEngine gives.
+        Args:
+            rank (int): Index of the subdomain.
+            parts (array): (N,) subdomain of every cell.
+            cells, upwind, coefficients: Face data from 'engines.face_coefficients'.
+        Attributes:
+            owned (array): Cells the worker updates.
+            halo (array): Cells of other subdomains the owned cells take oil from, grouped by subdomain.
+            local_cells (array): The owned cells then the halo cells, read every step.
+            upwind (array): Upwind cell of every face touching an owned cell, as an index in local_cells.
+            entry_faces (array): Face of every flux into an owned cell, as an index in upwind.
+            entry_coefficients (array): Flux per unit of upwind oil of every such flux.
+            entry_targets (array): Owned cell every such flux goes into, as an index in owned.
+            _block_targets (array): entry_targets * M + member, to step M states at once.
+        """
+        self.rank = rank
+        owned_mask = parts == rank
+        self.owned = np.flatnonzero(owned_mask)
+
+        faces = np.flatnonzero(owned_mask[cells].any(axis=1))
+        face_upwind = upwind[faces]
+        halo = np.unique(face_upwind[~owned_mask[face_upwind]])
+        self.halo = halo[np.argsort(parts[halo], kind='stable')]
+        self.local_cells = np.concatenate([self.owned, self.halo])
+
+        local_index = np.full(len(parts), -1, dtype=np.int64)
+        local_index[self.local_cells] = np.arange(len(self.local_cells))
+        self.upwind = local_index[face_upwind]
+
+        targets = cells[faces].ravel()
+        keep = owned_mask[targets]
+        self.entry_faces = np.repeat(np.arange(len(faces)), 2)[keep]
+        self.entry_coefficients = coefficients[faces].ravel()[keep]
+        self.entry_targets = local_index[targets[keep]]
+        self._block_targets = None
+
+
+    def step(self, oil, new_oil):
+        """
+        Writes the owned cells of new_oil, one time step after oil.
+        M states are stepped at once, with one bincount over owned cell * M + member.
+        Args:
+            oil (array): (N,) oil amount in every cell before the step, or (N, M) for M states.
+            new_oil (array): Array of the same shape the owned cells are written to.
+        """
+        local_oil = oil[self.local_cells]
+        n_owned = len(self.owned)
+        if oil.ndim == 1:
+            flux = self.entry_coefficients * local_oil[self.upwind][self.entry_faces]
+            new_oil[self.owned] = local_oil[:n_owned] + np.bincount(self.entry_targets, weights=flux, minlength=n_owned)
+            return
+
+        n_members = oil.shape[1]
+        if self._block_targets is None or len(self._block_targets) != len(self.entry_targets) * n_members:
+            self._block_targets = (self.entry_targets[:, None] * n_members + np.arange(n_members)).ravel()
+        flux = self.entry_coefficients[:, None] * local_oil[self.upwind][self.entry_faces]
+        change = np.bincount(self._block_targets, weights=flux.ravel(), minlength=n_owned * n_members)
+        new_oil[self.owned] = local_oil[:n_owned] + change.reshape(n_owned, n_members)
+
+
+def _worker(subdomain, n_cells, barrier, connection):
+    """
+    Runs in a worker process. Waits for (first, n_steps, shm_name, n_members) commands and
+    advances the subdomain n_steps steps, in the (2, N, M) buffers of that shared memory,
+    reading buffer first % 2 and writing the other, swapping every step.
+    All workers meet at the barrier after every step, so the halo cells are up to date.
+    Sends back (stepping time, waiting time) or the exception, and stops on None.
+    """
+    shm = buffers = None
+    try:
+        while (command := connection.recv()) is not None:
+            first, n_steps, shm_name, n_members = command
+            if shm is None or shm.name != shm_name:
+                buffers = None
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            buffers = np.ndarray((2, n_cells, n_members), buffer=shm.buf)
+            stepping = waiting = 0.0
+            try:
+                for s in range(n_steps):
+                    start = time.perf_counter()
+                    subdomain.step(buffers[(first + s) % 2], buffers[(first + s + 1) % 2])
+                    stepped = time.perf_counter()
+                    barrier.wait()
+                    stepping += stepped - start
+                    waiting += time.perf_counter() - stepped
+            except Exception as e:
+                barrier.abort()  # the other workers stop waiting for this one
+                connection.send(e)
+                continue
+            connection.send((stepping, waiting))
+    finally:
+        del buffers
+        if shm is not None:
+            shm.close()
+
+
+def _shutdown(processes, connections, memory):
+    """
+    Stops the workers and frees the shared memory, memory is a list holding it.
+    """
+    for connection in connections:
+        try:
+            connection.send(None)
+        except OSError:  # the worker is already gone
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    memory[0].close()
+    memory[0].unlink()
+
+
+class ParallelEngine:
+    def __init__(self, mesh, velocity, dt, workers=None):
+        """
+        Steps with worker processes that each own a subdomain of the mesh.
+        The state is kept in shared memory, two buffers that the workers read from and
+        write to in turns. Each worker reads its own cells and its halo cells from the
+        other subdomains, and writes only its own cells.
+        Gives exactly the same oil as NumpyEngine.
+        Args:
+            mesh (Mesh): Mesh with neighbors and faces computed.
+            velocity (array): (N, 2) velocity at every cell midpoint.
+            dt (float): Time step.
+            workers (int): Number of worker processes, None for one per core.
+        Attributes:
+            subdomains (list): Subdomain of every worker.
+            timings (array): (workers, 2) seconds every worker has spent stepping and waiting for the others.
+        """
+        cells, upwind, coefficients = face_coefficients(mesh, velocity, dt)
+        self._n_cells = len(mesh)
+        workers = max(1, min(workers or os.cpu_count() or 1, self._n_cells))
+        parts = load_or_partition(mesh, workers).parts
+        self.subdomains = [Subdomain(rank, parts, cells, upwind, coefficients) for rank in range(workers)]
+        self.timings = np.zeros((workers, 2))
+
+        # In a list, so the finalizer frees it after it has grown for wider blocks, see '_buffers'
+        self._memory = [shared_memory.SharedMemory(create=True, size=max(1, 2 * self._n_cells * 8))]
+        # fork can hang once numba or BLAS have started threads in this process
+        context = multiprocessing.get_context('spawn')
+        self._barrier = context.Barrier(workers)  # kept alive for the workers that attach to it
+        self._connections = []
+        self._processes = []
+        for subdomain in self.subdomains:
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(subdomain, self._n_cells, self._barrier, worker_connection), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, self._processes, self._connections, self._memory)
+
+
+    def step(self, oil):
+        return self.advance(oil, 1)
+
+
+    def advance(self, oil, n_steps):
+        """
+        Computes the oil after n_steps time steps, the workers only wait for each other between steps.
+        Args:
+            oil (array): (N,) oil amount in every cell, or (N, M) for M states at once.
+            n_steps (int): Number of time steps.
+        Returns:
+            array: Oil amount after the steps, same shape as oil.
+        Raises:
+            RuntimeError: If a worker fails or has stopped.
+        """
+        if n_steps == 0:
+            return oil
+
+        n_members = 1 if oil.ndim == 1 else oil.shape[1]
+        buffers = self._buffers(n_members)
+        buffers[0] = oil.reshape(self._n_cells, n_members)
+        try:
+            for connection in self._connections:
+                connection.send((0, n_steps, self._memory[0].name, n_members))
+        except OSError as e:
+            raise RuntimeError(f"A worker of the parallel engine has stopped: {e}")
+
+        results = self._receive()
+        for rank, result in enumerate(results):
+            if isinstance(result, Exception):
+                raise RuntimeError(f"Worker {rank} of the parallel engine failed: {result!r}")
+        self.timings += results
+        return buffers[n_steps % 2].reshape(oil.shape).copy()
+
+
+    def _buffers(self, n_members):
+        """
+        The two (N, M) state buffers in shared memory. The shared memory is made again,
+        larger, the first time a block of more states comes, and the workers attach to it
+        with the next command.
+        """
+        size = 2 * self._n_cells * n_members * 8
+        if self._memory[0].size < size:
+            old = self._memory[0]
+            self._memory[0] = shared_memory.SharedMemory(create=True, size=size)
+            old.close()
+            old.unlink()
+        return np.ndarray((2, self._n_cells, n_members), buffer=self._memory[0].buf)
+
+
+    def _receive(self):
+        """
+        Waits for the answer of every worker, and stops waiting if a worker process dies.
+        Returns:
+            list: The answer of every worker, by rank.
+        """
+        ranks = {connection: rank for rank, connection in enumerate(self._connections)}
+        sentinels = {process.sentinel: rank for rank, process in enumerate(self._processes)}
+        results = [None] * len(ranks)
+        while ranks:
+            for ready in multiprocessing.connection.wait(list(ranks) + list(sentinels)):
+                if ready in sentinels:
+                    self._barrier.abort()  # the other workers stop waiting for it
+                    raise RuntimeError(f"Worker {sentinels[ready]} of the parallel engine has stopped")
+                results[ranks.pop(ready)] = ready.recv()
+        return results
+
+
+    def close(self):
+        """
+        Logs the time every worker spent stepping and waiting, and stops the workers.
+        """
+        if not self._finalizer.alive:
+            return
+        for subdomain, (stepping, waiting) in zip(self.subdomains, self.timings):
+            logging.info(f"Rank {subdomain.rank}: {len(subdomain.owned)} cells, {len(subdomain.halo)} halo cells, "
+                         f"stepping {stepping:.3f} s, waiting {waiting:.3f} s")
+        self._finalizer()
@@ -0,0 +1,209 @@
+import numpy as np
+import logging
+import shutil
+import os
+
+
+def recursive_coordinate_bisection(midpoints, n_parts):
+    """
+    Splits the cells into n_parts parts with about the same number of cells.
+    The cells are cut in two across the longest side of their bounding box, with as many
+    cells on each side as the parts that go there, and both halves are cut again until
+    there is one part left on every side.
+    Args:
+        midpoints (array): (N, 2) cell midpoints.
+        n_parts (int): Number of parts.
+    Returns:
+        array: (N,) part of every cell, from 0 to n_parts - 1.
+    """
+    parts = np.zeros(len(midpoints), dtype=np.int64)
+    stack = [(np.arange(len(midpoints)), 0, n_parts)]
+    while stack:
+        cells, first, count = stack.pop()
+        if count == 1:
+            parts[cells] = first
+            continue
+        points = midpoints[cells]
+        axis = np.argmax(np.ptp(points, axis=0)) if len(cells) else 0
+        order = cells[np.argsort(points[:, axis], kind='stable')]
+        left = count // 2
+        split = len(cells) * left // count
+        stack.append((order[:split], first, left))
+        stack.append((order[split:], first + left, count - left))
+    return parts
+
+
+def cut_faces(neighbors, parts):
+    """
+    Number of interior faces between cells of different parts.
+    """
+    cells, edges = np.nonzero(neighbors >= 0)
+    return int(np.sum(parts[cells] != parts[neighbors[cells, edges]])) // 2
+
+
+def refine_partition(neighbors, parts, n_parts, imbalance=0.03, passes=10):
+    """
+    Moves cells on the border of a part to the part of most of their neighbors,
+    when that cuts fewer faces and keeps every part within imbalance of the average size.
+    Stops after passes passes, or when a pass moves no cell.
+    Args:
+        neighbors (array): (N, 3) neighbor table of the mesh, -1 on the boundary.
+        parts (array): (N,) part of every cell, changed in place.
+        n_parts (int): Number of parts.
+        imbalance (float): How much bigger or smaller than the average a part may get.
+        passes (int): Largest number of passes over the border cells.
+    Returns:
+        array: parts
+    """
+    sizes = np.bincount(parts, minlength=n_parts)
+    average = len(parts) / n_parts
+    max_size = max(int(np.ceil((1 + imbalance) * average)), sizes.max())
+    min_size = min(int(np.floor((1 - imbalance) * average)), sizes.min())
+
+    for _ in range(passes):
+        neighbor_parts = np.where(neighbors >= 0, parts[neighbors], -1)
+        border = np.flatnonzero(((neighbor_parts != parts[:, None]) & (neighbors >= 0)).any(axis=1))
+        moved = 0
+        for cell in border.tolist():
+            own = parts[cell]
+            row = parts[neighbors[cell][neighbors[cell] >= 0]]
+            own_count = np.sum(row == own)
+            best, best_gain = own, 0
+            for part in np.unique(row[row != own]).tolist():
+                gain = np.sum(row == part) - own_count
+                if gain > best_gain and sizes[part] < max_size:
+                    best, best_gain = part, gain
+            if best != own and sizes[own] > min_size:
+                parts[cell] = best
+                sizes[own] -= 1
+                sizes[best] += 1
+                moved += 1
+        if moved == 0:
+            break
+    return parts
+
+
+def halo_cells(neighbors, parts, n_parts):
+    """
+    The cells of other parts next to every part, the cells a part reads
+    from the others when the flux can go either way over the faces.
+    Args:
+        neighbors (array): (N, 3) neighbor table of the mesh, -1 on the boundary.
+        parts (array): (N,) part of every cell.
+        n_parts (int): Number of parts.
+    Returns:
+        list: Sorted array of halo cells for every part.
+    """
+    cells, edges = np.nonzero(neighbors >= 0)
+    others = neighbors[cells, edges]
+    cut = parts[cells] != parts[others]
+    keys = np.unique(parts[cells[cut]] * len(parts) + others[cut])
+    part_of_key = keys // max(len(parts), 1)
+    return np.split(keys % max(len(parts), 1), np.searchsorted(part_of_key, np.arange(1, n_parts)))
+
+
+class Partition:
+    def __init__(self, parts, halos, owned=None):
+        """
+        A split of the mesh cells into parts, for stepping the parts side by side.
+        Args:
+            parts (array): (N,) part of every cell.
+            halos (list): Sorted array of halo cells for every part, see 'halo_cells'.
+            owned (list): Sorted array of the cells of every part, found from parts if not given.
+        Attributes:
+            n_parts (int): Number of parts.
+        """
+        self.parts = parts
+        self.halos = halos
+        self.n_parts = len(halos)
+        if owned is None:
+            cells = np.argsort(parts, kind='stable')
+            owned = np.split(cells, np.cumsum(np.bincount(parts, minlength=self.n_parts))[:-1])
+        self.owned = owned
+
+
+    @classmethod
+    def compute(cls, mesh, n_parts, refine=True):
+        """
+        Partitions a mesh with recursive coordinate bisection, and refines it to cut fewer faces.
+        Args:
+            mesh (Mesh): Mesh with neighbors computed.
+            n_parts (int): Number of parts.
+            refine (bool): Refine the bisection with 'refine_partition'.
+        Returns:
+            Partition: The partition.
+        """
+        neighbors = mesh.get_neighbor_table()
+        parts = recursive_coordinate_bisection(mesh.get_midpoints(), n_parts)
+        if refine:
+            refine_partition(neighbors, parts, n_parts)
+        return cls(parts, halo_cells(neighbors, parts, n_parts))
+
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory maps a stored partition, like a compiled mesh. The cells and halo of one
+        part are slices of the mapping, so reading them does not read the whole partition.
+        """
+        arrays = {name: np.asarray(np.load(path / f"{name}.npy", mmap_mode='r'))
+                  for name in ('parts', 'owned_cells', 'owned_starts', 'halo_cells', 'halo_starts')}
+        def split(cells, starts):
+            return [cells[start:stop] for start, stop in zip(starts[:-1], starts[1:])]
+        return cls(arrays['parts'], split(arrays['halo_cells'], arrays['halo_starts']),
+                   split(arrays['owned_cells'], arrays['owned_starts']))
+
+
+    def save(self, path):
+        """
+        Writes the partition as a folder of .npy files, the halos and the cells of the parts
+        as one array each with the start of every part in it. The files go to a temporary
+        folder that is renamed when it is complete, like 'Mesh._save_compiled'.
+        """
+        arrays = {'parts': self.parts}
+        for name, groups in (('owned', self.owned), ('halo', self.halos)):
+            starts = np.zeros(self.n_parts + 1, dtype=np.int64)
+            np.cumsum([len(group) for group in groups], out=starts[1:])
+            arrays[f"{name}_cells"] = np.concatenate(groups) if groups else np.empty(0, dtype=np.int64)
+            arrays[f"{name}_starts"] = starts
+
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            temporary.mkdir(parents=True, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(temporary / f"{name}.npy", array)
+            os.replace(temporary, path)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not path.is_dir():  # another run may have written it first
+                raise
+
+
+def load_or_partition(mesh, n_parts, refine=True):
+    """
+    Loads the partition of the mesh into n_parts parts from the mesh cache,
+    or computes it and stores it there for the next time.
+    The cache is '.meshcache' next to the mesh file, see 'mesh.cache_path'. The parts are
+    stored by row, so every ordering of the mesh has a partition of its own.
+    Args:
+        mesh (Mesh): Mesh with neighbors computed.
+        n_parts (int): Number of parts.
+        refine (bool): Refine the bisection, see 'Partition.compute'.
+    Returns:
+        Partition: The partition.
+    """
+    ordering = mesh.get_ordering() or 'unordered'
+    path = mesh.get_cache_path(f"part{n_parts}.{ordering}" if refine else f"part{n_parts}-rcb.{ordering}")
+    if path.is_dir():
+        partition = Partition.load(path)
+        if len(partition.parts) == len(mesh) and partition.n_parts == n_parts:
+            return partition
+
+    partition = Partition.compute(mesh, n_parts, refine)
+    logging.info(f"Partitioned {len(mesh)} cells into {n_parts} parts, "
+                 f"{cut_faces(mesh.get_neighbor_table(), partition.parts)} of {len(mesh.get_faces())} faces are cut")
+    try:
+        partition.save(path)
+    except OSError as e:
+        logging.warning(f"Could not store the partition in {path}: {e}")
+    return partition
@@ -0,0 +1,140 @@
+import threading
+import cProfile
+import json
+import time
+import sys
+
+# Phases that can be profiled: 'run' is the whole run, the others are the phases of 'metrics.Metrics'
+PROFILE_PHASES = ('run', 'mesh_load', 'compute_neighbors', 'engine_setup', 'step',
+                  'write_state', 'create_plot', 'create_animation', 'render_wait')
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.001):
+        """
+        Samples the call stack of one thread from a background thread, while it is enabled.
+        Unlike cProfile it does not slow the calls down, and it keeps the order of the samples,
+        which is what a flame graph over time needs.
+        Args:
+            interval (float): Seconds between samples.
+        Attributes:
+            frames (list): (function, file, line) of every function seen, index is its frame id.
+            samples (list): Stack of every sample as frame ids, outermost call first.
+                Samples in a row with the same stack are kept as one.
+            weights (list): Seconds of every sample.
+        """
+        self.interval = interval
+        self.frames = []
+        self.samples = []
+        self.weights = []
+        self._frame_ids = {}
+        self._thread = None
+
+
+    def enable(self):
+        """
+        Starts sampling the thread that calls it.
+        """
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._last = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+    def _frame_id(self, code):
+        key = (getattr(code, 'co_qualname', code.co_name), code.co_filename, code.co_firstlineno)
+        if key not in self._frame_ids:
+            self._frame_ids[key] = len(self.frames)
+            self.frames.append(key)
+        return self._frame_ids[key]
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            now = time.perf_counter()
+            if self.samples and self.samples[-1] == stack:
+                self.weights[-1] += now - self._last
+            else:
+                self.samples.append(stack)
+                self.weights.append(now - self._last)
+            self._last = now
+
+
+    def to_speedscope(self, name):
+        """
+        The samples in the speedscope file format, which speedscope.app shows as a flame graph.
+        Args:
+            name (str): Name of the profile.
+        Returns:
+            dict: The speedscope file, ready for json.dump.
+        """
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'OilSpillSimulation',
+            'shared': {'frames': [{'name': function, 'file': file, 'line': line} for function, file, line in self.frames]},
+            'profiles': [{'type': 'sampled', 'name': name, 'unit': 'seconds', 'startValue': 0,
+                          'endValue': sum(self.weights), 'samples': self.samples, 'weights': self.weights}],
+        }
+
+
+class PhaseProfiler:
+    def __init__(self, phase, interval=0.001):
+        """
+        Profiles one phase of a run with cProfile and with a 'SamplingProfiler' at the same time.
+        The phase can be entered many times, like 'step', and all of them go into one profile.
+        Args:
+            phase (str): The phase, one of PROFILE_PHASES.
+            interval (float): Seconds between samples of the sampling profiler.
+        Attributes:
+            enabled (bool): If the profilers are running.
+        Raises:
+            ValueError: If phase is not one of PROFILE_PHASES.
+        """
+        if phase not in PROFILE_PHASES:
+            raise ValueError(f"Unknown phase to profile: {phase}, use one of {', '.join(PROFILE_PHASES)}")
+        self.phase = phase
+        self.profile = cProfile.Profile()
+        self.sampler = SamplingProfiler(interval)
+        self.enabled = False
+
+
+    def enable(self):
+        self.sampler.enable()
+        self.profile.enable()
+        self.enabled = True
+
+
+    def disable(self):
+        self.profile.disable()
+        self.sampler.disable()
+        self.enabled = False
+
+
+    def write(self, outputdir):
+        """
+        Writes profile_{phase}.pstats, for pstats or snakeviz, and profile_{phase}.speedscope.json,
+        for speedscope.app, to the output directory.
+        Returns:
+            list: The paths written.
+        """
+        pstats_path = outputdir / f"profile_{self.phase}.pstats"
+        speedscope_path = outputdir / f"profile_{self.phase}.speedscope.json"
+        self.profile.dump_stats(pstats_path)
+        with open(speedscope_path, 'w') as f:
+            json.dump(self.sampler.to_speedscope(f"{self.phase} phase"), f)
+        return [pstats_path, speedscope_path]
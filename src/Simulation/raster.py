@@ -0,0 +1,173 @@
+import numpy as np
+
+# Most candidate pixels tested at once while rasterizing, bounds the memory of 'Rasterizer.__init__'
+CHUNK_PIXELS = 1 << 22
+BACKGROUND = (255, 255, 255, 255)
+
+
+def colormap_table(cmap, n_colors=256):
+    """
+    Looks up the colors of a matplotlib colormap once, as RGBA bytes.
+    Args:
+        cmap (Colormap): The colormap, like plt.cm.viridis.
+        n_colors (int): Number of colors in the table.
+    Returns:
+        array: (n_colors, 4) uint8 colors, from the value 0 to 1.
+    """
+    return cmap(np.linspace(0, 1, n_colors), bytes=True)
+
+
+def _as_words(colors):
+    """
+    RGBA bytes as one uint32 per color, in the byte order of the machine.
+    """
+    return np.ascontiguousarray(colors, dtype=np.uint8).reshape(-1, 4).view(np.uint32).reshape(-1)
+
+
+class Rasterizer:
+    def __init__(self, vertices, width, height, extent=None):
+        """
+        Works out which triangle covers every pixel of an image, once. After that a frame is
+        only an index into the colors of the triangles, see 'render', with no drawing at all.
+        The extent is fitted into the image with square pixels, centered, and a pixel belongs to
+        the triangle that holds its center. Pixels on an edge go to the triangle that comes last.
+        Args:
+            vertices (array): (N, 3, 2) corners of every triangle.
+            width (int): Width of the image in pixels.
+            height (int): Height of the image in pixels.
+            extent (tuple): (xmin, xmax, ymin, ymax) shown in the image, default the bounding box of the triangles.
+        Attributes:
+            pixel_cell (array): (height, width) index of the triangle of every pixel, N for the background.
+            overlay (array): Flat indices of the pixels drawn over every frame, see 'add_rectangle' and 'add_marker'.
+            overlay_colors (array): (len(overlay), 4) RGBA colors of those pixels.
+        Raises:
+            ValueError: If width or height is not positive.
+        """
+        if width < 1 or height < 1:
+            raise ValueError(f"Image size must be positive, got {width}x{height}")
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3, 2)
+        if extent is None:
+            extent = (vertices[..., 0].min(), vertices[..., 0].max(), vertices[..., 1].min(), vertices[..., 1].max())
+        xmin, xmax, ymin, ymax = extent
+        self.width = width
+        self.height = height
+        self.pixel_size = max((xmax - xmin) / width, (ymax - ymin) / height)
+        # Corner of the image, so the extent is in the middle
+        self.x0 = (xmin + xmax - width * self.pixel_size) / 2
+        self.y1 = (ymin + ymax + height * self.pixel_size) / 2
+        self.n_cells = len(vertices)
+        self.pixel_cell = self._rasterize(vertices)
+        self.overlay = np.empty(0, dtype=np.int64)
+        self.overlay_colors = np.empty((0, 4), dtype=np.uint8)
+
+
+    def to_pixels(self, x, y):
+        """
+        Returns:
+            tuple: Column and row of the points, as floats, a pixel center is at whole numbers.
+        """
+        return (np.asarray(x) - self.x0) / self.pixel_size - 0.5, (self.y1 - np.asarray(y)) / self.pixel_size - 0.5
+
+
+    def _rasterize(self, vertices):
+        """
+        Tests the pixel centers in the bounding box of every triangle against its three edges,
+        many triangles at once, in chunks of at most CHUNK_PIXELS candidate pixels.
+        """
+        pixel_cell = np.full(self.width * self.height, self.n_cells, dtype=np.int32)
+        cols, rows = self.to_pixels(vertices[..., 0], vertices[..., 1])
+        col_min = np.clip(np.ceil(cols.min(axis=1)), 0, self.width).astype(np.int64)
+        col_max = np.clip(np.floor(cols.max(axis=1)), -1, self.width - 1).astype(np.int64)
+        row_min = np.clip(np.ceil(rows.min(axis=1)), 0, self.height).astype(np.int64)
+        row_max = np.clip(np.floor(rows.max(axis=1)), -1, self.height - 1).astype(np.int64)
+        box_width = np.maximum(col_max - col_min + 1, 0)
+        counts = box_width * np.maximum(row_max - row_min + 1, 0)
+
+        # Twice the signed area, the edge tests are flipped for clockwise triangles
+        area = ((cols[:, 1] - cols[:, 0]) * (rows[:, 2] - rows[:, 0]) -
+                (rows[:, 1] - rows[:, 0]) * (cols[:, 2] - cols[:, 0]))
+        tolerance = 1e-9 * np.abs(area)
+        counts[area == 0] = 0
+
+        ends = np.cumsum(counts)
+        start = 0
+        while start < self.n_cells:
+            done = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, done + CHUNK_PIXELS, side='right')), start + 1)
+            chunk_counts = counts[start:stop]
+            cell = np.repeat(np.arange(start, stop), chunk_counts)
+            offset = np.arange(len(cell)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            col = col_min[cell] + offset % box_width[cell]
+            row = row_min[cell] + offset // box_width[cell]
+
+            inside = np.ones(len(cell), dtype=bool)
+            sign = np.sign(area[cell])
+            for k in range(3):
+                c0, r0 = cols[cell, k], rows[cell, k]
+                c1, r1 = cols[cell, (k + 1) % 3], rows[cell, (k + 1) % 3]
+                edge = (c1 - c0) * (row - r0) - (r1 - r0) * (col - c0)
+                inside &= edge * sign >= -tolerance[cell]
+            pixel_cell[row[inside] * self.width + col[inside]] = cell[inside]
+            start = stop
+        return pixel_cell.reshape(self.height, self.width)
+
+
+    def _add_overlay(self, cols, rows, color):
+        cols, rows = np.round(cols).astype(np.int64), np.round(rows).astype(np.int64)
+        keep = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        pixels = rows[keep] * self.width + cols[keep]
+        self.overlay = np.concatenate([self.overlay, pixels])
+        self.overlay_colors = np.concatenate([self.overlay_colors, np.tile(np.asarray(color, dtype=np.uint8), (len(pixels), 1))])
+
+
+    def add_rectangle(self, x, y, width, height, color):
+        """
+        Draws the outline of a rectangle over every frame.
+        Args:
+            x, y (float): Lower left corner.
+            width, height (float): Size of the rectangle.
+            color (tuple): RGBA bytes.
+        """
+        (c0, c1), (r1, r0) = self.to_pixels([x, x + width], [y, y + height])
+        c0, c1, r0, r1 = (int(round(value)) for value in (c0, c1, r0, r1))
+        cols = np.arange(c0, c1 + 1)
+        rows = np.arange(r0, r1 + 1)
+        self._add_overlay(np.concatenate([cols, cols, np.full(len(rows), c0), np.full(len(rows), c1)]),
+                          np.concatenate([np.full(len(cols), r0), np.full(len(cols), r1), rows, rows]), color)
+
+
+    def add_marker(self, x, y, color, size=4):
+        """
+        Draws a '+' over every frame.
+        Args:
+            x, y (float): Center of the marker.
+            color (tuple): RGBA bytes.
+            size (int): Pixels from the center to the end of each arm.
+        """
+        col, row = self.to_pixels(x, y)
+        arm = np.arange(-size, size + 1)
+        self._add_overlay(np.concatenate([col + arm, np.full(len(arm), col)]),
+                          np.concatenate([np.full(len(arm), row), row + arm]), color)
+
+
+    def render(self, values, table, background=BACKGROUND):
+        """
+        Colors every pixel by the value of its triangle. The values are turned into colors
+        per triangle, and the pixels take the color of their triangle in one index.
+        Values are clipped to 0 to 1, like the plots. The colors are moved as one uint32
+        per pixel, which is many times faster than indexing (N, 4) bytes.
+        Args:
+            values (array): (N,) value of every triangle.
+            table (array): (n_colors, 4) uint8 colors, see 'colormap_table'.
+            background (tuple): RGBA bytes of the pixels outside the triangles.
+        Returns:
+            array: (height, width, 4) uint8 RGBA pixels.
+        """
+        n_colors = len(table)
+        index = np.minimum((np.clip(values, 0, 1) * n_colors).astype(np.intp), n_colors - 1)
+        colors = np.empty(self.n_cells + 1, dtype=np.uint32)
+        np.take(_as_words(table), index, out=colors[:-1])
+        colors[-1] = _as_words(background)[0]
+        frame = np.take(colors, self.pixel_cell)
+        frame.reshape(-1)[self.overlay] = _as_words(self.overlay_colors)
+        return frame.view(np.uint8).reshape(self.height, self.width, 4)
@@ -0,0 +1,201 @@
+import numpy as np
+
+
+def edge_keys(connectivity):
+    """
+    Computes a hash key for every edge of every triangle.
+    An edge is the sorted vertex pair (lo, hi) and its key is lo * n_points + hi,
+    so two triangles share an edge exactly when they have a key in common.
+    Args:
+        connectivity (array): (N, 3) point indices of the triangles.
+    Returns:
+        array: (N, 3) int64 keys, column k is the edge from vertex k to vertex (k+1) % 3.
+    """
+    tri = np.asarray(connectivity, dtype=np.int64)
+    if tri.size == 0:
+        return np.empty((0, 3), dtype=np.int64)
+    n_points = int(tri.max()) + 1
+    start = tri
+    end = np.roll(tri, -1, axis=1)
+    return np.minimum(start, end) * n_points + np.maximum(start, end)
+
+
+def build_neighbor_table(connectivity):
+    """
+    Finds the neighbors of all triangles by hashing their edges once.
+    Every edge key is sorted a single time over the whole mesh, and equal keys
+    next to each other are the two triangles sharing that edge.
+    Args:
+        connectivity (array): (N, 3) point indices of the triangles.
+    Returns:
+        array: (N, 3) int table where column k is the neighbor across local edge k,
+            or -1 if edge k is on the boundary.
+    """
+    keys = edge_keys(connectivity).ravel()
+    neighbors = np.full(keys.shape, -1, dtype=np.int64)
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    shared = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+
+    first = order[shared]
+    second = order[shared + 1]
+    neighbors[first] = second // 3
+    neighbors[second] = first // 3
+    return neighbors.reshape(-1, 3)
+
+
+class FaceTable:
+    def __init__(self, neighbors, scaled_normals):
+        """
+        Lists every edge of the mesh once, so the edges between cells never
+        have to be searched for again while stepping.
+        Interior faces are ordered by left cell and then by local edge index.
+        Args:
+            neighbors (array): (N, 3) neighbor table from 'build_neighbor_table'.
+            scaled_normals (array): (N, 3, 2) outward scaled normals of the triangles.
+        Attributes:
+            cells (array): (F, 2) left and right cell of every interior face, left < right.
+            edges (array): (F, 2) local edge index of the face in the left and right cell.
+            normals (array): (F, 2) scaled normal of the face, pointing out of the left cell.
+            boundary (array): (B, 2) cell and local edge index of every boundary face.
+        """
+        cells, edges = np.nonzero(neighbors >= 0)
+        others = neighbors[cells, edges]
+        is_left = cells < others
+
+        left = cells[is_left]
+        right = others[is_left]
+        left_edges = edges[is_left]
+        right_edges = np.argmax(neighbors[right] == left[:, None], axis=1)
+
+        self.cells = np.stack([left, right], axis=1)
+        self.edges = np.stack([left_edges, right_edges], axis=1)
+        self.normals = scaled_normals[left, left_edges]
+        self.boundary = np.argwhere(neighbors < 0)
+
+
+    @classmethod
+    def from_arrays(cls, cells, edges, normals, boundary):
+        """
+        A face table from arrays computed before, for example in a compiled mesh.
+        """
+        faces = cls.__new__(cls)
+        faces.cells = cells
+        faces.edges = edges
+        faces.normals = normals
+        faces.boundary = boundary
+        return faces
+
+
+    def __len__(self):
+        return len(self.cells)
+
+
+def _bfs_levels(neighbors, degree, start, visited):
+    """
+    Breadth first search from start in Cuthill-McKee order: the new cells of every
+    cell are taken in order of increasing degree, in the order the cells were reached.
+    Marks the reached cells in visited.
+    Returns:
+        list: Array of cells for every level, in the order they were reached.
+    """
+    levels = [np.array([start])]
+    visited[start] = True
+    while True:
+        frontier = levels[-1]
+        candidates = neighbors[frontier]  # (F, 3), one row per cell of the frontier
+        parent = np.repeat(np.arange(len(frontier)), 3)
+        candidates = candidates.ravel()
+        keep = candidates >= 0
+        candidates, parent = candidates[keep], parent[keep]
+        candidates_order = np.lexsort((candidates, degree[candidates], parent))
+        candidates = candidates[candidates_order]
+        candidates = candidates[~visited[candidates]]
+        if len(candidates) == 0:
+            return levels
+        _, first = np.unique(candidates, return_index=True)
+        new = candidates[np.sort(first)]
+        visited[new] = True
+        levels.append(new)
+
+
+def reverse_cuthill_mckee(neighbors):
+    """
+    Orders the cells so that neighbors get numbers close to each other, which
+    keeps the cells a face reads close together in memory.
+    Each connected part of the mesh is numbered breadth first from a cell far out
+    on its edge, and the whole order is reversed.
+    Args:
+        neighbors (array): (N, 3) neighbor table from 'build_neighbor_table'.
+    Returns:
+        array: (N,) the old number of every cell in the new order.
+    """
+    n_cells = len(neighbors)
+    degree = np.sum(neighbors >= 0, axis=1)
+    visited = np.zeros(n_cells, dtype=bool)
+    order = []
+    for start in np.argsort(degree, kind='stable').tolist():
+        if visited[start]:
+            continue
+        # Start again from a cell of lowest degree in the last level, which is far out on the edge
+        last = _bfs_levels(neighbors, degree, start, visited.copy())[-1]
+        start = int(last[np.argmin(degree[last])])
+        order.extend(_bfs_levels(neighbors, degree, start, visited))
+    order = np.concatenate(order) if order else np.empty(0, dtype=np.int64)
+    return order[::-1].copy()
+
+
+def hilbert_order(midpoints, bits=16):
+    """
+    Orders the cells along a Hilbert curve through their midpoints. The curve
+    visits every part of the plane before it moves on, so cells close in the
+    order are close in space.
+    Args:
+        midpoints (array): (N, 2) cell midpoints.
+        bits (int): The midpoints are put on a grid of 2**bits by 2**bits.
+    Returns:
+        array: (N,) the old number of every cell in the new order.
+    """
+    if len(midpoints) == 0:
+        return np.empty(0, dtype=np.int64)
+    low = midpoints.min(axis=0)
+    size = max(np.ptp(midpoints, axis=0).max(), np.finfo(float).tiny)
+    n = 1 << bits
+    x, y = np.minimum(((midpoints - low) / size * n).astype(np.int64), n - 1).T
+
+    index = np.zeros(len(midpoints), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve inside it starts and ends at the right corners
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return np.argsort(index, kind='stable')
+
+
+CELL_ORDERINGS = ('rcm', 'hilbert')
+
+
+def cell_order(points, connectivity, ordering):
+    """
+    New order of the triangles of a mesh, see 'reverse_cuthill_mckee' and 'hilbert_order'.
+    Args:
+        points (array): (P, 2) or (P, 3) coordinates of the mesh points.
+        connectivity (array): (N, 3) point indices of the triangles.
+        ordering (str): 'rcm' or 'hilbert'.
+    Returns:
+        array: (N,) the old number of every triangle in the new order.
+    Raises:
+        ValueError: If the ordering is unknown.
+    """
+    if ordering == 'rcm':
+        return reverse_cuthill_mckee(build_neighbor_table(connectivity))
+    if ordering == 'hilbert':
+        return hilbert_order(np.mean(np.asarray(points)[:, :2][connectivity], axis=1))
+    raise ValueError(f"Unknown ordering '{ordering}', choose one of: {', '.join(CELL_ORDERINGS)}")
@@ -0,0 +1,46 @@
+import pytest
+import shutil
+import numpy as np
+from types import SimpleNamespace
+from pathlib import Path
+from src.Simulation.mesh import Mesh
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture(scope="session")
+def bay_msh(tmp_path_factory):
+    """The bay mesh in a folder of its own, so the compiled mesh and partitions are not cached next to bay.msh."""
+    path = tmp_path_factory.mktemp("mesh") / "bay.msh"
+    shutil.copy(ROOT / "bay.msh", path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def bay_mesh(bay_msh):
+    """The bay mesh with neighbors and faces computed."""
+    mesh = Mesh(bay_msh)
+    mesh.compute_neighbors()
+    return mesh
+
+
+@pytest.fixture(scope="session")
+def velocity(bay_mesh):
+    x, y = bay_mesh.get_midpoints().T
+    return np.stack([y - 0.2 * x, -x], axis=1)
+
+
+@pytest.fixture(scope="session")
+def bay_config(bay_msh):
+    """
+    Makes configs of runs on the bay mesh, a new one every call, like
+    bay_config(tEnd=0.05, nSteps=50, engine="sparse"). Any other setting can be given too, like ordering="rcm".
+    """
+    def make(tEnd=0.02, nSteps=20, engine="numpy", **settings):
+        config = SimpleNamespace(meshName=bay_msh, tStart=0.0, tEnd=tEnd, nSteps=nSteps,
+                                 borders=[[0.0, 0.45], [0.0, 0.2]], restartFile=None,
+                                 engine=engine, workers=None, ordering=None)
+        for key, value in settings.items():
+            setattr(config, key, value)
+        return config
+    return make
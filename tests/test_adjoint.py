@@ -0,0 +1,21 @@
+import pytest
+import numpy as np
+from src.Simulation.Simulator import simulator
+from src.Simulation.adjoint import exposure_maps
+
+
+@pytest.mark.parametrize("cell", [0, 31, 182, 1000])
+def test_exposure_matches_forward_release(bay_config, cell):
+    """Test that the adjoint map gives the fishing ground oil of a forward run with a unit release in the cell."""
+    sim = simulator(bay_config(tEnd=0.05, nSteps=50, engine="sparse"))
+    exposure = [values[cell] for _, values in exposure_maps(sim)]
+
+    sim.oil[:] = 0.0
+    sim.oil[cell] = 1.0 / sim.mesh.get_areas()[cell]
+    forward = []
+    for time in sim.get_times():
+        forward.append(sim.get_oil_in_fishing_grounds())
+        sim.step()
+
+    assert len(exposure) == len(forward)
+    assert np.allclose(exposure, forward, rtol=1e-10, atol=1e-15)
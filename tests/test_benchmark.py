@@ -0,0 +1,31 @@
+import pytest
+from benchmark import benchmark_mesh, compare, PHASES
+from src.Simulation.meshgen import unit_square, write_mesh
+
+
+def report(cells, **phases):
+    return {'results': [{'cells': cells, 'phases': dict(dict.fromkeys(PHASES), **phases)}]}
+
+
+def test_benchmark_mesh_times_every_phase(tmp_path):
+    """Test that a small mesh gets a time for every phase, and the plot is left out when it is too large."""
+    mshname = str(tmp_path / "square.msh")
+    write_mesh(mshname, *unit_square(4))
+
+    result = benchmark_mesh(mshname, n_steps=2, engine='numpy', plot_max_cells=100, frames=2, repeat=1)
+    assert result['cells'] == 32
+    assert all(result['phases'][phase] > 0 for phase in PHASES)
+    assert result['cell_steps_per_s'] == pytest.approx(32 / result['phases']['step'])
+    assert (tmp_path / "output.avi").exists()
+
+    result = benchmark_mesh(mshname, n_steps=2, engine='numpy', plot_max_cells=10, frames=2, repeat=1)
+    assert result['phases']['create_plot'] is None
+    assert result['phases']['create_animation'] is None
+
+
+def test_compare_flags_slower_phases():
+    baseline = report(1000, step=1.0, write_state=2.0, create_plot=None)
+    new = report(1000, step=1.3, write_state=2.1, create_plot=5.0)
+    assert compare(new, baseline, threshold=0.2) == [(1000, 'step', 1.0, 1.3)]
+    assert compare(new, baseline, threshold=0.5) == []
+    assert compare(report(2000, step=9.0), baseline) == []  # no baseline for this size
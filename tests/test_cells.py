@@ -1,5 +1,6 @@
 import pytest
 import numpy as np
+from src.Simulation.cells import Triangle, compute_triangle_geometry
 
 @pytest.mark.parametrize("points,expected_area", [
     (
@@ -102,4 +103,19 @@ def test_neighbor_computation(cell, neighbors, expected_indices):
     neighbor_indices = [
         idx for idx, neighbor in enumerate(neighbors)
         if len(set(cell) & set(neighbor)) == 2]
-    assert neighbor_indices == expected_indices
\ No newline at end of file
+    assert neighbor_indices == expected_indices
+
+
+def test_batch_geometry_matches_triangle():
+    """Test that the batched geometry gives exactly the same numbers as one Triangle at a time."""
+    rng = np.random.default_rng(0)
+    points = rng.random((40, 2))
+    connectivity = np.array([rng.choice(40, size=3, replace=False) for _ in range(100)])
+
+    midpoints, areas, scaled_normals = compute_triangle_geometry(points, connectivity)
+
+    for idx, point_indices in enumerate(connectivity):
+        triangle = Triangle(point_indices, idx, points[point_indices])
+        assert np.array_equal(midpoints[idx], triangle.midpoint)
+        assert areas[idx] == triangle.get_area()
+        assert np.array_equal(scaled_normals[idx], np.array(triangle.get_scaled_normals()))
\ No newline at end of file
@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+from src.Simulation.Simulator import simulator
+from src.Simulation.mesh import Mesh
+from src.Simulation.partition import load_or_partition
+from src.Simulation.distributed import rank_domain
+
+
+@pytest.fixture(scope="module")
+def config(bay_config):
+    return bay_config()
+
+
+@pytest.fixture(scope="module")
+def sim(config):
+    return simulator(config)
+
+
+def test_rank_domains_match_the_whole_mesh(sim, config):
+    """Test that the ranks own every cell once, send exactly the halo cells the others receive,
+    and together step exactly like the numpy engine."""
+    n_ranks = 4
+    mesh = Mesh(config.meshName)  # memory mapped, the simulator wrote the compiled mesh
+    partition = load_or_partition(sim.mesh, n_ranks)
+    domains = [rank_domain(mesh, partition, rank, config, sim.dt) for rank in range(n_ranks)]
+    for rank, domain in enumerate(domains):
+        domain.find_sends([other.requests(n_ranks)[rank] for other in domains])
+    owned = np.sort(np.concatenate([domain.owned_rows for domain in domains]))
+    assert np.array_equal(owned, np.arange(len(sim.mesh)))
+
+    for rank, domain in enumerate(domains):
+        for owner, start, stop in domain.receives:
+            sent = dict(domains[owner].sends)[rank]
+            assert np.array_equal(domains[owner].owned_rows[sent], domain.halo_rows[start:stop])
+        assert np.array_equal(domain.oil, sim.oil[domain.owned_rows])
+        assert np.array_equal(domain.weights, sim.get_fishing_weights()[domain.owned_rows])
+
+    # Every rank steps with the halo taken from the oil of all ranks after the last step
+    oil = sim.oil.copy()
+    for _ in range(5):
+        new_oil = np.empty_like(oil)
+        for domain in domains:
+            local = oil[np.concatenate([domain.owned_rows, domain.halo_rows])]
+            new = local[:len(domain.owned_rows)].copy()
+            subdomain = domain.subdomain
+            flux = subdomain.entry_coefficients * local[subdomain.upwind[subdomain.entry_faces]]
+            new += np.bincount(subdomain.entry_targets, weights=flux, minlength=len(new))
+            new_oil[domain.owned_rows] = new
+        oil = new_oil
+    sim.advance(5)
+    assert np.array_equal(oil, sim.oil)
+
+
+def test_single_rank_matches_numpy_engine(config):
+    """Test that a run on one rank gives exactly the oil and fishing grounds of the numpy engine."""
+    MPI = pytest.importorskip("mpi4py.MPI")
+    from src.Simulation.distributed import DistributedSimulator
+
+    distributed = DistributedSimulator(config, MPI.COMM_SELF)
+    serial = simulator(config)
+    distributed.advance(7)
+    serial.advance(7)
+
+    state = distributed.get_state()
+    assert np.array_equal([state[i] for i in range(len(serial.oil))], serial.oil)
+    assert np.isclose(distributed.get_oil_in_fishing_grounds(), serial.get_oil_in_fishing_grounds(), rtol=1e-12)
+    assert distributed.current_time == serial.current_time
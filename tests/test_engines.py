@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+from src.Simulation import engines
+from src.Simulation.engines import CSRMatrix, NumpyEngine, SparseEngine, assemble_operator
+
+
+def test_csr_matches_dense():
+    """Test that CSRMatrix sums duplicates and multiplies like the dense matrix, also transposed."""
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, 8, 50)
+    cols = rng.integers(0, 5, 50)
+    values = rng.random(50)
+    dense = np.zeros((10, 5))
+    np.add.at(dense, (rows, cols), values)
+
+    matrix = CSRMatrix.from_coo(rows, cols, values, (10, 5))
+
+    x = rng.random(5)
+    block = rng.random((5, 3))
+    y = rng.random(10)
+    assert np.allclose(matrix @ x, dense @ x)
+    assert np.allclose(matrix @ block, dense @ block)
+    assert np.allclose(matrix.T @ y, dense.T @ y)
+    assert np.all((matrix @ x)[8:] == 0)  # empty rows
+
+
+@pytest.mark.parametrize("n_steps", [1, 10])
+def test_sparse_engine_matches_numpy_engine(bay_mesh, velocity, n_steps):
+    """Test that the assembled operator gives the same oil as the face-by-face engine."""
+    oil = np.exp(-np.sum((bay_mesh.get_midpoints() - [0.35, 0.45])**2, axis=1) / 0.01)
+    numpy_engine = NumpyEngine(bay_mesh, velocity, 0.001)
+    sparse_engine = SparseEngine(bay_mesh, velocity, 0.001)
+
+    assert np.allclose(sparse_engine.advance(oil, n_steps), numpy_engine.advance(oil, n_steps), rtol=1e-12, atol=1e-15)
+
+
+def test_operator_conserves_oil(bay_mesh, velocity):
+    """Test that every column of the operator keeps the area weighted oil, since the boundary is closed."""
+    areas = bay_mesh.get_areas()
+    operator = assemble_operator(bay_mesh, velocity, 0.001)
+    assert np.allclose(operator.T @ areas, areas, rtol=1e-12)
+
+
+def test_numba_engine_matches_numpy_engine(bay_mesh, velocity):
+    """Test that the compiled loops add up the fluxes in the same order as np.bincount."""
+    pytest.importorskip("numba")
+    from src.Simulation.engines import NumbaEngine
+    oil = np.exp(-np.sum((bay_mesh.get_midpoints() - [0.35, 0.45])**2, axis=1) / 0.01)
+
+    numba_engine = NumbaEngine(bay_mesh, velocity, 0.001)
+    numpy_engine = NumpyEngine(bay_mesh, velocity, 0.001)
+    assert np.array_equal(numba_engine.advance(oil, 10), numpy_engine.advance(oil, 10))
+
+
+def test_numba_engine_falls_back_without_numba(bay_mesh, velocity, monkeypatch):
+    """Test that asking for the numba engine without numba installed gives the numpy engine."""
+    monkeypatch.setattr(engines, "numba", None)
+    engine = engines.create_engine("numba", bay_mesh, velocity, 0.001)
+    assert type(engine) is NumpyEngine
@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+from pathlib import Path
+from src.Simulation.Simulator import simulator
+from src.Simulation.ensemble import Ensemble, EnsembleMember
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture(scope="module")
+def sim(bay_config):
+    return simulator(bay_config(engine="sparse"))
+
+
+def test_ensemble_member_matches_single_run(sim, bay_config):
+    """Test that the default source run as an ensemble member gives the same fishing grounds as the simulator."""
+    ensemble = Ensemble(sim, [EnsembleMember(source=(0.35, 0.45)), EnsembleMember(source=(0.2, 0.3))])
+    times, fishing_grounds = ensemble.run()
+
+    single = simulator(bay_config(engine="sparse"))
+    expected = []
+    while single.current_time <= single.config.tEnd:
+        expected.append(single.get_oil_in_fishing_grounds())
+        single.step()
+
+    assert fishing_grounds.shape == (len(times), 2)
+    assert np.allclose(fishing_grounds[:, 0], expected, rtol=1e-12)
+    assert not np.allclose(fishing_grounds[:, 1], expected)
+
+
+def test_ensemble_chunks_give_same_result(sim):
+    """Test that splitting the members into chunks of one does not change the result."""
+    members = [EnsembleMember(source=(x, 0.45)) for x in (0.3, 0.35, 0.4)]
+    members.append(EnsembleMember(restartFile=str(ROOT / "input" / "state_0.100.txt")))
+    together = Ensemble(sim, members)
+    one_by_one = Ensemble(sim, members, memoryBudgetMB=1e-6)
+
+    assert together.chunk_size() >= len(members)
+    assert one_by_one.chunk_size() == 1
+    assert np.allclose(together.run()[1], one_by_one.run()[1], rtol=1e-12)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "numba", "sparse"])
+def test_ensemble_block_step_matches_members_alone(bay_config, engine):
+    """Test that stepping the members as one (N, M) block gives every member exactly the oil it gets on its own."""
+    if engine == "numba":
+        pytest.importorskip("numba")
+    config = bay_config(engine=engine)
+    single = simulator(config)
+    members = [EnsembleMember(source=(x, 0.45)) for x in (0.3, 0.35, 0.4)]
+    members.append(EnsembleMember(restartFile=str(ROOT / "input" / "state_0.100.txt")))
+    block = np.column_stack([member.initial_state(single.mesh) for member in members])
+    alone = list(block.T)
+
+    step = single._get_engine().step
+    for _ in range(5):
+        block = step(block)
+        alone = [step(oil) for oil in alone]
+    assert np.array_equal(block, np.column_stack(alone))
+
+
+def test_ensemble_member_needs_one_initial_condition():
+    with pytest.raises(ValueError):
+        EnsembleMember()
+    with pytest.raises(ValueError):
+        EnsembleMember(source=(0.1, 0.1), restartFile="state.txt")
@@ -0,0 +1,108 @@
+import pytest
+import numpy as np
+import meshio
+from pathlib import Path
+from src.Simulation.gmsh import read_gmsh41, is_gmsh41
+from src.Simulation.mesh import read_msh
+
+ROOT = Path(__file__).parent.parent
+
+POINTS = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0], [0.5, 0.5, 0.0]])
+TAGS = np.array([7, 3, 12, 5, 9])  # node tags do not have to be ordered or contiguous
+TRIANGLES = np.array([[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]])
+LINES = np.array([[0, 1], [1, 2]])
+
+
+def write_gmsh41(path, binary):
+    """
+    Writes POINTS, TRIANGLES and LINES as a Gmsh 4.1 file with entities, point elements,
+    two triangle blocks, a comment section and parametric nodes, the way gmsh does.
+    """
+    size_t, tag_of = np.uint64, TAGS
+    with open(path, 'wb') as f:
+        def write(values, dtype):
+            values = np.asarray(values, dtype=dtype)
+            if binary:
+                values.tofile(f)
+            else:
+                f.write((' '.join(str(v) for v in values.tolist()) + '\n').encode())
+
+        f.write(f"$MeshFormat\n4.1 {int(binary)} 8\n".encode())
+        if binary:
+            np.array([1], dtype=np.int32).tofile(f)
+            f.write(b"\n")
+        f.write(b"$EndMeshFormat\n$Comments\nnot part of the mesh\n$EndComments\n$Entities\n")
+        write([1, 1, 1, 0], size_t)
+        write([1], np.int32); write([0, 0, 0], float); write([1], size_t); write([4], np.int32)
+        write([1], np.int32); write([0, 0, 0, 1, 0, 0], float); write([0], size_t); write([2], size_t); write([1, -1], np.int32)
+        write([1], np.int32); write([0, 0, 0, 1, 1, 0], float); write([0], size_t); write([1], size_t); write([1], np.int32)
+        f.write(b"\n$EndEntities\n$Nodes\n")
+        write([2, 5, 3, 12], size_t)
+        write([1, 1, 1], np.int32); write([2], size_t)  # parametric nodes on a curve, x y z u
+        write(tag_of[:2], size_t)
+        write(np.column_stack([POINTS[:2], [0.0, 1.0]]).ravel(), float)
+        write([2, 1, 0], np.int32); write([3], size_t)
+        write(tag_of[2:], size_t)
+        write(POINTS[2:].ravel(), float)
+        f.write(b"\n$EndNodes\n$Elements\n")
+        write([4, 8, 1, 8], size_t)
+        write([0, 1, 15], np.int32); write([1], size_t); write([1, tag_of[0]], size_t)
+        write([1, 1, 1], np.int32); write([2], size_t)
+        write(np.column_stack([[2, 3], tag_of[LINES]]).ravel(), size_t)
+        for block, first in ((TRIANGLES[:1], 4), (TRIANGLES[1:], 5)):
+            write([2, 1, 2], np.int32); write([len(block)], size_t)
+            write(np.column_stack([np.arange(first, first + len(block)), tag_of[block]]).ravel(), size_t)
+        f.write(b"\n$EndElements\n")
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_read_gmsh41(tmp_path, binary):
+    """Test that ASCII and binary files give the points in file order and the triangles and lines by point index."""
+    path = tmp_path / "square.msh"
+    write_gmsh41(path, binary)
+    assert is_gmsh41(path)
+    points, triangles, lines = read_gmsh41(path)
+    assert np.array_equal(points, POINTS)
+    assert np.array_equal(triangles, TRIANGLES)
+    assert np.array_equal(lines, LINES)
+
+
+def test_read_gmsh41_in_chunks(tmp_path, monkeypatch):
+    """Test that reading the blocks in small chunks gives the same arrays."""
+    path = tmp_path / "square.msh"
+    write_gmsh41(path, True)
+    monkeypatch.setattr("src.Simulation.gmsh.CHUNK_ROWS", 2)
+    points, triangles, lines = read_gmsh41(path)
+    assert np.array_equal(points, POINTS)
+    assert np.array_equal(triangles, TRIANGLES)
+    assert np.array_equal(lines, LINES)
+
+
+def test_read_gmsh41_matches_meshio():
+    """Test that bay.msh gives the same arrays as meshio."""
+    msh = meshio.read(ROOT / "bay.msh")
+    points, triangles, lines = read_gmsh41(ROOT / "bay.msh")
+    assert np.array_equal(points, msh.points)
+    assert np.array_equal(triangles, np.concatenate([c.data for c in msh.cells if c.type == 'triangle']))
+    assert np.array_equal(lines, np.concatenate([c.data for c in msh.cells if c.type == 'line']))
+
+
+def test_read_gmsh41_broken_file(tmp_path):
+    """Test that a cut off file raises a ValueError instead of giving part of the mesh."""
+    path = tmp_path / "square.msh"
+    write_gmsh41(path, True)
+    data = path.read_bytes()
+    path.write_bytes(data[:data.index(b"$Elements") + 60])
+    with pytest.raises(ValueError):
+        read_gmsh41(path)
+
+
+def test_read_msh_other_formats(tmp_path):
+    """Test that other formats than Gmsh 4.1 are still read with meshio."""
+    path = tmp_path / "square22.msh"
+    meshio.write(path, meshio.Mesh(POINTS, [("triangle", TRIANGLES)]), file_format="gmsh22", binary=False)
+    assert not is_gmsh41(path)
+    points, triangles, lines = read_msh(str(path))
+    assert np.array_equal(points, POINTS)
+    assert np.array_equal(triangles, TRIANGLES)
+    assert len(lines) == 0
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+from src.Simulation.Simulator import simulator
+from src.Simulation.greens import GreensLibrary, library_key, load_or_build
+
+
+SOURCES = [31, 182, 1000]
+RELEASES = {31: 2.0, 182: 0.5}
+
+
+@pytest.fixture(scope="module")
+def library(bay_config):
+    return GreensLibrary.build(simulator(bay_config(tEnd=0.04, nSteps=40, engine="sparse")), SOURCES, state_stride=10)
+
+
+@pytest.fixture(scope="module")
+def forward(bay_config):
+    """Fishing grounds and states of a forward run of the releases."""
+    sim = simulator(bay_config(tEnd=0.04, nSteps=40, engine="sparse"))
+    areas = sim.mesh.get_areas()
+    sim.oil[:] = 0.0
+    for cell, amount in RELEASES.items():
+        sim.oil[cell] = amount / areas[cell]
+    fishing, states = [], []
+    for _ in sim.get_times():
+        fishing.append(sim.get_oil_in_fishing_grounds())
+        states.append(sim.oil.copy())
+        sim.step()
+    return np.array(fishing), np.array(states)
+
+
+def test_query_matches_forward_run(library, forward):
+    """Test that the superposition of unit responses gives the fishing grounds of a simulation."""
+    times, fishing = library.query(RELEASES, tStart=0.1)
+    assert np.allclose(fishing, forward[0], rtol=1e-10, atol=1e-15)
+    assert np.isclose(times[0], 0.1)
+
+
+def test_query_states_matches_forward_run(library, forward):
+    """Test that the stored states, kept as float32, give the states of a simulation."""
+    times, states = library.query_states(RELEASES)
+    assert np.allclose(states, forward[1][library.state_steps], rtol=1e-5, atol=1e-6)
+
+
+def test_unknown_source(library):
+    with pytest.raises(KeyError):
+        library.query({5: 1.0})
+
+
+def test_load_or_build_invalidates(tmp_path, bay_config):
+    """Test that a saved library is reused, and rebuilt when dt changes."""
+    path = tmp_path / "greens.npz"
+    sim = simulator(bay_config(tEnd=0.04, nSteps=40, engine="sparse"))
+
+    _, built = load_or_build(path, sim, SOURCES)
+    assert built
+    library, built = load_or_build(path, sim, SOURCES)
+    assert not built
+    assert library.key == library_key(sim)
+
+    other_dt = simulator(bay_config(tEnd=0.04, nSteps=50, engine="sparse"))
+    assert library_key(other_dt) != library.key
+    _, built = load_or_build(path, other_dt, SOURCES)
+    assert built
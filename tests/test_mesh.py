@@ -1,6 +1,8 @@
 import pytest
+import shutil
 import numpy as np
-from src.Simulation.mesh import _CellFactory, Line, Triangle
+from pathlib import Path
+from src.Simulation.mesh import _CellFactory, Mesh, Line, Triangle
 
 @pytest.fixture
 def cell_factory():
@@ -53,3 +55,88 @@ def test_cellfactory_creation(cell_factory, sample_points, cell_type, point_indi
     cell = cell_factory(cell_type, point_indices, idx, points)
     assert isinstance(cell, expected_type)
     assert np.array_equal(cell.points, np.array(expected_points))
+
+
+
+def test_mesh_arrays_have_one_row_per_triangle(bay_mesh):
+    """
+    Test that the mesh arrays all describe the same triangles.
+    """
+    n = len(bay_mesh)
+    assert bay_mesh.get_connectivity().shape == (n, 3)
+    assert bay_mesh.get_midpoints().shape == (n, 2)
+    assert bay_mesh.get_areas().shape == (n,)
+    assert bay_mesh.get_scaled_normals().shape == (n, 3, 2)
+    assert bay_mesh.get_neighbor_table().shape == (n, 3)
+
+
+def test_triangle_view_reads_mesh_arrays(bay_mesh):
+    """
+    Test that a triangle view gives the same geometry as a Triangle built from its points,
+    and that oil written to the view ends up in the mesh array.
+    """
+    view = bay_mesh.get_triangles()[10]
+    triangle = Triangle(view.get_pointIDs(), view.idx, view.points)
+
+    assert isinstance(view, Triangle)
+    assert np.array_equal(view.midpoint, triangle.midpoint)
+    assert view.get_area() == triangle.get_area()
+    assert np.array_equal(view.get_scaled_normals(), np.array(triangle.get_scaled_normals()))
+    assert all(10 in bay_mesh.get_triangles()[n].get_neighbors() for n in view.get_neighbors())
+
+    view.oil_amount = 0.5
+    assert bay_mesh.get_oil_amounts()[10] == 0.5
+
+
+@pytest.mark.parametrize("ordering", ["rcm", "hilbert"])
+def test_reordered_mesh_keeps_cell_ids(bay_mesh, bay_msh, ordering):
+    """
+    Test that a reordered mesh holds the same cells, and that views and
+    neighbors still use the cell ids of the mesh file.
+    """
+    mesh = Mesh(bay_msh, ordering)
+    mesh.compute_neighbors()
+    ids = mesh.get_cell_ids()
+    assert not np.array_equal(ids, np.arange(len(mesh)))
+    assert np.array_equal(mesh.get_cell_positions()[ids], np.arange(len(mesh)))
+    assert np.array_equal(mesh.get_connectivity(), bay_mesh.get_connectivity()[ids])
+    assert np.array_equal(mesh.get_areas(), bay_mesh.get_areas()[ids])
+    assert len(mesh.get_faces()) == len(bay_mesh.get_faces())
+
+    view = mesh.get_triangles()[25]
+    assert view.idx == ids[25]
+    assert np.array_equal(view.midpoint, bay_mesh.get_midpoints()[view.idx])
+    assert view.get_neighbors() == bay_mesh.get_triangles()[view.idx].get_neighbors()
+
+
+def test_compiled_mesh_matches_mesh_file(tmp_path):
+    """
+    Test that the second load memory maps the compiled mesh written by the first,
+    with the same arrays as reading the file, and that a changed file is read again.
+    """
+    path = tmp_path / "bay.msh"
+    shutil.copy(Path(__file__).parent.parent / "bay.msh", path)
+    read = Mesh(str(path), compiled=False)
+    read.compute_neighbors()
+
+    Mesh(str(path), "rcm")
+    Mesh(str(path))
+    assert sorted(p.name.split(".", 1)[1] for p in (tmp_path / ".meshcache").iterdir()) == ["rcm.mesh1", "unordered.mesh1"]
+
+    compiled = Mesh(str(path))
+    assert isinstance(compiled.get_connectivity().base, np.memmap)  # a plain array on the mapped file
+    for getter in ("get_connectivity", "get_cell_ids", "get_midpoints", "get_areas",
+                   "get_scaled_normals", "get_neighbor_table"):
+        assert np.array_equal(getattr(compiled, getter)(), getattr(read, getter)())
+    assert np.array_equal(compiled.get_faces().cells, read.get_faces().cells)
+    assert np.array_equal(compiled.get_faces().normals, read.get_faces().normals)
+    assert len(compiled._lines) == len(read._lines)
+
+    cached = set((tmp_path / ".meshcache").iterdir())
+    with open(path, "a") as f:
+        f.write("\n")
+    changed = Mesh(str(path))
+    assert not isinstance(changed.get_connectivity().base, np.memmap)  # parsed again, not mapped
+    written = set((tmp_path / ".meshcache").iterdir()) - cached
+    assert [p.name.split(".", 1)[1] for p in written] == ["unordered.mesh1"]
+    assert np.array_equal(changed.get_connectivity(), read.get_connectivity())
@@ -0,0 +1,75 @@
+import pytest
+import shutil
+import numpy as np
+from pathlib import Path
+from src.Simulation.meshgen import unit_square, square_for_cells, refine, refine_mesh, write_mesh, main
+from src.Simulation.gmsh import read_gmsh41
+from src.Simulation.mesh import Mesh
+from src.Simulation.cells import compute_triangle_geometry
+from src.Simulation.topology import build_neighbor_table
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_unit_square():
+    """Test that the unit square has 2n^2 counterclockwise triangles covering it, and lines on its boundary."""
+    points, triangles, lines = unit_square(4)
+    _, areas, _ = compute_triangle_geometry(points, triangles)
+    signed = np.cross(points[triangles[:, 1]] - points[triangles[:, 0]], points[triangles[:, 2]] - points[triangles[:, 0]])[:, 2]
+    assert triangles.shape == (32, 3)
+    assert np.all(signed > 0)
+    assert np.isclose(areas.sum(), 1.0)
+    assert len(lines) == np.sum(build_neighbor_table(triangles) < 0) == 16
+    on_boundary = (points[lines][:, :, :2] == 0) | (points[lines][:, :, :2] == 1)
+    assert np.all(on_boundary.any(axis=2))
+
+
+def test_square_for_cells():
+    assert square_for_cells(1) == 1
+    assert 2 * square_for_cells(10_000) ** 2 >= 10_000
+    assert 2 * (square_for_cells(10_000) - 1) ** 2 < 10_000
+    with pytest.raises(ValueError):
+        unit_square(0)
+
+
+def test_refine():
+    """Test that refining quarters every triangle and halves every line."""
+    points, triangles, lines = unit_square(3)
+    new_points, new_triangles, new_lines = refine(points, triangles, lines)
+    _, areas, _ = compute_triangle_geometry(points, triangles)
+    _, new_areas, _ = compute_triangle_geometry(new_points, new_triangles)
+
+    assert np.array_equal(new_points[:len(points)], points)
+    assert np.array_equal(unit_square(6)[0][np.lexsort(unit_square(6)[0].T)], new_points[np.lexsort(new_points.T)])
+    assert np.allclose(new_areas, np.repeat(areas / 4, 4))
+    assert len(new_lines) == np.sum(build_neighbor_table(new_triangles) < 0) == 2 * len(lines)
+
+
+def test_refine_mesh_keeps_file_order():
+    """Test that a reordered mesh refines to the same triangles as the file order."""
+    mesh = Mesh(str(ROOT / "bay.msh"), compiled=False)
+    reordered = Mesh(str(ROOT / "bay.msh"), ordering='rcm', compiled=False)
+    refined = refine_mesh(mesh, times=2)
+    assert len(refined[1]) == 16 * len(mesh)
+    for expected, result in zip(refined, refine_mesh(reordered, times=2)):
+        assert np.array_equal(expected, result)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_write_mesh(tmp_path, binary):
+    """Test that a written mesh reads back the same and loads as a Mesh."""
+    points, triangles, lines = refine(*unit_square(5))
+    path = tmp_path / "square.msh"
+    write_mesh(path, points, triangles, lines, binary=binary, compile=True)
+    for expected, result in zip((points, triangles, lines), read_gmsh41(path)):
+        assert np.array_equal(expected, result)
+    assert (tmp_path / ".meshcache").is_dir()
+    mesh = Mesh(str(path))
+    assert len(mesh) == 200
+    assert np.isclose(mesh.get_areas().sum(), 1.0)
+
+
+def test_main_refines_a_mesh_file(tmp_path):
+    shutil.copy(ROOT / "bay.msh", tmp_path / "bay.msh")
+    main(["--refine", str(tmp_path / "bay.msh"), "--times", "1", "-o", str(tmp_path / "bay4.msh")])
+    assert len(Mesh(str(tmp_path / "bay4.msh"), compiled=False)) == 4 * len(Mesh(str(tmp_path / "bay.msh"), compiled=False))
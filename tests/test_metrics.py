@@ -0,0 +1,41 @@
+import pytest
+import json
+from src.Simulation.metrics import Metrics
+from src.Simulation.Simulator import simulator
+
+
+def test_phases_and_counters(tmp_path):
+    """Test that phases add up over calls, and that the rates and JSON come from them."""
+    metrics = Metrics()
+    metrics.info['cells'] = 10
+    for _ in range(3):
+        with metrics.phase('step'):
+            pass
+    metrics.count('steps', 4)
+    metrics.count('steps')
+    with pytest.raises(KeyError):
+        with metrics.phase('write_state'):
+            raise KeyError  # the time is kept when the phase fails
+
+    assert metrics.calls == {'step': 3, 'write_state': 1}
+    assert metrics.counters == {'steps': 5}
+    rates = metrics.throughput()
+    assert rates['cell_steps_per_s'] == pytest.approx(10 * rates['steps_per_s'])
+    assert rates['steps_per_s'] == pytest.approx(5 / metrics.timers['step'])
+
+    metrics.write(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json") as f:
+        written = json.load(f)
+    assert written['phases']['step']['calls'] == 3
+    assert written['counters'] == {'steps': 5}
+
+
+@pytest.mark.parametrize("engine,per_face", [("numpy", 1), ("reference", 2)])
+def test_simulator_counts_steps_and_fluxes(bay_config, engine, per_face):
+    sim = simulator(bay_config(tEnd=0.01, nSteps=10, engine=engine))
+    sim.step()
+    sim.advance(3)
+    n_faces = len(sim.mesh.get_faces().cells)
+    assert sim.metrics.counters == {'steps': 4, 'flux_evaluations': 4 * per_face * n_faces}
+    assert {'mesh_load', 'compute_neighbors', 'initial_state', 'step'} <= set(sim.metrics.timers)
+    assert sim.metrics.info['cells'] == len(sim.mesh)
@@ -0,0 +1,33 @@
+import pytest
+import logging
+import numpy as np
+from src.Simulation.engines import NumpyEngine
+from src.Simulation.parallel import ParallelEngine
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_matches_serial(bay_mesh, velocity, workers):
+    """Test that the parallel engine gives exactly the oil of the numpy engine."""
+    oil = np.exp(-np.sum((bay_mesh.get_midpoints() - [0.35, 0.45])**2, axis=1) / 0.01)
+    serial = NumpyEngine(bay_mesh, velocity, 1e-3)
+    engine = ParallelEngine(bay_mesh, velocity, 1e-3, workers)
+    try:
+        owned = np.sort(np.concatenate([subdomain.owned for subdomain in engine.subdomains]))
+        assert np.array_equal(owned, np.arange(len(bay_mesh)))
+
+        assert np.array_equal(engine.step(oil), serial.step(oil))
+        assert np.array_equal(engine.advance(oil, 25), serial.advance(oil, 25))
+        block = np.column_stack([oil, oil[::-1]])
+        assert np.array_equal(engine.advance(block, 3), serial.advance(block, 3))
+    finally:
+        engine.close()
+
+
+def test_close_logs_rank_timings(bay_mesh, velocity, caplog):
+    """Test that closing the engine logs one line per rank and stops the workers."""
+    engine = ParallelEngine(bay_mesh, velocity, 1e-3, 2)
+    engine.advance(np.ones(len(bay_mesh)), 2)
+    with caplog.at_level(logging.INFO):
+        engine.close()
+    assert [record.message.split(":")[0] for record in caplog.records] == ["Rank 0", "Rank 1"]
+    assert not any(process.is_alive() for process in engine._processes)
@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from src.Simulation.mesh import Mesh
+from src.Simulation.partition import (Partition, cut_faces, halo_cells, load_or_partition,
+                                      recursive_coordinate_bisection, refine_partition)
+
+
+@pytest.mark.parametrize("n_parts", [1, 2, 5, 8])
+def test_bisection_sizes(bay_mesh, n_parts):
+    """Test that every part gets the same number of cells, give or take a few."""
+    sizes = np.bincount(recursive_coordinate_bisection(bay_mesh.get_midpoints(), n_parts), minlength=n_parts)
+    assert len(sizes) == n_parts
+    assert sizes.max() - sizes.min() <= 2
+
+
+def test_refinement_cuts_fewer_faces(bay_mesh):
+    """Test that refining does not cut more faces and keeps the parts balanced."""
+    neighbors = bay_mesh.get_neighbor_table()
+    parts = recursive_coordinate_bisection(bay_mesh.get_midpoints(), 6)
+    before = cut_faces(neighbors, parts)
+    refine_partition(neighbors, parts, 6, imbalance=0.03)
+    assert cut_faces(neighbors, parts) <= before
+    assert np.bincount(parts).max() <= np.ceil(1.03 * len(parts) / 6)
+
+
+def test_halo_cells(bay_mesh):
+    """Test the halos against a loop over all neighbor pairs."""
+    neighbors = bay_mesh.get_neighbor_table()
+    parts = recursive_coordinate_bisection(bay_mesh.get_midpoints(), 4)
+    expected = [set() for _ in range(4)]
+    for cell, row in enumerate(neighbors):
+        for neighbor in row[row >= 0]:
+            if parts[neighbor] != parts[cell]:
+                expected[parts[cell]].add(int(neighbor))
+
+    halos = halo_cells(neighbors, parts, 4)
+    assert [sorted(halo.tolist()) for halo in halos] == [sorted(cells) for cells in expected]
+
+
+def test_partition_cache(bay_mesh):
+    """Test that the partition is stored next to the mesh and loaded again."""
+    partition = load_or_partition(bay_mesh, 3)
+    path = bay_mesh.get_cache_path("part3.unordered")
+    assert path.is_dir()
+
+    loaded = Partition.load(path)
+    assert np.array_equal(loaded.parts, partition.parts)
+    assert all(np.array_equal(a, b) for a, b in zip(loaded.halos, partition.halos))
+    assert all(np.array_equal(cells, np.flatnonzero(partition.parts == part)) for part, cells in enumerate(loaded.owned))
+    assert np.array_equal(load_or_partition(bay_mesh, 3).parts, partition.parts)
+
+
+def test_partition_cache_per_ordering(bay_mesh):
+    """Test that a reordered mesh does not load the partition of the file order, which would cut most faces."""
+    unordered = load_or_partition(bay_mesh, 4)
+    ordered = Mesh(bay_mesh._mshname, ordering='rcm')
+    ordered.compute_neighbors()
+    partition = load_or_partition(ordered, 4)
+    neighbors = ordered.get_neighbor_table()
+    assert not np.array_equal(partition.parts, unordered.parts)
+    assert cut_faces(neighbors, partition.parts) == cut_faces(neighbors, Partition.compute(ordered, 4).parts)
+    assert cut_faces(neighbors, partition.parts) < len(ordered.get_faces()) // 10
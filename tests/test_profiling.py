@@ -0,0 +1,47 @@
+import pytest
+import json
+import time
+import pstats
+from src.Simulation.metrics import Metrics
+from src.Simulation.profiling import PhaseProfiler
+
+
+def busy_step(seconds=0.05):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_plot(seconds=0.05):
+    busy_step(seconds)
+
+
+def test_profiles_only_its_phase(tmp_path):
+    """Test that the profiler runs in every call of its phase, and not in the other phases."""
+    metrics = Metrics()
+    metrics.profiler = PhaseProfiler('step', interval=0.001)
+    for _ in range(2):
+        with metrics.phase('step'):
+            busy_step()
+        with metrics.phase('create_plot'):
+            busy_plot()
+    assert not metrics.profiler.enabled
+
+    pstats_path, speedscope_path = metrics.profiler.write(tmp_path)
+    functions = {function for _, _, function in pstats.Stats(str(pstats_path)).stats}
+    assert 'busy_step' in functions
+    assert 'busy_plot' not in functions
+
+    with open(speedscope_path) as f:
+        speedscope = json.load(f)
+    frames = [frame['name'] for frame in speedscope['shared']['frames']]
+    profile = speedscope['profiles'][0]
+    assert profile['type'] == 'sampled'
+    assert len(profile['samples']) == len(profile['weights'])
+    assert 'busy_step' in frames and 'busy_plot' not in frames
+    assert 0.05 < profile['endValue'] < metrics.timers['step'] + 0.01
+
+
+def test_unknown_phase():
+    with pytest.raises(ValueError):
+        PhaseProfiler('stepping')
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.tri as mtri
+from pathlib import Path
+from src.Simulation.mesh import Mesh
+from src.Simulation.raster import Rasterizer, colormap_table, BACKGROUND
+
+ROOT = Path(__file__).parent.parent
+
+
+def cross(a, b):
+    return a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+
+
+@pytest.fixture(scope="module")
+def bay():
+    mesh = Mesh(str(ROOT / "bay.msh"), compiled=False)
+    points = np.asarray(mesh.get_points())[:, :2]
+    connectivity = np.asarray(mesh.get_connectivity())
+    return points, connectivity
+
+
+def test_pixels_are_in_their_triangle(bay, monkeypatch):
+    """Test that pixels are mapped to the triangle matplotlib finds for their center, in small chunks too.
+    Centers on an edge may go to either side."""
+    points, connectivity = bay
+    monkeypatch.setattr("src.Simulation.raster.CHUNK_PIXELS", 1000)
+    rasterizer = Rasterizer(points[connectivity], 200, 150, (-0.1, 1.1, -0.1, 1.1))
+
+    cols, rows = np.meshgrid(np.arange(200), np.arange(150))
+    x = rasterizer.x0 + (cols + 0.5) * rasterizer.pixel_size
+    y = rasterizer.y1 - (rows + 0.5) * rasterizer.pixel_size
+    found = mtri.Triangulation(points[:, 0], points[:, 1], connectivity).get_trifinder()(x, y)
+    found[found < 0] = len(connectivity)
+    differ = rasterizer.pixel_cell != found
+    assert differ.sum() < 10
+
+    # Barycentric coordinates of the centers in the triangle matplotlib found, one of them is 0 on an edge
+    triangle = points[connectivity[found[differ]]]
+    center = np.stack([x[differ], y[differ]], axis=1)
+    area = cross(triangle[:, 1] - triangle[:, 0], triangle[:, 2] - triangle[:, 0])
+    barycentric = np.stack([cross(triangle[:, (k + 2) % 3] - triangle[:, (k + 1) % 3], center - triangle[:, (k + 1) % 3]) / area
+                            for k in range(3)], axis=1)
+    assert np.all(barycentric > -1e-9)
+    assert np.all(barycentric.min(axis=1) < 1e-9)
+
+
+def test_render_colors_and_overlay():
+    """Test that a pixel gets the colormap color of its triangle's value, clipped, with the overlay on top."""
+    square = np.array([[[0, 0], [1, 0], [1, 1]], [[0, 0], [1, 1], [0, 1]]], dtype=float)
+    rasterizer = Rasterizer(square, 20, 10)
+    table = colormap_table(plt.cm.viridis)
+    frame = rasterizer.render(np.array([0.0, 2.0]), table)
+    assert frame.shape == (10, 20, 4)
+    assert np.array_equal(frame[9, 9], table[0])  # lower right triangle
+    assert np.array_equal(frame[0, 5], table[-1])  # upper left triangle, clipped to 1
+    assert np.array_equal(frame[5, 0], BACKGROUND)  # the square is centered
+
+    rasterizer.add_marker(0.5, 0.5, (255, 0, 0, 255), size=1)
+    frame = rasterizer.render(np.array([0.0, 0.5]), table)
+    assert np.array_equal(frame[4, 10], [255, 0, 0, 255])
+    assert np.array_equal(frame[2, 6], table[128])
+    assert np.array_equal(rasterizer.render(np.array([0.0, 0.5]), table), frame)
+
+
+def test_bad_size():
+    with pytest.raises(ValueError):
+        Rasterizer(np.zeros((1, 3, 2)), 0, 10)
@@ -0,0 +1,92 @@
+import pytest
+import numpy as np
+from src.Simulation.topology import (edge_keys, build_neighbor_table, FaceTable, CELL_ORDERINGS,
+                                     cell_order, reverse_cuthill_mckee)
+
+
+def brute_force_neighbors(connectivity):
+    """Neighbor lists the way 'Cell.compute_neighbors' finds them, by comparing every pair of cells."""
+    return [
+        [j for j, other in enumerate(connectivity) if j != i and len(set(cell) & set(other)) == 2]
+        for i, cell in enumerate(connectivity)]
+
+
+@pytest.mark.parametrize("connectivity", [
+    [[0, 1, 2]],                                    # Single triangle
+    [[0, 1, 2], [1, 3, 2]],                         # Two triangles sharing an edge
+    [[0, 1, 2], [2, 1, 3], [3, 4, 2], [5, 6, 7]],   # Strip and a lonely triangle
+    [[0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]],   # Fan around a center point
+])
+def test_neighbor_table_matches_brute_force(connectivity):
+    """Test that the edge hash gives the same neighbors as the pairwise search."""
+    table = build_neighbor_table(np.array(connectivity))
+    neighbors = [sorted(n for n in row if n >= 0) for row in table]
+    assert neighbors == brute_force_neighbors(connectivity)
+
+
+def test_neighbor_table_local_edges():
+    """Test that column k of the table is the neighbor across edge (k, k+1)."""
+    connectivity = np.array([[0, 1, 2], [2, 1, 3]])
+    table = build_neighbor_table(connectivity)
+    assert table.tolist() == [[-1, 1, -1], [0, -1, -1]]
+
+
+def test_edge_keys_ignore_orientation():
+    """Test that the same edge gets the same key in both directions."""
+    keys = edge_keys(np.array([[0, 1, 2], [2, 1, 3]]))
+    assert keys[0, 1] == keys[1, 0]
+    assert len(set(keys.ravel())) == 5
+
+
+def test_face_table():
+    """Test that every interior edge is listed once with matching local edges, and the rest are boundary."""
+    connectivity = np.array([[0, 1, 2], [2, 1, 3], [3, 4, 2]])
+    neighbors = build_neighbor_table(connectivity)
+    scaled_normals = np.ones((3, 3, 2)) * np.arange(9).reshape(3, 3, 1)
+
+    faces = FaceTable(neighbors, scaled_normals)
+
+    assert faces.cells.tolist() == [[0, 1], [1, 2]]
+    for (left, right), (edge_left, edge_right) in zip(faces.cells, faces.edges):
+        assert neighbors[left, edge_left] == right
+        assert neighbors[right, edge_right] == left
+    assert np.array_equal(faces.normals, scaled_normals[faces.cells[:, 0], faces.edges[:, 0]])
+    assert len(faces.boundary) == 3 * len(connectivity) - 2 * len(faces)
+    assert all(neighbors[cell, edge] == -1 for cell, edge in faces.boundary)
+
+
+def neighbor_distance(neighbors, order):
+    """Mean distance in the new order between the two cells of every face."""
+    position = np.argsort(order)
+    cells, edges = np.nonzero(neighbors >= 0)
+    return np.mean(np.abs(position[cells] - position[neighbors[cells, edges]]))
+
+
+def test_cell_orders_keep_neighbors_close():
+    """Test that both orderings are permutations that bring neighbors closer than a shuffled order."""
+    n = 40
+    x, y = np.meshgrid(np.arange(n + 1), np.arange(n + 1))
+    points = np.column_stack([x.ravel(), y.ravel()]).astype(float)
+    corner = (np.arange(n)[:, None] * (n + 1) + np.arange(n)).ravel()
+    connectivity = np.concatenate([
+        np.column_stack([corner, corner + 1, corner + n + 2]),
+        np.column_stack([corner, corner + n + 2, corner + n + 1])])
+    connectivity = connectivity[np.random.default_rng(1).permutation(len(connectivity))]
+    neighbors = build_neighbor_table(connectivity)
+    shuffled = neighbor_distance(neighbors, np.arange(len(connectivity)))
+
+    for ordering in CELL_ORDERINGS:
+        order = cell_order(points, connectivity, ordering)
+        assert np.array_equal(np.sort(order), np.arange(len(connectivity)))
+        assert neighbor_distance(neighbors, order) < shuffled / 10
+
+
+def test_reverse_cuthill_mckee_covers_every_part():
+    """Test that cells in separate parts of the mesh are all numbered."""
+    neighbors = build_neighbor_table([[0, 1, 2], [2, 1, 3], [5, 6, 7], [3, 4, 2]])
+    assert sorted(reverse_cuthill_mckee(neighbors).tolist()) == [0, 1, 2, 3]
+
+
+def test_unknown_cell_order():
+    with pytest.raises(ValueError):
+        cell_order(np.zeros((3, 2)), np.array([[0, 1, 2]]), 'random')
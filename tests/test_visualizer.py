@@ -0,0 +1,108 @@
+import pytest
+import numpy as np
+from pathlib import Path
+from src.Simulation.mesh import Mesh
+from src.Simulation.Visualizer import Visualizer, VideoStream, RenderPool
+from src.Simulation.metrics import Metrics
+
+ROOT = Path(__file__).parent.parent
+
+
+class BayConfig:
+    borders = [[0.0, 0.45], [0.0, 0.2]]
+    renderer = 'matplotlib'
+    resolution = (640, 480)
+
+
+@pytest.fixture(scope="module")
+def bay_mesh():
+    return Mesh(str(ROOT / "bay.msh"), ordering='rcm', compiled=False)
+
+
+def test_cell_values_follow_the_triangles(bay_mesh):
+    """Test that the colors of the collection are the oil of each triangle, found by its cell id."""
+    vis = Visualizer(bay_mesh, BayConfig(), None)
+    oil = {idx: float(idx) for idx in range(len(bay_mesh))}
+    assert vis.vertices.shape == (len(bay_mesh), 3, 2)
+    assert np.array_equal(vis._cell_values(oil), bay_mesh.get_cell_ids())
+    assert np.array_equal(vis.vertices, [triangle.points for triangle in bay_mesh.get_triangles()])
+
+
+def test_create_plot_is_the_same_every_time(bay_mesh, tmp_path):
+    """Test that plots drawn over the kept background are the same as the first one."""
+    vis = Visualizer(bay_mesh, BayConfig(), tmp_path)
+    oil = dict(zip(bay_mesh.get_cell_ids().tolist(), np.linspace(0, 1, len(bay_mesh)).tolist()))
+    vis.create_plot(oil, 0.1, tmp_path / "first.png")
+    vis.create_plot(oil, 0.1, tmp_path / "second.png")
+    assert (tmp_path / "first.png").read_bytes() == (tmp_path / "second.png").read_bytes()
+
+
+def test_render_only_changes_the_dynamic_artists(bay_mesh):
+    """Test that a new state changes the triangles and title, and the colorbar stays, until the label changes."""
+    vis = Visualizer(bay_mesh, BayConfig(), None)
+    empty = dict.fromkeys(range(len(bay_mesh)), 0.0)
+    full = dict.fromkeys(range(len(bay_mesh)), 1.0)
+    first = vis.render(empty, 0.1).copy()
+    figure = vis._figure
+    second = vis.render(full, 0.2).copy()
+    assert vis._figure is figure
+    assert first.shape == second.shape == (480, 640, 4)
+
+    changed = np.any(first != second, axis=2)
+    colorbar = vis._figure.axes[1].get_window_extent()
+    rows = slice(int(first.shape[0] - colorbar.y1), int(first.shape[0] - colorbar.y0))
+    assert changed.sum() > 1000
+    assert not changed[rows, int(colorbar.x0) + 1:int(colorbar.x1) - 1].any()
+
+    vis.render(full, 0.2, label='Fraction')
+    assert vis._figure is not figure
+
+
+def test_streamed_video_is_the_same_as_from_images(bay_mesh, tmp_path):
+    """Test that a video of the rendered frames is the same file as one made from the saved plots."""
+    vis = Visualizer(bay_mesh, BayConfig(), tmp_path)
+    video = VideoStream(tmp_path / "streamed.avi", 10)
+    images = []
+    for i, time in enumerate([0.0, 0.1, 0.2]):
+        oil = dict.fromkeys(range(len(bay_mesh)), i / 2)
+        images.append(str(tmp_path / f"plot_{time:.3f}.png"))
+        video.write(vis.create_plot(oil, time, images[-1]))
+    video.close()
+    vis.create_animation(images, 10)
+    assert video.frames == 3
+    assert (tmp_path / "streamed.avi").read_bytes() == (tmp_path / "output.avi").read_bytes()
+
+
+def test_raster_renderer(bay_mesh):
+    """Test that raster frames have the size of the config, and are the same for the same state."""
+    config = BayConfig()
+    config.renderer, config.resolution = 'raster', (320, 200)
+    vis = Visualizer(bay_mesh, config, None)
+    oil = dict(zip(bay_mesh.get_cell_ids().tolist(), np.linspace(0, 1, len(bay_mesh)).tolist()))
+    first = vis.render(oil, 0.1).copy()
+    assert first.shape == (200, 320, 4) and first.dtype == np.uint8
+    assert np.array_equal(vis.render(oil, 0.2), first)
+    assert vis._figure is None
+
+
+def test_render_pool_saves_the_same_frames(bay_mesh, tmp_path):
+    """Test that frames plotted by the pool are the same images and video as plotted in order, with few frames waiting."""
+    vis = Visualizer(bay_mesh, BayConfig(), tmp_path)
+    states = [np.random.default_rng(i).random(len(bay_mesh)) for i in range(5)]
+    video = VideoStream(tmp_path / "in_order.avi", 10)
+    for i, oil in enumerate(states):
+        video.write(vis.create_plot(oil, i / 10, tmp_path / f"in_order_{i}.png"))
+    video.close()
+
+    metrics = Metrics()
+    pool = RenderPool(vis, 2, VideoStream(tmp_path / "pool.avi", 10), metrics)
+    for i, oil in enumerate(states):
+        pool.submit(oil, i / 10, tmp_path / f"pool_{i}.png")
+        assert len(pool._pending) <= pool.max_pending == 4
+    pool.close()
+    pool.video.close()
+
+    assert metrics.counters['files_written'] == 5
+    assert (tmp_path / "pool.avi").read_bytes() == (tmp_path / "in_order.avi").read_bytes()
+    for i in range(5):
+        assert (tmp_path / f"pool_{i}.png").read_bytes() == (tmp_path / f"in_order_{i}.png").read_bytes()